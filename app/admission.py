@@ -0,0 +1,208 @@
+# app/admission.py
+"""
+Control de admisión y backpressure para llamadas a LLM.
+
+- Límite de concurrencia por backend (p. ej. "openai"), compartido por todo el proceso
+  (sesiones de Streamlit, workers del servicio, batch en modo hilos).
+- Cola con prioridad: las solicitudes interactivas pasan antes que las de batch (FIFO dentro
+  de cada prioridad).
+- Métricas de tiempo en cola y rechazos por backend (`admission_snapshot`).
+- Rechazo rápido (`AdmissionRejected`) cuando la espera estimada o real supera el deadline de
+  la solicitud; los llamadores degradan a reportes deterministas.
+
+Configuración:
+  - ADMISSION_LIMITS        "openai=4,ollama=1" (por defecto 4 por backend)
+  - REQUEST_DEADLINE_S      deadline por defecto de una solicitud interactiva (por defecto 90)
+"""
+from __future__ import annotations
+
+import os
+import time
+import heapq
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+PRIORITIES = {"interactive": 0, "batch": 1}
+DEFAULT_LIMIT = 4
+DEFAULT_DEADLINE_S = float(os.getenv("REQUEST_DEADLINE_S", "90"))
+
+
+class AdmissionRejected(RuntimeError):
+    """La llamada no se admite: la espera en cola excedería el deadline de la solicitud."""
+
+
+def _parse_limits(raw: str) -> Dict[str, int]:
+    out: Dict[str, int] = {}
+    for part in (raw or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            try:
+                out[k.strip()] = max(1, int(v))
+            except ValueError:
+                pass
+    return out
+
+_LIMITS = _parse_limits(os.getenv("ADMISSION_LIMITS", ""))
+
+# -----------------------------
+# Contexto por solicitud
+# -----------------------------
+@dataclass
+class RequestContext:
+    priority: str = "interactive"
+    deadline: Optional[float] = None          # time.monotonic() absoluto
+    queue_ms: List[float] = field(default_factory=list)
+    rejected: List[str] = field(default_factory=list)
+
+    def remaining(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.monotonic()
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "priority": self.priority,
+            "llm_calls_admitted": len(self.queue_ms),
+            "queue_ms_total": round(sum(self.queue_ms), 1),
+            "queue_ms_max": round(max(self.queue_ms), 1) if self.queue_ms else 0.0,
+            "rejected": list(self.rejected),
+        }
+
+_ctx: ContextVar[Optional[RequestContext]] = ContextVar("admission_request", default=None)
+
+def current_request() -> Optional[RequestContext]:
+    return _ctx.get()
+
+@contextmanager
+def request_context(priority: str = "interactive", deadline_s: Optional[float] = None) -> Iterator[RequestContext]:
+    """Marca la prioridad y el deadline de la solicitud en curso (hilo/tarea actual)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Prioridad desconocida: {priority!r}")
+    if deadline_s is None and priority == "interactive":
+        deadline_s = DEFAULT_DEADLINE_S
+    rc = RequestContext(priority=priority,
+                        deadline=(time.monotonic() + deadline_s) if deadline_s else None)
+    token = _ctx.set(rc)
+    try:
+        yield rc
+    finally:
+        _ctx.reset(token)
+
+# -----------------------------
+# Controlador por backend
+# -----------------------------
+class _Waiter:
+    __slots__ = ("granted",)
+
+    def __init__(self):
+        self.granted = False
+
+
+class AdmissionController:
+    def __init__(self, backend: str, limit: int):
+        self.backend = backend
+        self.limit = limit
+        self._cond = threading.Condition()
+        self._active = 0
+        self._seq = 0
+        self._heap: List[tuple] = []          # (priority, seq, waiter)
+        self._avg_service_s = 5.0             # EWMA del tiempo de servicio (semilla conservadora)
+        self.metrics = {"admitted": 0, "rejected": 0, "queue_ms_total": 0.0, "queue_ms_max": 0.0}
+
+    def _estimated_wait(self, ahead: int) -> float:
+        if self._active < self.limit and ahead == 0:
+            return 0.0
+        return (ahead // self.limit + 1) * self._avg_service_s
+
+    def _reject(self, rc: Optional[RequestContext], why: str) -> AdmissionRejected:
+        self.metrics["rejected"] += 1
+        if rc is not None:
+            rc.rejected.append(self.backend)
+        return AdmissionRejected(f"{self.backend}: {why}")
+
+    def acquire(self, rc: Optional[RequestContext]) -> float:
+        """Bloquea hasta obtener un cupo. Devuelve ms en cola o lanza AdmissionRejected."""
+        prio = PRIORITIES.get(rc.priority if rc else "interactive", 0)
+        remaining = rc.remaining() if rc else None
+        t0 = time.monotonic()
+        with self._cond:
+            ahead = sum(1 for p, _, _ in self._heap if p <= prio)
+            if remaining is not None and self._estimated_wait(ahead) > remaining:
+                raise self._reject(rc, f"espera estimada {self._estimated_wait(ahead):.1f}s > deadline {remaining:.1f}s")
+            if self._active < self.limit and not self._heap:
+                self._active += 1
+            else:
+                w = _Waiter()
+                self._seq += 1
+                heapq.heappush(self._heap, (prio, self._seq, w))
+                while not w.granted:
+                    left = None if remaining is None else remaining - (time.monotonic() - t0)
+                    if left is not None and left <= 0:
+                        self._heap = [e for e in self._heap if e[2] is not w]
+                        heapq.heapify(self._heap)
+                        raise self._reject(rc, "deadline agotado en cola")
+                    self._cond.wait(timeout=left)
+            waited_ms = (time.monotonic() - t0) * 1000.0
+            self.metrics["admitted"] += 1
+            self.metrics["queue_ms_total"] += waited_ms
+            self.metrics["queue_ms_max"] = max(self.metrics["queue_ms_max"], waited_ms)
+        if rc is not None:
+            rc.queue_ms.append(waited_ms)
+        return waited_ms
+
+    def release(self, service_s: float) -> None:
+        with self._cond:
+            self._avg_service_s = 0.8 * self._avg_service_s + 0.2 * service_s
+            if self._heap:
+                _, _, w = heapq.heappop(self._heap)
+                w.granted = True                  # el cupo pasa directo al siguiente en cola
+                self._cond.notify_all()
+            else:
+                self._active -= 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            admitted = self.metrics["admitted"]
+            return {
+                "limit": self.limit,
+                "active": self._active,
+                "queued": len(self._heap),
+                "admitted": admitted,
+                "rejected": self.metrics["rejected"],
+                "queue_ms_avg": round(self.metrics["queue_ms_total"] / admitted, 1) if admitted else 0.0,
+                "queue_ms_max": round(self.metrics["queue_ms_max"], 1),
+                "avg_service_s": round(self._avg_service_s, 2),
+            }
+
+
+_CONTROLLERS: Dict[str, AdmissionController] = {}
+_CONTROLLERS_LOCK = threading.Lock()
+
+def get_controller(backend: str) -> AdmissionController:
+    with _CONTROLLERS_LOCK:
+        ctrl = _CONTROLLERS.get(backend)
+        if ctrl is None:
+            ctrl = _CONTROLLERS[backend] = AdmissionController(backend, _LIMITS.get(backend, DEFAULT_LIMIT))
+        return ctrl
+
+@contextmanager
+def admit(backend: str) -> Iterator[float]:
+    """
+    Envuelve una llamada a `backend`:
+        with admit("openai"):
+            llm.invoke(...)
+    Lanza AdmissionRejected si no cabe dentro del deadline de la solicitud actual.
+    """
+    ctrl = get_controller(backend)
+    waited_ms = ctrl.acquire(_ctx.get())
+    t0 = time.monotonic()
+    try:
+        yield waited_ms
+    finally:
+        ctrl.release(time.monotonic() - t0)
+
+def admission_snapshot() -> Dict[str, Any]:
+    with _CONTROLLERS_LOCK:
+        ctrls = list(_CONTROLLERS.values())
+    return {c.backend: c.snapshot() for c in ctrls}
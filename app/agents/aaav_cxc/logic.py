@@ -2,21 +2,23 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Tuple
 from dataclasses import dataclass
-from datetime import date
-from decimal import Decimal
+from datetime import date, datetime
 
 import re
-import pandas as pd
-from dateutil import parser as dateparser
 
 from ..base import BaseAgent
 from ...state import GlobalState
-from ...tools.calc_kpis import month_window
+from ...dates.period_resolver import TZ, parse_iso
 from ...tools.schema_validate import validate_with
+from ...tools.table import emit_table
 
 from app.database import SessionLocal
-from app.models import FacturaCXC, Entidad
+from app.models import Entidad
 from app.repo_finanzas_db import FinanzasRepoDB
+from app.ledger.items import cents_to_float, entity_label, entity_names, load_open_items
+from app.ledger import kernel as K
+from app.ledger.cache import open_ledger
+from app.ledger.aging_history import aging_as_of
 
 SCHEMA = "app/schemas/aaav_cxc_schema.json"
 
@@ -26,8 +28,8 @@ SCHEMA = "app/schemas/aaav_cxc_schema.json"
 @dataclass
 class PeriodWindow:
     text: str
-    start: pd.Timestamp
-    end: pd.Timestamp
+    start: datetime
+    end: datetime
 
 def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodWindow:
     """
@@ -38,29 +40,27 @@ def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodWindow
     """
     pr = payload.get("period_range") or getattr(state, "period", None)
     if isinstance(pr, dict) and pr.get("start") and pr.get("end"):
-        start = pd.Timestamp(dateparser.isoparse(pr["start"]))
-        end   = pd.Timestamp(dateparser.isoparse(pr["end"]))
+        start = parse_iso(pr["start"])
+        end   = parse_iso(pr["end"])
         text  = pr.get("text") or f"{start.year:04d}-{start.month:02d}"
         return PeriodWindow(text=text, start=start, end=end)
 
     p = payload.get("period") or getattr(state, "period_raw", None)
+    # Import tardío: pandas/dateutil solo cuando hay que derivar la ventana mensual
+    from ...tools.calc_kpis import month_window
     if isinstance(p, str) and len(p) == 7 and p[4] == "-":
         s, e, _ = month_window(p)
         return PeriodWindow(text=p, start=s, end=e)
 
     # Fallback: mes actual (TZ CR ya aplicada en calc_kpis si corresponde)
-    today = pd.Timestamp.today(tz="America/Costa_Rica")
+    today = datetime.now(TZ)
     ym = today.strftime("%Y-%m")
     s, e, _ = month_window(ym)
     return PeriodWindow(text=ym, start=s, end=e)
 
 # ---------------------------------------------------------------------
-# Helpers DB (CXC)
+# Helpers DB (CXC) — proyección compacta (app.ledger.items), sin instancias ORM por factura
 # ---------------------------------------------------------------------
-def _saldo_cxc(f: FacturaCXC) -> Decimal:
-    # saldo = monto - monto_pagado
-    return Decimal((f.monto or 0) - (f.monto_pagado or 0))
-
 def _aging_and_totals_db(ref_date: date) -> Tuple[Dict[str, float], float, float, int]:
     """
     Devuelve:
@@ -69,68 +69,28 @@ def _aging_and_totals_db(ref_date: date) -> Tuple[Dict[str, float], float, float
       - por_vencer (no vencido, incluye 'sin fecha')
       - open_count (número de facturas abiertas > 0)
     """
-    db = SessionLocal()
-    overdue = {
-        "0_30": Decimal("0"),
-        "31_60": Decimal("0"),
-        "61_90": Decimal("0"),
-        "90_plus": Decimal("0"),
-    }
-    current = Decimal("0")     # no vencido (<= 0 días)
-    no_due = Decimal("0")      # sin fecha_limite
-    open_count = 0
-    try:
-        for f in db.query(FacturaCXC):
-            saldo = _saldo_cxc(f)
-            if saldo <= 0:
-                continue
-            open_count += 1
-            # FECHA DE VENCIMIENTO EN TU TABLA: fecha_limite
-            if not f.fecha_limite:
-                no_due += saldo
-                continue
-            days = (ref_date - f.fecha_limite.date()).days
-            if days <= 0:
-                current += saldo
-            elif days <= 30:
-                overdue["0_30"] += saldo
-            elif days <= 60:
-                overdue["31_60"] += saldo
-            elif days <= 90:
-                overdue["61_90"] += saldo
-            else:
-                overdue["90_plus"] += saldo
-
-        total_por_cobrar = float(current + no_due + sum(overdue.values()))
-        por_vencer = float(current + no_due)
-        return ({k: float(v) for k, v in overdue.items()}, total_por_cobrar, por_vencer, open_count)
-    finally:
-        db.close()
+    # FECHA DE VENCIMIENTO EN TU TABLA: fecha_limite
+    agg = aging_as_of("cxc", ref_date)  # foto diaria si ref_date es pasado; si no, en vivo
+    overdue = agg["overdue"]
+    por_vencer = agg["current"] + agg["no_due"]
+    total_por_cobrar = por_vencer + sum(overdue.values())
+    return ({k: cents_to_float(v) for k, v in overdue.items()},
+            cents_to_float(total_por_cobrar), cents_to_float(por_vencer), agg["open_count"])
 
 def _list_top_overdue_db(limit_n: int, ref_date: date) -> List[Dict[str, Any]]:
     db = SessionLocal()
     try:
-        rows: List[Dict[str, Any]] = []
-        for f in db.query(FacturaCXC):
-            saldo = float(_saldo_cxc(f))
-            if saldo <= 0:
-                continue
-            days_over = 0
-            if f.fecha_limite:
-                days_over = max((ref_date - f.fecha_limite.date()).days, 0)
-            if days_over <= 0:
-                continue
-            cliente = f.cliente.nombre_legal if getattr(f, "cliente", None) else str(getattr(f, "id_entidad_cliente", ""))
-
-            rows.append({
-                "invoice_id": f.numero_factura,
-                "customer": cliente,
-                "due_date": f.fecha_limite.date() if f.fecha_limite else None,
-                "days_overdue": days_over,
-                "outstanding": saldo,
-            })
-        rows.sort(key=lambda r: (r["days_overdue"], r["outstanding"]), reverse=True)
-        return rows[: int(limit_n)]
+        ref_ord = ref_date.toordinal()
+        L = open_ledger("cxc", db=db)
+        top = [L.item(i) for i in K.top_overdue(L, ref_date, limit_n).tolist()]
+        names = entity_names((it.entity_id for it in top), db=db)
+        return [{
+            "invoice_id": it.number,
+            "customer": entity_label(names, it.entity_id),
+            "due_date": it.due_date,
+            "days_overdue": it.days_overdue(ref_ord),
+            "outstanding": it.outstanding,
+        } for it in top]
     finally:
         db.close()
 
@@ -146,27 +106,16 @@ def _customer_balance_db(name_or_id: str, ref_date: date):
             except Exception:
                 cust_id = None
 
-        total = 0.0
-        rows: List[Dict[str, Any]] = []
-        q = db.query(FacturaCXC)
-        if cust_id:
-            q = q.filter(FacturaCXC.id_entidad_cliente == cust_id)
-
-        for f in q:
-            saldo = float(_saldo_cxc(f))
-            if saldo <= 0:
-                continue
-            days_over = 0
-            if f.fecha_limite:
-                days_over = max((ref_date - f.fecha_limite.date()).days, 0)
-            rows.append({
-                "invoice_id": f.numero_factura,
-                "issue_date": f.fecha_emision.date() if f.fecha_emision else None,
-                "due_date": f.fecha_limite.date() if f.fecha_limite else None,
-                "days_overdue": days_over,
-                "outstanding": saldo,
-            })
-            total += saldo
+        ref_ord = ref_date.toordinal()
+        items = load_open_items("cxc", db=db, entity_id=cust_id or None)
+        rows: List[Dict[str, Any]] = [{
+            "invoice_id": it.number,
+            "issue_date": it.issue_date,
+            "due_date": it.due_date,
+            "days_overdue": it.days_overdue(ref_ord),
+            "outstanding": it.outstanding,
+        } for it in items]
+        total = cents_to_float(sum(it.outstanding_cents for it in items))
         return total, rows
     finally:
         db.close()
@@ -174,27 +123,24 @@ def _customer_balance_db(name_or_id: str, ref_date: date):
 def _list_open_db(ref_date: date) -> List[Dict[str, Any]]:
     db = SessionLocal()
     try:
+        ref_ord = ref_date.toordinal()
+        items = load_open_items("cxc", db=db)
+        names = entity_names((it.entity_id for it in items), db=db)
         rows: List[Dict[str, Any]] = []
-        for f in db.query(FacturaCXC):
-            saldo = float(_saldo_cxc(f))
-            if saldo <= 0:
-                continue
-            due = f.fecha_limite.date() if f.fecha_limite else None
-            days_over = max((ref_date - due).days, 0) if due else 0
+        for it in items:
+            days_over = it.days_overdue(ref_ord)
             status = "paid/zero"
-            if saldo > 0 and days_over == 0 and due and (due - ref_date).days >= 0:
+            if days_over == 0 and it.due_ordinal and it.due_ordinal >= ref_ord:
                 status = "open_on_time"
-            elif saldo > 0 and days_over > 0:
+            elif days_over > 0:
                 status = "overdue"
-            cliente = f.cliente.nombre_legal if getattr(f, "cliente", None) else str(getattr(f, "id_entidad_cliente", ""))
-
             rows.append({
-                "invoice_id": f.numero_factura,
-                "customer": cliente,
-                "due_date": due,
+                "invoice_id": it.number,
+                "customer": entity_label(names, it.entity_id),
+                "due_date": it.due_date,
                 "status": status,
                 "days_overdue": days_over,
-                "outstanding": saldo,
+                "outstanding": it.outstanding,
             })
         rows.sort(key=lambda r: (r["status"], -r["days_overdue"], -r["outstanding"]))
         return rows
@@ -250,9 +196,13 @@ class Agent(BaseAgent):
         # 2) KPI base DSO
         repo = FinanzasRepoDB()
         try:
-            kpi_dso = repo.dso(win.start.year, win.start.month)
+            kpi_dso = repo.dso_range(win.start, win.end)  # ventana completa (semana, trimestre, rango…)
         except Exception:
             kpi_dso = None
+        try:
+            issued_window = float(repo.sales_between(win.start, win.end))  # denominador del DSO (índice diario)
+        except Exception:
+            issued_window = None
 
         # 3) Aging SOLO vencido + totales (con open_count)
         try:
@@ -274,6 +224,7 @@ class Agent(BaseAgent):
             "por_vencer": float(por_vencer),
             "current": float(por_vencer),  # alias
             "open_invoices": int(open_count),
+            "ventas_credito_periodo": issued_window,
         }
 
         # 5) Validación (no bloqueante)
@@ -298,7 +249,7 @@ class Agent(BaseAgent):
                 "summary": "Top facturas por cobrar vencidas (más urgentes)",
                 "data": data_norm,
                 "dso": kpi_dso,
-                "result": {"action": action, "table": table},
+                "result": {"action": action, "table": emit_table(table)},
             }
 
         if action == "customer_balance":
@@ -311,7 +262,7 @@ class Agent(BaseAgent):
                 "summary": f"Saldo pendiente con el cliente '{cust}': {total:.2f}",
                 "data": data_norm,
                 "dso": kpi_dso,
-                "result": {"action": action, "total_outstanding": total, "table": table},
+                "result": {"action": action, "total_outstanding": total, "table": emit_table(table)},
             }
 
         if action == "list_open":
@@ -321,7 +272,7 @@ class Agent(BaseAgent):
                 "summary": "Cuentas por cobrar abiertas",
                 "data": data_norm,
                 "dso": kpi_dso,
-                "result": {"action": action, "table": table},
+                "result": {"action": action, "table": emit_table(table)},
             }
 
         if action == "list_overdue":
@@ -339,12 +290,6 @@ class Agent(BaseAgent):
 
             overdue.sort(key=lambda r: (r.get("days_overdue", 0), r.get("outstanding", 0.0)), reverse=True)
 
-            # Serializar fecha
-            for r in overdue:
-                d = r.get("due_date")
-                if hasattr(d, "isoformat"):
-                    r["due_date"] = d.isoformat()
-
             # Agrupado por cliente
             by_customer_map: Dict[str, Dict[str, Any]] = {}
             for r in overdue:
@@ -365,8 +310,8 @@ class Agent(BaseAgent):
                     "action": action,
                     "total_overdue": total_overdue,
                     "count_overdue": len(overdue),
-                    "by_customer": by_customer,
-                    "table": overdue
+                    "by_customer": emit_table(by_customer),
+                    "table": emit_table(overdue)
                 },
             }
 
@@ -2,21 +2,23 @@
 from __future__ import annotations
 from typing import Dict, Any, List, Optional, Tuple
 from dataclasses import dataclass
-from datetime import date
-from decimal import Decimal
+from datetime import date, datetime
 import re
 
-import pandas as pd
-from dateutil import parser as dateparser
-
 from ..base import BaseAgent
 from ...state import GlobalState
-from ...tools.calc_kpis import month_window  # fallback si sólo llega "YYYY-MM"
+from ...dates.period_resolver import TZ, parse_iso
 from ...tools.schema_validate import validate_with  # opcional (no bloquea)
+from ...tools.table import emit_table
 
 from app.database import SessionLocal
-from app.models import FacturaCXP, Entidad
+from app.models import Entidad
 from app.repo_finanzas_db import FinanzasRepoDB
+from app.ledger.items import cents_to_float, count_open_items, entity_label, entity_names, load_open_items
+from app.ledger import kernel as K
+from app.ledger.cache import open_ledger
+from app.ledger.due_calendar import open_calendar
+from app.ledger.aging_history import aging_as_of
 
 SCHEMA = "app/schemas/aaav_cxp_schema.json"
 
@@ -24,8 +26,8 @@ SCHEMA = "app/schemas/aaav_cxp_schema.json"
 @dataclass
 class PeriodWindow:
     text: str
-    start: pd.Timestamp
-    end: pd.Timestamp
+    start: datetime
+    end: datetime
 
 def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodWindow:
     """
@@ -36,18 +38,20 @@ def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodWindow
     """
     pr = payload.get("period_range") or getattr(state, "period", None)
     if isinstance(pr, dict) and pr.get("start") and pr.get("end"):
-        start = pd.Timestamp(dateparser.isoparse(pr["start"]))
-        end   = pd.Timestamp(dateparser.isoparse(pr["end"]))
+        start = parse_iso(pr["start"])
+        end   = parse_iso(pr["end"])
         text  = pr.get("text") or f"{start.year:04d}-{start.month:02d}"
         return PeriodWindow(text=text, start=start, end=end)
 
     p = payload.get("period") or getattr(state, "period_raw", None)
+    # Import tardío: pandas/dateutil solo cuando hay que derivar la ventana mensual
+    from ...tools.calc_kpis import month_window
     if isinstance(p, str) and len(p) == 7 and p[4] == "-":
         s, e, _ = month_window(p)
         return PeriodWindow(text=p, start=s, end=e)
 
     # Fallback: mes actual (forzado a America/Costa_Rica)
-    today = pd.Timestamp.today(tz="America/Costa_Rica")
+    today = datetime.now(TZ)
     ym = today.strftime("%Y-%m")
     s, e, _ = month_window(ym)
     return PeriodWindow(text=ym, start=s, end=e)
@@ -109,9 +113,7 @@ def analyze_user_request(question: str) -> Plan:
     return Plan(actions=actions, reasons=reasons)
 
 # ===================== Helpers DB CxP =====================
-def _saldo_cxp(f: FacturaCXP) -> Decimal:
-    return Decimal((f.monto or 0) - (f.monto_pagado or 0))
-
+# Proyección compacta (app.ledger.items): sin instancias ORM ni Decimal por factura
 def _aging_and_totals_db(ref_date: date) -> Tuple[Dict[str, float], float, float]:
     """
     Devuelve:
@@ -119,80 +121,44 @@ def _aging_and_totals_db(ref_date: date) -> Tuple[Dict[str, float], float, float
       - total_por_pagar (saldo abierto)
       - por_vencer (no vencido + sin fecha)
     """
-    db = SessionLocal()
-    overdue = {"0_30": Decimal("0"), "31_60": Decimal("0"), "61_90": Decimal("0"), "90_plus": Decimal("0")}
-    current = Decimal("0")
-    no_due_date = Decimal("0")
-    try:
-        for f in db.query(FacturaCXP):
-            saldo = _saldo_cxp(f)
-            if saldo <= 0:
-                continue
-            if not f.fecha_limite:
-                no_due_date += saldo
-                continue
-            days = (ref_date - f.fecha_limite.date()).days
-            if days <= 0:
-                current += saldo
-            elif days <= 30:
-                overdue["0_30"] += saldo
-            elif days <= 60:
-                overdue["31_60"] += saldo
-            elif days <= 90:
-                overdue["61_90"] += saldo
-            else:
-                overdue["90_plus"] += saldo
-
-        total_por_pagar = float(current + no_due_date + sum(overdue.values()))
-        por_vencer = float(current + no_due_date)
-        return ({k: float(v) for k, v in overdue.items()}, total_por_pagar, por_vencer)
-    finally:
-        db.close()
+    agg = aging_as_of("cxp", ref_date)  # foto diaria si ref_date es pasado; si no, en vivo
+    overdue = agg["overdue"]
+    por_vencer = agg["current"] + agg["no_due"]
+    total_por_pagar = por_vencer + sum(overdue.values())
+    return ({k: cents_to_float(v) for k, v in overdue.items()},
+            cents_to_float(total_por_pagar), cents_to_float(por_vencer))
 
 def _list_top_overdue_db(limit_n: int, ref_date: date) -> List[Dict[str, Any]]:
     db = SessionLocal()
     try:
-        rows: List[Dict[str, Any]] = []
-        for f in db.query(FacturaCXP):
-            saldo = float(_saldo_cxp(f))
-            if saldo <= 0:
-                continue
-            days_over = max((ref_date - f.fecha_limite.date()).days, 0) if f.fecha_limite else 0
-            if days_over <= 0:
-                continue
-            proveedor = f.proveedor.nombre_legal if f.proveedor else str(f.id_entidad_proveedor)
-            rows.append({
-                "invoice_id": f.numero_factura,
-                "supplier": proveedor,
-                "due_date": f.fecha_limite.date() if f.fecha_limite else None,
-                "days_overdue": days_over,
-                "outstanding": saldo,
-            })
-        rows.sort(key=lambda r: (r["days_overdue"], r["outstanding"]), reverse=True)
-        return rows[: int(limit_n)]
+        ref_ord = ref_date.toordinal()
+        L = open_ledger("cxp", db=db)
+        top = [L.item(i) for i in K.top_overdue(L, ref_date, limit_n).tolist()]
+        names = entity_names((it.entity_id for it in top), db=db)
+        return [{
+            "invoice_id": it.number,
+            "supplier": entity_label(names, it.entity_id),
+            "due_date": it.due_date,
+            "days_overdue": it.days_overdue(ref_ord),
+            "outstanding": it.outstanding,
+        } for it in top]
     finally:
         db.close()
 
 def _list_due_soon_db(max_days: int, ref_date: date) -> List[Dict[str, Any]]:
     db = SessionLocal()
     try:
-        rows: List[Dict[str, Any]] = []
-        for f in db.query(FacturaCXP):
-            saldo = float(_saldo_cxp(f))
-            if saldo <= 0 or not f.fecha_limite:
-                continue
-            days_to = (f.fecha_limite.date() - ref_date).days
-            if 0 <= days_to <= int(max_days):
-                proveedor = f.proveedor.nombre_legal if f.proveedor else str(f.id_entidad_proveedor)
-                rows.append({
-                    "invoice_id": f.numero_factura,
-                    "supplier": proveedor,
-                    "due_date": f.fecha_limite.date(),
-                    "days_to_due": days_to,
-                    "outstanding": saldo,
-                })
-        rows.sort(key=lambda r: (r["days_to_due"], -r["outstanding"]))
-        return rows
+        ref_ord = ref_date.toordinal()
+        L = open_ledger("cxp", db=db)
+        soon = [L.item(i) for i in K.due_soon(L, ref_date, max_days).tolist()]  # ya ordenadas
+        names = entity_names((it.entity_id for it in soon), db=db)
+        return [{
+            "invoice_id": it.number,
+            "supplier": entity_label(names, it.entity_id),
+            "due_date": it.due_date,
+            "days_to_due": it.due_ordinal - ref_ord,
+            "outstanding": it.outstanding,
+        } for it in soon]
     finally:
         db.close()
 
@@ -208,24 +174,15 @@ def _supplier_balance_db(name_or_id: str, ref_date: date):
             except Exception:
                 prov_id = None
 
-        total = 0.0
-        rows: List[Dict[str, Any]] = []
-        q = db.query(FacturaCXP)
-        if prov_id:
-            q = q.filter(FacturaCXP.id_entidad_proveedor == prov_id)
-
-        for f in q:
-            saldo = float(_saldo_cxp(f))
-            if saldo <= 0:
-                continue
-            days_over = max((ref_date - f.fecha_limite.date()).days, 0) if f.fecha_limite else 0
-            rows.append({
-                "invoice_id": f.numero_factura,
-                "due_date": f.fecha_limite.date() if f.fecha_limite else None,
-                "days_overdue": days_over,
-                "outstanding": saldo,
-            })
-            total += saldo
+        ref_ord = ref_date.toordinal()
+        items = load_open_items("cxp", db=db, entity_id=prov_id or None)
+        rows: List[Dict[str, Any]] = [{
+            "invoice_id": it.number,
+            "due_date": it.due_date,
+            "days_overdue": it.days_overdue(ref_ord),
+            "outstanding": it.outstanding,
+        } for it in items]
+        total = cents_to_float(sum(it.outstanding_cents for it in items))
         return total, rows
     finally:
         db.close()
@@ -233,22 +190,19 @@ def _supplier_balance_db(name_or_id: str, ref_date: date):
 def _list_open_db(ref_date: date) -> List[Dict[str, Any]]:
     db = SessionLocal()
     try:
+        ref_ord = ref_date.toordinal()
+        items = load_open_items("cxp", db=db)
+        names = entity_names((it.entity_id for it in items), db=db)
         rows: List[Dict[str, Any]] = []
-        for f in db.query(FacturaCXP):
-            saldo = float(_saldo_cxp(f))
-            if saldo <= 0:
-                continue
-            due = f.fecha_limite.date() if f.fecha_limite else None
-            days_over = max((ref_date - due).days, 0) if due else 0
-            status = "open_on_time" if days_over == 0 else "overdue"
-            proveedor = f.proveedor.nombre_legal if f.proveedor else str(f.id_entidad_proveedor)
+        for it in items:
+            days_over = it.days_overdue(ref_ord)
             rows.append({
-                "invoice_id": f.numero_factura,
-                "supplier": proveedor,
-                "due_date": due,
-                "status": status,
+                "invoice_id": it.number,
+                "supplier": entity_label(names, it.entity_id),
+                "due_date": it.due_date,
+                "status": "open_on_time" if days_over == 0 else "overdue",
                 "days_overdue": days_over,
-                "outstanding": saldo,
+                "outstanding": it.outstanding,
             })
         rows.sort(key=lambda r: (r["status"], -r["days_overdue"], -r["outstanding"]))
         return rows
@@ -260,15 +214,7 @@ def _count_open_db(ref_date: date) -> int:
     Conteo de facturas abiertas (saldo > 0) al ref_date.
     No distingue vencidas vs al día: sólo cuenta abiertas.
     """
-    db = SessionLocal()
-    try:
-        cnt = 0
-        for f in db.query(FacturaCXP):
-            if _saldo_cxp(f) > 0:
-                cnt += 1
-        return cnt
-    finally:
-        db.close()
+    return count_open_items("cxp")
 
 # ===================== Agente =====================
 class Agent(BaseAgent):
@@ -296,9 +242,13 @@ class Agent(BaseAgent):
         # 2) KPI base (DPO) + aging vencido y totales
         repo = FinanzasRepoDB()
         try:
-            kpi_dpo = repo.dpo(win.start.year, win.start.month)
+            kpi_dpo = repo.dpo_range(win.start, win.end)  # ventana completa (semana, trimestre, rango…)
         except Exception:
             kpi_dpo = None
+        try:
+            issued_window = float(repo.purchases_between(win.start, win.end))  # denominador del DPO (índice diario)
+        except Exception:
+            issued_window = None
 
         try:
             aging_overdue, total_por_pagar, por_vencer = _aging_and_totals_db(ref_date)
@@ -329,6 +279,7 @@ class Agent(BaseAgent):
             # nuevos campos derivados
             "overdue_total": overdue_total,
             "open_invoices": int(open_count),
+            "compras_credito_periodo": issued_window,
         }
 
         # 3) Validación (no bloqueante)
@@ -359,23 +310,26 @@ class Agent(BaseAgent):
                     {"bucket": "61_90", "amount": data_norm["aging"]["61_90"]},
                     {"bucket": "90_plus", "amount": data_norm["aging"]["90_plus"]},
                 ]
-                result_tables.append({"action": "aging_snapshot", "rows": snap})
+                result_tables.append({"action": "aging_snapshot", "rows": emit_table(snap)})
             elif name == "top_overdue":
                 rows = _list_top_overdue_db(int(p.get("n", 10)), ref_date)
-                result_tables.append({"action": "top_overdue", "rows": rows})
+                result_tables.append({"action": "top_overdue", "rows": emit_table(rows)})
             elif name == "due_soon":
-                rows = _list_due_soon_db(int(p.get("days", 7)), ref_date)
-                result_tables.append({"action": "due_soon", "rows": rows})
+                days = int(p.get("days", 7))
+                rows = _list_due_soon_db(days, ref_date)
+                total, count = open_calendar("cxp").due_within(ref_date, days)  # totales: búsqueda por rango
+                result_tables.append({"action": "due_soon", "days": days, "total_due": cents_to_float(total),
+                                      "count": count, "rows": emit_table(rows)})
             elif name == "supplier_balance":
                 supp = p.get("supplier")
                 if not supp:
                     result_tables.append({"action": "supplier_balance", "error": "Falta 'supplier' en params"})
                 else:
                     total, rows = _supplier_balance_db(supp, ref_date)
-                    result_tables.append({"action": "supplier_balance", "total_outstanding": total, "rows": rows})
+                    result_tables.append({"action": "supplier_balance", "total_outstanding": total, "rows": emit_table(rows)})
             elif name == "list_open":
                 rows = _list_open_db(ref_date)
-                result_tables.append({"action": "list_open", "rows": rows})
+                result_tables.append({"action": "list_open", "rows": emit_table(rows)})
             else:
                 result_tables.append({"action": name, "error": "Acción desconocida"})
 
@@ -1,13 +1,14 @@
 # app/agents/aav_contable/logic.py
 from __future__ import annotations
 
+import calendar
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
-import pandas as pd
-from dateutil import parser as dateparser
+from datetime import datetime
 
 from ..base import BaseAgent
 from ...state import GlobalState
+from ...dates.period_resolver import parse_iso
 
 # (Opcional) Si agregas esquemas más adelante
 # from ...tools.schema_validate import validate_with
@@ -17,8 +18,8 @@ from ...state import GlobalState
 @dataclass
 class PeriodResolved:
     text: str
-    start: pd.Timestamp | None
-    end: pd.Timestamp | None
+    start: datetime | None
+    end: datetime | None
 
 
 def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodResolved:
@@ -32,8 +33,8 @@ def _resolve_period(payload: Dict[str, Any], state: GlobalState) -> PeriodResolv
     pr = payload.get("period_range") or getattr(state, "period", None)
     if isinstance(pr, dict) and pr.get("start") and pr.get("end"):
         try:
-            start = pd.Timestamp(dateparser.isoparse(pr["start"]))
-            end   = pd.Timestamp(dateparser.isoparse(pr["end"]))
+            start = parse_iso(pr["start"])
+            end   = parse_iso(pr["end"])
         except Exception:
             start = end = None
         return PeriodResolved(
@@ -104,6 +105,20 @@ class Agent(BaseAgent):
             return self._safe_float(kpi[key])
         return None
 
+    def _closed_month_kpis(self, pr: PeriodResolved) -> Optional[Dict[str, Any]]:
+        """KPIs del rollup si el período es exactamente un mes calendario cerrado."""
+        if pr.start is None or pr.end is None or pr.start.day != 1:
+            return None
+        if (pr.start.year, pr.start.month) != (pr.end.year, pr.end.month):
+            return None
+        if pr.end.day != calendar.monthrange(pr.end.year, pr.end.month)[1]:
+            return None  # "del 1 al 10 de marzo" no es el mes completo
+        try:
+            from app.ledger.rollup import closed_month_kpis
+            return closed_month_kpis(pr.start.year, pr.start.month)
+        except Exception:
+            return None
+
     def _extract_totals(self, blob: Dict[str, Any]) -> Dict[str, Optional[float]]:
         """
         Lee totales normalizados si existen:
@@ -175,6 +190,12 @@ class Agent(BaseAgent):
         dpo = self._extract_kpi(cxp_in, "DPO") if cxp_in else None
         dio = self._extract_kpi(inv_in, "DIO") if inv_in else None
 
+        # Mes cerrado: lo que no trajeron los subagentes sale del rollup mensual (sin recalcular)
+        rolled = self._closed_month_kpis(pr) if (dso is None or dpo is None) else None
+        if rolled:
+            dso = dso if dso is not None else self._safe_float(rolled.get("dso"))
+            dpo = dpo if dpo is not None else self._safe_float(rolled.get("dpo"))
+
         # CCC: si hay DIO, fórmula completa; si no, simplificada
         ccc = None
         try:
@@ -4,7 +4,6 @@ from typing import Dict, Any, List, Optional, Tuple
 
 from ..base import BaseAgent
 from ...state import GlobalState
-from ...tools.calc_kpis import month_window
 
 
 class Agent(BaseAgent):
@@ -48,7 +47,8 @@ class Agent(BaseAgent):
     }
 
     def _period_end(self, period: str) -> str:
-        # month_window(period) -> (start_dt, end_dt, ref_date)
+        # month_window(period) -> (start_dt, end_dt, ref_date); pandas solo se carga aquí
+        from ...tools.calc_kpis import month_window
         _, end, _ = month_window(period)
         # end es datetime.date o datetime; lo devolvemos como YYYY-MM-DD
         return getattr(end, 'strftime', lambda fmt: str(end))("%Y-%m-%d")
@@ -5,12 +5,13 @@ from typing import Dict, Any, List, Optional, Tuple
 import re
 import json
 from datetime import datetime
-import pandas as pd
-from dateutil import parser as dateparser
 
 from ..base import BaseAgent
 from ...state import GlobalState
-from ...lc_llm import get_chat_model
+from ...dates.period_resolver import parse_iso
+from ...lc_llm import get_chat_model, LLM_BACKEND
+from ...admission import admit, AdmissionRejected
+from ...serialization import to_jsonable
 from ...tools.prompting import build_system_prompt
 from ...tools.fuzzy import fuzzify_dso, fuzzify_dpo, fuzzify_ccc, liquidity_risk
 from ...tools.causality import causal_hypotheses
@@ -33,38 +34,7 @@ class Agent(BaseAgent):
     # Helpers generales
     # -------------------------
     def _to_jsonable(self, obj: Any) -> Any:
-        if obj is None or isinstance(obj, (bool, int, float, str)):
-            return obj
-        if isinstance(obj, dict):
-            return {str(k): self._to_jsonable(v) for k, v in obj.items()}
-        if isinstance(obj, (list, tuple, set)):
-            return [self._to_jsonable(v) for v in obj]
-        # Objetos tipo fuzzy con atributos low/mid/high → dict
-        if all(hasattr(obj, a) for a in ("low", "mid", "high")):
-            try:
-                return {
-                    "low": float(getattr(obj, "low")),
-                    "mid": float(getattr(obj, "mid")),
-                    "high": float(getattr(obj, "high")),
-                }
-            except Exception:
-                pass
-        for attr in ("to_dict", "as_dict", "model_dump", "dict"):
-            if hasattr(obj, attr):
-                try:
-                    v = getattr(obj, attr)()
-                    return self._to_jsonable(v)
-                except Exception:
-                    pass
-        try:
-            return {str(k): self._to_jsonable(v) for k, v in obj.items()}  # type: ignore
-        except Exception:
-            pass
-        try:
-            return [self._to_jsonable(v) for v in obj]  # type: ignore
-        except Exception:
-            pass
-        return str(obj)
+        return to_jsonable(obj)
 
     def _coerce_float(self, value: Any) -> Optional[float]:
         try:
@@ -106,7 +76,7 @@ class Agent(BaseAgent):
             else:
                 # Derivar YYYY-MM de start si existe
                 try:
-                    start = dateparser.isoparse(period_in["start"])
+                    start = parse_iso(period_in["start"])
                     period_text = f"{start.year:04d}-{start.month:02d}"
                 except Exception:
                     period_text = ""
@@ -122,7 +92,7 @@ class Agent(BaseAgent):
             if isinstance(p, dict):
                 for key in ("start", "end"):
                     try:
-                        dt = dateparser.isoparse(p[key])
+                        dt = parse_iso(p[key])
                         return f"{dt.year:04d}-{dt.month:02d}"
                     except Exception:
                         pass
@@ -194,6 +164,32 @@ class Agent(BaseAgent):
                 ctx["balances"] = {str(k): self._coerce_float(v) for k, v in bal.items()}
         return ctx
 
+    def _extract_prev_kpis(self, prev_in: Any) -> Dict[str, Any]:
+        """prev_kpis del router → {etiqueta: {"period": texto, "DSO", "DPO", "CCC"}} (solo períodos con datos)."""
+        out: Dict[str, Any] = {}
+        if not isinstance(prev_in, dict):
+            return out
+        for label, blob in prev_in.items():
+            if not isinstance(blob, dict) or blob.get("error"):
+                continue
+            kpis = {k: self._coerce_float(blob.get(k)) for k in ("DSO", "DPO", "CCC")}
+            if all(v is None for v in kpis.values()):
+                continue
+            period = blob.get("period")
+            out[str(label)] = {"period": period.get("text") if isinstance(period, dict) else period, **kpis}
+        return out
+
+    def _comparison_lines(self, ctx: Dict[str, Any]) -> List[str]:
+        """Variaciones deterministas vs. cada período de context.prev_kpis (ej. 'DSO 48.0d vs 41.5d (anterior: 2025-07), +6.5d')."""
+        k = ctx.get("kpis", {})
+        lines = []
+        for prev in (ctx.get("prev_kpis") or {}).values():
+            for name in ("DSO", "DPO", "CCC"):
+                cur, old = k.get(name), prev.get(name)
+                if isinstance(cur, (int, float)) and isinstance(old, (int, float)):
+                    lines.append(f"{name} {cur:.1f}d vs {old:.1f}d ({prev.get('period')}), {cur - old:+.1f}d")
+        return lines
+
     def _build_fuzzy_signals(self, metrics: Dict[str, Optional[float]]) -> Dict[str, Any]:
         dso, dpo, ccc, cash = metrics.get("dso"), metrics.get("dpo"), metrics.get("ccc"), metrics.get("cash")
         out: Dict[str, Any] = {}
@@ -270,10 +266,13 @@ class Agent(BaseAgent):
             return None
 
         try:
-            resp = llm.invoke([
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ]).content
+            with admit(LLM_BACKEND):
+                resp = llm.invoke([
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ]).content
+        except AdmissionRejected:
+            raise  # el handler degrada a reporte determinista y lo deja en _meta
         except Exception:
             return None
         return _try_parse_any_json(_clean(resp))
@@ -297,6 +296,7 @@ class Agent(BaseAgent):
         if isinstance(ccc, (int, float)) and ccc > 20:
             hallazgos.append(f"CCC elevado (>20d): {ccc:.1f}d")
             reco.append("Calendario AR/AP semanal y control de gastos no esenciales (30d).")
+        hallazgos.extend(self._comparison_lines(ctx))  # solo si llegaron context.prev_kpis
         if not hallazgos:
             hallazgos.append("KPIs dentro de rangos razonables para el mes.")
             reco.append("Mantener disciplina de caja y seguimiento semanal de aging.")
@@ -402,6 +402,9 @@ class Agent(BaseAgent):
 
         # 2) Contexto data-grounded + fuzzy (solo como señal cualitativa)
         ctx = self._extract_context(trace)
+        ctx["prev_kpis"] = self._extract_prev_kpis(payload.get("prev_kpis"))
+        if not ctx["prev_kpis"]:
+            del ctx["prev_kpis"]  # sin períodos comparativos: el guardrail 3 prohíbe comparar
         fuzzy_signals = self._build_fuzzy_signals(metrics)
 
         # 3) Causalidad tradicional (reglas + aging)
@@ -426,6 +429,7 @@ class Agent(BaseAgent):
             "   • 'fuzzy_signals' son cualitativos (low/mid/high). NO los uses como KPI ni los conviertas a valores numéricos.\n"
             "3) Comparaciones intermensuales:\n"
             "   • PROHIBIDO afirmar 'mejor/peor', 'al alza/a la baja', o comparar con 'el mes anterior' si NO existe 'context.prev_kpis'.\n"
+            "   • Si existe 'context.prev_kpis', compara SOLO con esos valores y nombra el período de cada uno.\n"
             "4) DPO y CCC (semántica correcta):\n"
             "   • En este sistema: CCC = DSO − DPO. Un DPO alto, en aislamiento, TIENDE a mejorar (hacer más negativo) el CCC.\n"
             "   • El riesgo con CxP proviene de tener AP VENCIDO (aging_cxp > 0), NO del nivel de DPO por sí mismo.\n"
@@ -439,6 +443,8 @@ class Agent(BaseAgent):
         )
 
         period_text, _ = self._period_text_and_due(period_in)
+        prev_line = (f"KPIs de períodos comparativos (context.prev_kpis): {ctx['prev_kpis']}\n"
+                     if ctx.get("prev_kpis") else "")
 
         user_prompt = (
             f"{guardrails}\n"
@@ -448,7 +454,8 @@ class Agent(BaseAgent):
             f"KPIs: {ctx.get('kpis')}\n"
             f"Aging CxC: {ctx.get('aging_cxc')}\n"
             f"Aging CxP: {ctx.get('aging_cxp')}\n"
-            f"Balances: {ctx.get('balances')}\n\n"
+            f"Balances: {ctx.get('balances')}\n"
+            f"{prev_line}\n"
             f"Resumen de subagentes:\n{resumen}\n\n"
             "Devuelve EXACTAMENTE este JSON:\n"
             "{\n"
@@ -470,7 +477,11 @@ class Agent(BaseAgent):
             "}\n"
         )
 
-        report_json = self._llm_json(llm, system_prompt, user_prompt)
+        degraded: Optional[str] = None
+        try:
+            report_json = self._llm_json(llm, system_prompt, user_prompt)
+        except AdmissionRejected as e:
+            report_json, degraded = None, f"admission: {e}"
 
         # 6) Fallback si el LLM no devuelve JSON válido
         if not isinstance(report_json, dict):
@@ -485,7 +496,7 @@ class Agent(BaseAgent):
                 "fuzzy_signals": fuzzy_signals,
                 "causal_hypotheses": causal_traditional,
                 "causal_hypotheses_llm": [],
-                "_meta": {"structured": True, "llm_ok": False},
+                "_meta": {"structured": True, "llm_ok": False, "degraded": degraded},
             }
 
         # 7) Post-proceso: fuerza BSC.finanzas con KPIs reales + une causalidad + añade órdenes deterministas
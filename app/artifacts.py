@@ -0,0 +1,232 @@
+# app/artifacts.py
+"""
+Almacén de artefactos por solicitud: tablas grandes fuera del trace.
+
+Los subagentes devuelven detalle de documentos (`result.table` en CxC, `result.actions[*].rows`
+en CxP) que puede tener miles de filas. En vez de viajar en la respuesta, en el trace, en los
+exports y en los logs, cada tabla grande se guarda UNA vez aquí y el trace lleva una
+referencia compacta:
+
+    {"$artifact": "a3f…", "request_id": "…", "rows": 4210, "columns": [...],
+     "preview": [primeras filas], "totals": {"outstanding": 123.4, ...}}
+
+Los consumidores piden filas bajo demanda con `fetch_rows(ref, offset, limit)`. Lo que sale
+del proceso (exports, salida del batch) pasa antes por `persist_refs`: con el backend disco
+las referencias se conservan (los archivos sobreviven al proceso, el tamaño de la salida no
+crece con el libro); con el backend en memoria, que solo vive en este proceso y cuyo LRU
+expulsa solicitudes viejas, las filas vuelven inline (`resolve_refs`). El servicio HTTP
+expone `GET /artifacts/<request_id>/<artifact_id>`.
+
+Configuración:
+  - ARTIFACT_BACKEND        "memory" (por defecto) o "disk"
+  - ARTIFACT_DIR            carpeta del backend disco (por defecto app/exports/artifacts)
+  - ARTIFACT_MIN_ROWS       tablas con menos filas quedan inline (por defecto 50)
+  - ARTIFACT_MAX_REQUESTS   solicitudes retenidas en memoria, LRU (por defecto 32)
+"""
+from __future__ import annotations
+
+import os
+import uuid
+import threading
+from itertools import islice
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.serialization import append_ndjson, loads
+from app.tools.table import Table, is_table, slice_rows, table_len
+
+ARTIFACT_BACKEND = os.getenv("ARTIFACT_BACKEND", "memory").strip().lower()
+ARTIFACT_DIR = Path(os.getenv("ARTIFACT_DIR", str(Path(__file__).resolve().parent / "exports" / "artifacts")))
+ARTIFACT_MIN_ROWS = int(os.getenv("ARTIFACT_MIN_ROWS", "50"))
+ARTIFACT_MAX_REQUESTS = int(os.getenv("ARTIFACT_MAX_REQUESTS", "32"))
+PREVIEW_ROWS = 5
+
+REF_KEY = "$artifact"
+
+
+class ArtifactNotFound(KeyError):
+    """La referencia ya no existe (solicitud expulsada del LRU o carpeta borrada)."""
+
+
+def is_ref(obj: Any) -> bool:
+    return isinstance(obj, dict) and REF_KEY in obj
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+# -----------------------------
+# Backends
+# -----------------------------
+class _MemoryBackend:
+    """
+    Tablas por solicitud en memoria (formato columnar `Table`, sin llaves repetidas por fila);
+    se retienen las últimas ARTIFACT_MAX_REQUESTS solicitudes.
+    """
+    durable = False  # las referencias mueren con el proceso (o con el LRU)
+
+    def __init__(self, max_requests: int = ARTIFACT_MAX_REQUESTS):
+        self.max_requests = max_requests
+        self._data: "OrderedDict[str, Dict[str, Table]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, request_id: str, artifact_id: str, rows: Table) -> None:
+        with self._lock:
+            self._data.setdefault(request_id, {})[artifact_id] = rows
+            self._data.move_to_end(request_id)
+            while len(self._data) > self.max_requests:
+                self._data.popitem(last=False)
+
+    def read(self, request_id: str, artifact_id: str, offset: int, end: Optional[int]) -> List[Dict[str, Any]]:
+        with self._lock:
+            try:
+                rows = self._data[request_id][artifact_id]
+            except KeyError:
+                raise ArtifactNotFound(f"{request_id}/{artifact_id}") from None
+        return rows.slice(offset, end).to_rows()
+
+    def exists(self, request_id: str, artifact_id: str) -> bool:
+        with self._lock:
+            return artifact_id in self._data.get(request_id, {})
+
+
+class _DiskBackend:
+    """Una tabla = un NDJSON en ARTIFACT_DIR/<request_id>/<artifact_id>.ndjson."""
+    durable = True
+
+    def __init__(self, root: Path = ARTIFACT_DIR):
+        self.root = root
+
+    def _path(self, request_id: str, artifact_id: str) -> Path:
+        return self.root / request_id / f"{artifact_id}.ndjson"
+
+    def put(self, request_id: str, artifact_id: str, rows: Table) -> None:
+        path = self._path(request_id, artifact_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as fh:
+            append_ndjson(fh, rows.iter_rows())
+
+    def read(self, request_id: str, artifact_id: str, offset: int, end: Optional[int]) -> List[Dict[str, Any]]:
+        path = self._path(request_id, artifact_id)
+        if not path.exists():
+            raise ArtifactNotFound(f"{request_id}/{artifact_id}")
+        with path.open("r", encoding="utf-8") as fh:
+            # solo se decodifican las líneas de la página pedida
+            return [loads(line) for line in islice(fh, offset, end)]
+
+    def exists(self, request_id: str, artifact_id: str) -> bool:
+        return self._path(request_id, artifact_id).exists()
+
+
+_BACKEND = _DiskBackend() if ARTIFACT_BACKEND == "disk" else _MemoryBackend()
+
+# -----------------------------
+# Store por solicitud
+# -----------------------------
+class ArtifactStore:
+    def __init__(self, request_id: Optional[str] = None, backend=None, min_rows: int = ARTIFACT_MIN_ROWS):
+        self.request_id = request_id or new_request_id()
+        self.backend = backend or _BACKEND
+        self.min_rows = min_rows
+        self.refs: List[Dict[str, Any]] = []
+
+    def put(self, rows: Any, name: str = "table") -> Dict[str, Any]:
+        """`rows`: lista de dicts, payload columnar o Table."""
+        artifact_id = f"{name}-{len(self.refs) + 1}"
+        table = Table.from_any(rows)
+        self.backend.put(self.request_id, artifact_id, table)
+        ref = {
+            REF_KEY: artifact_id,
+            "request_id": self.request_id,
+            "rows": len(table),
+            "columns": table.columns,
+            "preview": table.slice(0, PREVIEW_ROWS).to_rows(),
+            "totals": table.totals(),
+        }
+        self.refs.append({k: ref[k] for k in (REF_KEY, "rows")})
+        return ref
+
+    def maybe_put(self, rows: Any, name: str) -> Any:
+        """Guarda la tabla si es grande; si no, la devuelve tal cual (inline)."""
+        if (isinstance(rows, list) or is_table(rows)) and table_len(rows) >= self.min_rows:
+            return self.put(rows, name)
+        return rows
+
+    def compact_agent_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Reemplaza (in-place) las tablas grandes de un resultado de subagente por referencias."""
+        res = result.get("result") if isinstance(result, dict) else None
+        if not isinstance(res, dict):
+            return result
+        agent = str(result.get("agent") or "agent")
+        if "table" in res:
+            res["table"] = self.maybe_put(res["table"], f"{agent}.{res.get('action', 'table')}")
+        if "by_customer" in res:
+            res["by_customer"] = self.maybe_put(res["by_customer"], f"{agent}.by_customer")
+        for act in res.get("actions") or []:
+            if isinstance(act, dict) and "rows" in act:
+                act["rows"] = self.maybe_put(act["rows"], f"{agent}.{act.get('action', 'rows')}")
+        return result
+
+# -----------------------------
+# Lectura bajo demanda
+# -----------------------------
+def fetch_rows(ref: Any, offset: int = 0, limit: Optional[int] = None, backend=None) -> List[Dict[str, Any]]:
+    """Filas [offset, offset+limit) de una referencia; si `ref` es una tabla inline, la rebana."""
+    end = None if limit is None else offset + limit
+    if not is_ref(ref):
+        return slice_rows(ref, offset, end)
+    return (backend or _BACKEND).read(ref["request_id"], ref[REF_KEY], offset, end)
+
+def row_count(ref: Any) -> int:
+    return int(ref["rows"]) if is_ref(ref) else table_len(ref)
+
+def fetch_artifact(request_id: str, artifact_id: str, offset: int = 0, limit: Optional[int] = None,
+                   backend=None) -> List[Dict[str, Any]]:
+    """Como `fetch_rows`, a partir de los ids sueltos (p. ej. la ruta HTTP del servicio)."""
+    return fetch_rows({REF_KEY: artifact_id, "request_id": request_id}, offset, limit, backend)
+
+# -----------------------------
+# Salida del proceso
+# -----------------------------
+def _map_refs(obj: Any, fn) -> Any:
+    if is_ref(obj):
+        return fn(obj)
+    if isinstance(obj, dict):
+        return {k: _map_refs(v, fn) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_map_refs(v, fn) for v in obj]
+    return obj
+
+def resolve_refs(obj: Any, backend=None) -> Any:
+    """
+    Copia de `obj` con cada referencia reemplazada por todas sus filas (lista de dicts).
+    Usar antes de persistir o enviar un resultado fuera del proceso. Si la referencia ya
+    expiró se deja tal cual (conserva preview y totales).
+    """
+    def _inline(ref: Dict[str, Any]) -> Any:
+        try:
+            return fetch_rows(ref, backend=backend)
+        except ArtifactNotFound:
+            return ref
+    return _map_refs(obj, _inline)
+
+def persist_refs(obj: Any, backend=None) -> Any:
+    """
+    `obj` listo para salir del proceso: tal cual si el backend es durable (disco: la salida
+    lleva referencias con preview y totales), o con las filas inline si es el de memoria.
+    """
+    if getattr(backend or _BACKEND, "durable", False):
+        return obj
+    return resolve_refs(obj, backend=backend)
+
+def refs_alive(obj: Any, backend=None) -> bool:
+    """True si todas las referencias de `obj` siguen disponibles en el backend."""
+    be = backend or _BACKEND
+    alive = [True]
+
+    def _check(ref: Dict[str, Any]) -> Any:
+        if alive[0] and not be.exists(ref["request_id"], ref[REF_KEY]):
+            alive[0] = False
+        return ref
+    _map_refs(obj, _check)
+    return alive[0]
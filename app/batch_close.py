@@ -0,0 +1,262 @@
+# app/batch_close.py
+"""
+Runner batch para cierre mensual y back-fills históricos.
+
+Ejecuta `graph_lc.run_query` para cada combinación (período × pregunta) de un manifiesto,
+en un pool de procesos o hilos con cachés calientes por worker, y va escribiendo cada
+resultado como una línea NDJSON (opcionalmente convierte a Parquet al final).
+Es reanudable: las combinaciones ya presentes con status "ok" en la salida se omiten.
+
+Uso:
+    python -m app.batch_close app/workflows/cierre_batch.example.yaml \
+        --out app/exports/batch_cierre.ndjson --workers 4 --mode process --parquet
+
+Manifiesto (YAML o JSON):
+    periods: ["2025-07", "2025-08"]          # o bien:
+    period_range: {from: "2023-09", to: "2025-08"}
+    questions:
+      - id: dso
+        text: "¿Cuál es el DSO y el aging de CxC?"
+"""
+from __future__ import annotations
+
+import sys
+import json
+import time
+import argparse
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Set
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from app.serialization import append_ndjson, dumps, iter_ndjson
+
+# -----------------------------
+# Manifiesto
+# -----------------------------
+def _month_range(start: str, end: str) -> List[str]:
+    y, m = map(int, start.split("-"))
+    y2, m2 = map(int, end.split("-"))
+    out: List[str] = []
+    while (y, m) <= (y2, m2):
+        out.append(f"{y:04d}-{m:02d}")
+        y, m = (y + 1, 1) if m == 12 else (y, m + 1)
+    return out
+
+def load_manifest(path: str) -> Dict[str, Any]:
+    p = Path(path)
+    raw = p.read_text(encoding="utf-8")
+    if p.suffix.lower() in (".yaml", ".yml"):
+        import yaml
+        data = yaml.safe_load(raw) or {}
+    else:
+        data = json.loads(raw)
+
+    periods = list(data.get("periods") or [])
+    pr = data.get("period_range") or {}
+    if pr.get("from") and pr.get("to"):
+        periods += [x for x in _month_range(str(pr["from"]), str(pr["to"])) if x not in periods]
+    if not periods:
+        raise ValueError("El manifiesto no define 'periods' ni 'period_range'")
+
+    questions = []
+    for i, q in enumerate(data.get("questions") or []):
+        if isinstance(q, str):
+            q = {"id": f"q{i+1}", "text": q}
+        questions.append({"id": str(q.get("id") or f"q{i+1}"), "text": str(q["text"])})
+    if not questions:
+        raise ValueError("El manifiesto no define 'questions'")
+    return {"periods": periods, "questions": questions}
+
+def build_jobs(manifest: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {"key": f"{p}|{q['id']}", "period": p, "question_id": q["id"], "question": q["text"]}
+        for p in manifest["periods"]
+        for q in manifest["questions"]
+    ]
+
+def _trim_partial_line(out_path: Path, chunk: int = 1 << 16) -> None:
+    """
+    Corta la salida tras el último salto de línea: una interrupción a medio escribir deja un
+    registro truncado, y al reanudar en modo append el primero nuevo quedaría pegado a él.
+    """
+    if not out_path.exists():
+        return
+    with out_path.open("rb+") as fh:
+        end = fh.seek(0, 2)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - chunk)
+            fh.seek(start)
+            nl = fh.read(pos - start).rfind(b"\n")
+            if nl >= 0:
+                pos = start + nl + 1
+                break
+            pos = start
+        if pos < end:
+            fh.truncate(pos)
+
+def _done_keys(out_path: Path) -> Set[str]:
+    """Llaves ya completadas con éxito en una salida NDJSON previa (para reanudar)."""
+    done: Set[str] = set()
+    if not out_path.exists():
+        return done
+    for rec in iter_ndjson(out_path):  # ignora la línea truncada de una interrupción previa
+        if rec.get("status") == "ok" and rec.get("key"):
+            done.add(rec["key"])
+    return done
+
+# -----------------------------
+# Workers
+# -----------------------------
+def _init_worker(shared_ledger: bool = False) -> None:
+    """
+    Inicializador por proceso: deja registro de agentes, pool DB y LLM calientes.
+    Con `shared_ledger` los agentes leen el snapshot Arrow memory-mapped (una sola copia
+    física del libro para todos los procesos) en vez de una caché propia por worker.
+    """
+    if shared_ledger:
+        from app.ledger.cache import set_ledger_source
+        set_ledger_source("snapshot")
+    from app.graph_lc import warm_up
+    warm_up()
+
+def _run_job(job: Dict[str, Any]) -> Dict[str, Any]:
+    from app.artifacts import persist_refs
+    from app.graph_lc import run_query
+    t0 = time.perf_counter()
+    rec: Dict[str, Any] = dict(job)
+    try:
+        # con artefactos en memoria (del worker) las tablas van inline; en disco, referencias
+        rec["result"] = persist_refs(run_query(job["question"], job["period"], priority="batch"))
+        rec["status"] = "ok"
+    except Exception as e:
+        rec["status"] = "error"
+        rec["error"] = f"{type(e).__name__}: {e}"
+    rec["elapsed_s"] = round(time.perf_counter() - t0, 3)
+    return rec
+
+def _export_ledger_snapshot() -> bool:
+    """Escribe el snapshot del libro una vez antes de lanzar los workers; False si no se puede."""
+    try:
+        from app.ledger.snapshot import export_snapshot
+        for kind in ("cxc", "cxp"):
+            export_snapshot(kind)
+        return True
+    except Exception as e:  # sin pyarrow o sin DB: cada worker usa su caché en proceso
+        print(f"[batch] snapshot del libro no disponible ({type(e).__name__}: {e}); caché por worker", file=sys.stderr)
+        return False
+
+def _make_executor(mode: str, workers: int) -> Executor:
+    if mode == "thread":
+        _init_worker()  # los hilos comparten el proceso: se calienta una sola vez
+        return ThreadPoolExecutor(max_workers=workers)
+    shared = _export_ledger_snapshot()
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(shared,))
+
+# -----------------------------
+# Salidas
+# -----------------------------
+def _flat_row(rec: Dict[str, Any]) -> Dict[str, Any]:
+    res = rec.get("result") or {}
+    metrics = res.get("metrics") or {}
+    exec_pack = (res.get("gerente") or {}).get("executive_decision_bsc") or {}
+    return {
+        "key": rec.get("key"),
+        "period": rec.get("period"),
+        "question_id": rec.get("question_id"),
+        "question": rec.get("question"),
+        "status": rec.get("status"),
+        "error": rec.get("error"),
+        "elapsed_s": rec.get("elapsed_s"),
+        "dso": metrics.get("dso"),
+        "dpo": metrics.get("dpo"),
+        "ccc": metrics.get("ccc"),
+        "resumen_ejecutivo": exec_pack.get("resumen_ejecutivo"),
+        "result_json": dumps(res),
+    }
+
+def ndjson_to_parquet(ndjson_path: Path, parquet_path: Path) -> int:
+    """Convierte la salida NDJSON (última versión por llave) a Parquet con columnas planas."""
+    import pandas as pd
+
+    latest: Dict[str, Dict[str, Any]] = {}
+    for rec in iter_ndjson(ndjson_path):
+        latest[rec.get("key")] = _flat_row(rec)
+    pd.DataFrame(list(latest.values())).to_parquet(parquet_path, index=False)
+    return len(latest)
+
+class _Throughput:
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.t0 = time.perf_counter()
+
+    def tick(self, ok: bool) -> str:
+        self.done += 1
+        self.errors += 0 if ok else 1
+        el = time.perf_counter() - self.t0
+        rate = self.done / el if el > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else float("inf")
+        return f"[{self.done}/{self.total}] {rate * 60:.1f} jobs/min, errores={self.errors}, ETA {eta:.0f}s"
+
+    def summary(self) -> Dict[str, Any]:
+        el = time.perf_counter() - self.t0
+        return {
+            "jobs": self.done,
+            "errors": self.errors,
+            "elapsed_s": round(el, 2),
+            "jobs_per_min": round(self.done / el * 60, 2) if el > 0 else None,
+        }
+
+def run_batch(jobs: Iterable[Dict[str, Any]], out_path: Path, workers: int = 4,
+              mode: str = "process", resume: bool = True, log=print) -> Dict[str, Any]:
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    if resume:
+        _trim_partial_line(out_path)
+    done = _done_keys(out_path) if resume else set()
+    pending = [j for j in jobs if j["key"] not in done]
+    log(f"Jobs: {len(pending)} pendientes, {len(done)} ya completados (modo={mode}, workers={workers})")
+    tp = _Throughput(len(pending))
+    if not pending:
+        return tp.summary()
+
+    with out_path.open("a" if resume else "w", encoding="utf-8") as fh, _make_executor(mode, workers) as ex:
+        futures = [ex.submit(_run_job, j) for j in pending]
+        for fut in as_completed(futures):
+            rec = fut.result()
+            append_ndjson(fh, [rec])
+            fh.flush()  # streaming: cada resultado queda persistido al completarse
+            log(tp.tick(rec.get("status") == "ok") + f" — {rec['key']} ({rec['elapsed_s']}s)")
+    return tp.summary()
+
+# -----------------------------
+# CLI
+# -----------------------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Runner batch de run_query (cierre mensual / back-fills)")
+    ap.add_argument("manifest", help="Manifiesto YAML/JSON con periods|period_range y questions")
+    ap.add_argument("--out", default="app/exports/batch_cierre.ndjson", help="Salida NDJSON (append/reanudable)")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--mode", choices=("process", "thread"), default="process")
+    ap.add_argument("--no-resume", action="store_true", help="Reescribe la salida en vez de reanudar")
+    ap.add_argument("--parquet", nargs="?", const="", default=None,
+                    help="Además escribe Parquet (ruta opcional; por defecto junto al NDJSON)")
+    args = ap.parse_args(argv)
+
+    jobs = build_jobs(load_manifest(args.manifest))
+    out_path = Path(args.out)
+    log = lambda msg: print(msg, file=sys.stderr, flush=True)
+    summary = run_batch(jobs, out_path, workers=args.workers, mode=args.mode,
+                        resume=not args.no_resume, log=log)
+
+    if args.parquet is not None:
+        pq = Path(args.parquet) if args.parquet else out_path.with_suffix(".parquet")
+        summary["parquet_rows"] = ndjson_to_parquet(out_path, pq)
+        summary["parquet"] = str(pq)
+
+    print(dumps(summary, pretty=True))
+    return 0 if summary["errors"] == 0 else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -11,9 +11,13 @@ if str(PROJECT_ROOT) not in sys.path:
     sys.path.insert(0, str(PROJECT_ROOT))
 # -----------------------------------------------------------
 
+import os
 import json
 import re
-from datetime import datetime
+import time
+import threading
+from collections import OrderedDict
+from datetime import date, datetime
 from pathlib import Path
 
 import streamlit as st
@@ -37,6 +41,11 @@ except Exception as e:
     RUN_QUERY_AVAILABLE = False
     IMPORT_ERROR = e
 
+from app.artifacts import ArtifactNotFound, fetch_rows, is_ref, persist_refs, refs_alive, resolve_refs, row_count
+from app.data_version import current_token
+from app.serialization import append_ndjson, dump_file, dumps
+from app.tools.table import Table, is_table, slice_rows, table_len
+
 # -----------------------------
 # Config general
 # -----------------------------
@@ -53,6 +62,20 @@ EXPORT_DIR = BASE_DIR / "exports"
 LOG_DIR.mkdir(parents=True, exist_ok=True)
 EXPORT_DIR.mkdir(parents=True, exist_ok=True)
 
+# Los resultados memoizados se invalidan con la versión de datos (app.data_version); si la
+# DB no responde, se usa una ventana de este tamaño (s) como versión de respaldo.
+UI_CACHE_TTL_S = int(os.getenv("UI_CACHE_TTL_S", "300"))
+UI_CACHE_MAX_ENTRIES = int(os.getenv("UI_CACHE_MAX_ENTRIES", "128"))
+# Formato de "Guardar último resultado": json (compacto) | msgpack
+UI_EXPORT_FORMAT = os.getenv("UI_EXPORT_FORMAT", "json").strip().lower()
+# Bitácora del chat: por defecto referencias (preview + totales) y _meta; 1 = tablas completas
+UI_LOG_FULL_RESULTS = os.getenv("UI_LOG_FULL_RESULTS", "0").strip().lower() in ("1", "true", "yes")
+
+# Límites de lo que se envía al navegador: tablas paginadas en servidor y trace recortado
+UI_PAGE_SIZES = (25, 50, 100, 250)
+UI_TRACE_MAX_ROWS = int(os.getenv("UI_TRACE_MAX_ROWS", "20"))      # filas por lista en el trace crudo
+UI_TRACE_MAX_BYTES = int(os.getenv("UI_TRACE_MAX_BYTES", "200000"))
+
 # -----------------------------
 # Helpers
 # -----------------------------
@@ -156,14 +179,63 @@ def _mock_query(question: str, period: str) -> dict:
         }
     }
 
-def _call_backend(question: str, period: str) -> dict:
+# -----------------------------
+# Recursos y memoización (sobreviven a los reruns de Streamlit)
+# -----------------------------
+@st.cache_resource(show_spinner="Calentando backend…")
+def _backend_resources() -> dict:
+    """Una vez por proceso: registro de agentes, engine/pool de DB y cliente LLM."""
+    from app.graph_lc import warm_up
+    from app.router import Router
+    # memo de resultados (question, period, data_version) → (instante, resultado): vive fuera de
+    # st.cache_data para poder invocar el callback de streaming en cada miss
+    return {"router": Router(), "warm": warm_up(), "memo": OrderedDict(), "memo_lock": threading.Lock()}
+
+def _data_version() -> str:
+    """
+    Llave de datos para la caché: token de app.data_version (cambia cuando cambian facturas o
+    pagos) + día (el aging depende de hoy). Sin DB, ventana de UI_CACHE_TTL_S segundos.
+    """
+    token = current_token()
+    if token is None:
+        return f"ttl-{int(time.time() // max(1, UI_CACHE_TTL_S))}"
+    return f"{token}-{date.today().isoformat()}"
+
+def _cached_query(question: str, period: str, data_version: str, on_event=None) -> dict:
+    """
+    Memo por (question, period, data_version): al cambiar data_version se recalcula.
+    on_event solo se invoca en un miss (los hits llegan completos) y siempre en el hilo del
+    script, fuera de cualquier función st.cache_data, así que puede pintar contenedores.
+    Un hit de más de UI_CACHE_TTL_S segundos, o cuyas tablas ya salieron del LRU de
+    app.artifacts, se recalcula.
+    """
+    res = _backend_resources()
+    memo, lock, key = res["memo"], res["memo_lock"], (question, period, data_version)
+    with lock:
+        hit = memo.get(key)
+        if hit is not None and time.monotonic() - hit[0] < UI_CACHE_TTL_S and refs_alive(hit[1]):
+            memo.move_to_end(key)
+            return hit[1]
+    result = run_query(question, period or None, router=res["router"], on_event=on_event)
+    with lock:
+        memo[key] = (time.monotonic(), result)
+        while len(memo) > UI_CACHE_MAX_ENTRIES:
+            memo.popitem(last=False)
+    return result
+
+def _clear_memo() -> None:
+    res = _backend_resources()
+    with res["memo_lock"]:
+        res["memo"].clear()
+
+def _call_backend(question: str, period: str, on_event=None) -> dict:
     # Decide MOCK por toggle o por disponibilidad real del backend
     use_mock = st.session_state.get("use_mock", not RUN_QUERY_AVAILABLE)
     if use_mock or not RUN_QUERY_AVAILABLE or "run_query" not in globals():
         return _mock_query(question, period)
     # Llamada al grafo real con fallback seguro
     try:
-        return run_query(question, period)
+        return _cached_query(question, period, _data_version(), on_event=on_event)
     except Exception as e:
         st.error("Fallo en backend. Usando MOCK.")
         st.exception(e)  # muestra stacktrace en la UI
@@ -171,9 +243,22 @@ def _call_backend(question: str, period: str) -> dict:
 
 def _save_last_result(obj: dict) -> Path:
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
-    out = EXPORT_DIR / f"result_{ts}.json"
-    out.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
-    return out
+    ext = "msgpack" if UI_EXPORT_FORMAT == "msgpack" else "json"
+    return dump_file(persist_refs(obj), EXPORT_DIR / f"result_{ts}.{ext}")
+
+def _log_query(question: str, period: str, result: dict) -> None:
+    """
+    Bitácora del chat: una línea NDJSON por consulta (app/logs/chat_YYYYMMDD.ndjson). Las
+    tablas grandes quedan como referencia con preview y totales, así cada línea no crece con
+    el libro; UI_LOG_FULL_RESULTS=1 las escribe completas.
+    """
+    if UI_LOG_FULL_RESULTS:
+        result = resolve_refs(result)
+    try:
+        with (LOG_DIR / f"chat_{datetime.now():%Y%m%d}.ndjson").open("a", encoding="utf-8") as fh:
+            append_ndjson(fh, [{"ts": datetime.now(), "question": question, "period": period, "result": result}])
+    except OSError:
+        pass  # la bitácora nunca debe tumbar la UI
 
 # ====== Helpers UI de datos (nuevos) ======
 def _fmt_days(v):
@@ -200,6 +285,44 @@ def _get_agent_data(result: dict, agent_name: str) -> dict:
 def _get_aging_from_result(result: dict, agent_name: str) -> dict:
     return _norm_aging(_get_agent_data(result, agent_name).get("aging"))
 
+def _is_tabular(obj) -> bool:
+    return (isinstance(obj, list) and bool(obj)) or is_ref(obj) or (is_table(obj) and row_count(obj) > 0)
+
+def _collect_tables(result: dict) -> list[dict]:
+    """Tablas de detalle de los subagentes: CxC (result.table) y CxP (result.actions[*].rows)."""
+    out = []
+    for r in (result.get("trace") or []):
+        if not isinstance(r, dict) or not isinstance(r.get("result"), dict):
+            continue
+        agent, res = r.get("agent", "?"), r["result"]
+        # cada tabla puede venir inline (lista o columnar) o como referencia a app.artifacts
+        if _is_tabular(res.get("table")):
+            out.append({"agent": agent, "action": res.get("action", "table"), "rows": res["table"]})
+        for act in res.get("actions") or []:
+            if isinstance(act, dict) and _is_tabular(act.get("rows")):
+                out.append({"agent": agent, "action": act.get("action", "rows"), "rows": act["rows"]})
+    return out
+
+def _truncate_for_view(obj, max_rows: int = UI_TRACE_MAX_ROWS, max_str: int = 2000):
+    """Copia recortada para el trace crudo: listas largas y textos enormes no viajan al navegador."""
+    if isinstance(obj, Table) or is_table(obj):
+        # columnar: las filas viven en listas por columna, se recorta por fila (no por columna)
+        n = table_len(obj)
+        head = [_truncate_for_view(r, max_rows, max_str) for r in slice_rows(obj, 0, max_rows)]
+        if n > max_rows:
+            head.append(f"… (+{n - max_rows} filas; ver tablas paginadas)")
+        return head
+    if isinstance(obj, dict):
+        return {k: _truncate_for_view(v, max_rows, max_str) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        head = [_truncate_for_view(v, max_rows, max_str) for v in obj[:max_rows]]
+        if len(obj) > max_rows:
+            head.append(f"… (+{len(obj) - max_rows} elementos; ver tablas paginadas)")
+        return head
+    if isinstance(obj, str) and len(obj) > max_str:
+        return obj[:max_str] + f"… (+{len(obj) - max_str} caracteres)"
+    return obj
+
 def _get_totals(result: dict, agent_name: str) -> dict:
     d = _get_agent_data(result, agent_name)
     aging_norm = _norm_aging(d.get("aging") or {})
@@ -230,6 +353,14 @@ st.sidebar.toggle(
 period = st.sidebar.text_input("Periodo (YYYY-MM)", value="2025-08")
 show_trace = st.sidebar.checkbox("Ver trace crudo", value=False)
 
+if RUN_QUERY_AVAILABLE and not st.session_state.get("use_mock"):
+    warm = _backend_resources()["warm"]
+    failed = [k for k, v in warm.items() if v != "ok"]
+    st.sidebar.caption("Recursos: " + ("✅ calientes" if not failed else f"⚠️ fallaron {', '.join(failed)}"))
+if st.sidebar.button("Limpiar caché de respuestas"):
+    _clear_memo()
+    st.sidebar.caption("Caché limpiada.")
+
 # -----------------------------
 # Main
 # -----------------------------
@@ -244,17 +375,8 @@ question = st.text_area(
 
 col1, col2 = st.columns([1, 1], gap="large")
 with col1:
-    if st.button("Consultar", type="primary"):
-        if not question.strip():
-            st.warning("Escribe una pregunta.")
-        else:
-            try:
-                with st.spinner("Consultando…"):
-                    result = _call_backend(question.strip(), period.strip())
-                st.session_state["last_result"] = result
-                st.success("¡Listo!")
-            except Exception as e:
-                st.error(f"Error: {e}")
+    consultar = st.button("Consultar", type="primary")
+    status_box = st.empty()
 with col2:
     if st.button("Guardar último resultado"):
         res = st.session_state.get("last_result")
@@ -266,10 +388,14 @@ with col2:
 
 st.divider()
 
-result = st.session_state.get("last_result")
-if not result:
-    st.info("Realiza una consulta para ver resultados.")
-else:
+# -----------------------------
+# Render por secciones (cada una en su placeholder para poder llenarse en streaming)
+# -----------------------------
+def _has_core(result: dict) -> bool:
+    metrics = (result or {}).get("metrics") or {}
+    return any([metrics.get("dso"), metrics.get("dpo"), metrics.get("ccc")])
+
+def _render_period(result: dict):
     # -------------------------
     # Período resuelto (si viene desde el backend)
     # -------------------------
@@ -289,12 +415,11 @@ else:
         else:
             st.caption("El backend no devolvió información del período.")
 
+def _render_kpis(result: dict):
     # -------------------------
     # Banner de estado del informe (con/sin datos)
     # -------------------------
-    metrics = (result or {}).get("metrics") or {}
-    has_core = any([metrics.get("dso"), metrics.get("dpo"), metrics.get("ccc")])
-    if has_core:
+    if _has_core(result):
         st.success("✅ Informe generado: análisis con datos suficientes (DSO/DPO/CCC presentes).")
     else:
         st.warning("⚠️ Informe generado: sin datos suficientes. "
@@ -314,9 +439,8 @@ else:
         st.metric("CCC (ciclo de caja)", _fmt_days(kpis_top.get("ccc") or kpis_top.get("CCC")))
     st.divider()
 
+def _render_exec(result: dict):
     gerente = result.get("gerente") or {}
-    admin = result.get("administrativo") or result.get("av_administrativo") or {}
-
     # Resumen ejecutivo (BSC)
     with st.container(border=True):
         st.subheader("📄 Resumen ejecutivo (BSC)")
@@ -334,6 +458,7 @@ else:
             except Exception:
                 st.markdown(safe_text)
 
+def _render_aging(result: dict):
     # === Antigüedad de saldos (vencido) ===
     st.subheader("📊 Antigüedad de saldos (solo vencido)")
     col_cxc, col_cxp = st.columns(2, gap="large")
@@ -350,6 +475,7 @@ else:
         if sum(a.values()) > 0:
             st.bar_chart(pd.Series(a), height=160, use_container_width=True)
 
+def _render_totals(result: dict):
     # === Totales por módulo (si disponibles) ===
     st.subheader("💵 Totales (si disponibles)")
     t1, t2 = st.columns(2)
@@ -360,6 +486,9 @@ else:
         st.caption("CxP")
         st.table(pd.DataFrame([_get_totals(result, "aaav_cxp")]).style.format("{:,.2f}"))
 
+def _render_findings(result: dict):
+    gerente = result.get("gerente") or {}
+    admin = result.get("administrativo") or result.get("av_administrativo") or {}
     # Hallazgos y órdenes
     c1, c2 = st.columns([1, 1])
     with c1:
@@ -386,17 +515,56 @@ else:
                 with st.expander(title, expanded=False):
                     st.write(o)
 
-    # Intent & trace
-    with st.expander("🔎 Intent & Trace", expanded=show_trace):
+def _render_tables(result: dict):
+    # === Detalle de facturas: paginado en servidor, solo la página visible va al navegador ===
+    tables = _collect_tables(result)
+    if not tables:
+        return
+    st.subheader("📋 Detalle de documentos")
+    gen = st.session_state.get("result_gen", 0)
+    for i, t in enumerate(tables):
+        rows, total = t["rows"], row_count(t["rows"])
+        with st.expander(f"{t['agent']} · {t['action']} ({total:,} filas)", expanded=False):
+            c_size, c_page = st.columns([1, 1])
+            with c_size:
+                size = st.selectbox("Filas por página", UI_PAGE_SIZES, key=f"tbl_{gen}_{i}_size")
+            n_pages = max(1, -(-total // size))
+            with c_page:
+                page = st.number_input(f"Página (de {n_pages})", min_value=1, max_value=n_pages,
+                                       value=1, step=1, key=f"tbl_{gen}_{i}_page")
+            # solo la página visible: del almacén de artefactos o rebanando la tabla inline
+            try:
+                page_rows = fetch_rows(rows, (int(page) - 1) * size, size)
+            except ArtifactNotFound:
+                st.caption("La tabla completa ya no está disponible; se muestra la vista previa.")
+                page_rows = rows.get("preview") or []
+            st.dataframe(pd.DataFrame(page_rows), use_container_width=True, hide_index=True,
+                         height=min(420, 38 + 35 * len(page_rows)))
+
+def _render_trace(result: dict):
+    # Intent & trace: solo se serializa si se pide (checkbox), recortado y con tope de tamaño
+    with st.expander("🔎 Intent & Trace", expanded=False):
+        if not show_trace:
+            st.caption("Activa «Ver trace crudo» en la barra lateral para cargarlo.")
+            return
         st.write({"intent": result.get("intent")})
-        st.json(result.get("trace") or result, expanded=False)
+        view = _truncate_for_view(result.get("trace") or result)
+        size = len(dumps(view))
+        if size > UI_TRACE_MAX_BYTES:
+            st.warning(f"Trace recortado demasiado grande ({size:,} bytes); se muestra por agente.")
+            for item in view if isinstance(view, list) else [view]:
+                name = item.get("agent", "intent") if isinstance(item, dict) else "item"
+                st.caption(f"{name}: {', '.join(item.keys()) if isinstance(item, dict) else type(item).__name__}")
+        else:
+            st.json(view, expanded=False)
 
+def _render_conclusion(result: dict):
     # -------------------------
     # Última casilla / conclusión
     # -------------------------
     with st.container(border=True):
         st.subheader("🧾 Conclusión del informe")
-        if has_core:
+        if _has_core(result):
             st.markdown(
                 "- El informe **se generó correctamente** y contiene análisis sobre DSO, DPO y CCC.\n"
                 "- Se incluyen hallazgos y órdenes priorizadas cuando aplica."
@@ -406,3 +574,61 @@ else:
                 "- El informe **se generó** pero **no cuenta con datos suficientes** para un análisis completo.\n"
                 "- **Acción sugerida:** cargar/validar DSO, DPO, CCC y el *aging* de CxC/CxP para habilitar los diagnósticos."
             )
+
+SECTIONS = {
+    "period": _render_period,
+    "kpis": _render_kpis,
+    "exec": _render_exec,
+    "aging": _render_aging,
+    "totals": _render_totals,
+    "findings": _render_findings,
+    "tables": _render_tables,
+    "trace": _render_trace,
+    "conclusion": _render_conclusion,
+}
+slots = {name: st.empty() for name in SECTIONS}
+
+def _paint(name: str, result: dict):
+    with slots[name].container():
+        SECTIONS[name](result)
+
+def _stream_handler():
+    """Callback de run_query: pinta cada sección apenas llegan sus insumos (BSC al final)."""
+    partial: dict = {"trace": [], "_meta": {}}
+
+    def on_event(event: str, data: dict):
+        if event == "period":
+            partial["_meta"]["period_resolved"] = data.get("period")
+            _paint("period", partial)
+            slots["exec"].info("⏳ Calculando CxC/CxP…")
+        elif event == "agent":
+            partial["trace"].append(data.get("result") or {})
+            if data.get("agent") in ("aaav_cxc", "aaav_cxp"):
+                _paint("aging", partial)
+                _paint("totals", partial)
+        elif event == "metrics":
+            partial["metrics"] = data.get("metrics") or {}
+            _paint("kpis", partial)
+            slots["exec"].info("⏳ Generando resumen ejecutivo (BSC)…")
+    return on_event
+
+if consultar:
+    if not question.strip():
+        status_box.warning("Escribe una pregunta.")
+    else:
+        try:
+            with st.spinner("Consultando…"):
+                result = _call_backend(question.strip(), period.strip(), on_event=_stream_handler())
+            st.session_state["last_result"] = result
+            _log_query(question.strip(), period.strip(), result)
+            st.session_state["result_gen"] = st.session_state.get("result_gen", 0) + 1  # reinicia paginación
+            status_box.success("¡Listo!")
+        except Exception as e:
+            status_box.error(f"Error: {e}")
+
+result = st.session_state.get("last_result")
+if not result:
+    slots["period"].info("Realiza una consulta para ver resultados.")
+else:
+    for name in SECTIONS:
+        _paint(name, result)
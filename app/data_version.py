@@ -0,0 +1,132 @@
+# app/data_version.py
+"""
+Versión de los datos contables como llave universal de caché.
+
+El esquema (app/models.py) no tiene `updated_at` ni contadores de versión, así que la
+versión se deriva de una marca de agua por tabla, en UNA consulta de agregados sobre PKs
+e índices (no lee filas):
+
+    factura_cxc / factura_cxp : (max id, count)
+    pago_cxc / pago_cxp       : (max id, count, max fecha)
+    entidad                   : (max id, count)
+
+    dv = data_version()          # {"token": "3f9c…", "tables": {...}}
+    dv["token"]                  # str corto: usar como parte de cualquier llave
+
+Lo usan la caché de partidas (app.ledger.cache), el router (`GlobalState.data_version`,
+`_meta["data_version"]`) y la memoización de la UI. Ediciones en sitio que no agregan ni
+borran filas (p. ej. corregir un monto) no cambian la marca; `bump()` fuerza una versión
+nueva (p. ej. tras una carga manual); `epoch()` la expone a otros módulos.
+
+Configuración:
+  - DATA_VERSION_CHECK_S   segundos que se reutiliza la última lectura (por defecto 2)
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+DATA_VERSION_CHECK_S = float(os.getenv("DATA_VERSION_CHECK_S", "2"))
+
+# -----------------------------
+# Marcas por tabla
+# -----------------------------
+def _table_specs() -> Dict[str, Tuple[Any, Any]]:
+    """tabla → (columna PK, columna de fecha o None). Import tardío de los modelos."""
+    from app.models import Entidad, FacturaCXC, FacturaCXP, PagoCXC, PagoCXP
+    return {
+        "factura_cxc": (FacturaCXC.id_cxc, None),
+        "factura_cxp": (FacturaCXP.id_cxp, None),
+        "pago_cxc": (PagoCXC.id_pago_cxc, PagoCXC.fecha),
+        "pago_cxp": (PagoCXP.id_pago_cxp, PagoCXP.fecha),
+        "entidad": (Entidad.id_entidad, None),
+    }
+
+def table_watermarks(db, tables: Optional[Iterable[str]] = None) -> Dict[str, Tuple]:
+    """{tabla: (max_id, count[, max_fecha])} para `tables` (todas por defecto), en una sola consulta."""
+    from sqlalchemy import func, select
+    specs = _table_specs()
+    names = list(tables) if tables is not None else list(specs)
+    cols, shape = [], []
+    for name in names:
+        pk, fecha = specs[name]
+        cols += [select(func.max(pk)).scalar_subquery(), select(func.count(pk)).scalar_subquery()]
+        if fecha is not None:
+            cols.append(select(func.max(fecha)).scalar_subquery())
+        shape.append((name, 3 if fecha is not None else 2))
+    row = list(db.execute(select(*cols)).one())
+    out: Dict[str, Tuple] = {}
+    for name, width in shape:
+        vals, row = row[:width], row[width:]
+        out[name] = (int(vals[0] or 0), int(vals[1] or 0), *vals[2:])
+    return out
+
+def _token(tables: Dict[str, Tuple], epoch: int) -> str:
+    raw = "|".join(f"{k}={v!r}" for k, v in sorted(tables.items())) + f"|e{epoch}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:12]
+
+# -----------------------------
+# Servicio
+# -----------------------------
+_LOCK = threading.Lock()
+_LAST: Dict[str, Dict[str, Any]] = {}   # bind (URL de la base) → última lectura
+_EPOCH = 0
+
+def data_version(db=None, max_age_s: float = DATA_VERSION_CHECK_S) -> Dict[str, Any]:
+    """
+    {"token", "tables", "checked_at"} de la base detrás de `db`; reutiliza la última lectura
+    de esa misma base durante `max_age_s` segundos.
+    """
+    from app.ledger.items import _bind_key, _session
+    with _session(db) as s:
+        bind = _bind_key(s)
+        with _LOCK:
+            last = _LAST.get(bind)
+            if last and time.monotonic() - last["_mono"] < max_age_s:
+                return {k: v for k, v in last.items() if k != "_mono"}
+        tables = table_watermarks(s)
+    dv = {"token": _token(tables, _EPOCH), "tables": {k: list(v) for k, v in tables.items()},
+          "checked_at": time.time(), "_mono": time.monotonic()}
+    with _LOCK:
+        _LAST[bind] = dv
+    return {k: v for k, v in dv.items() if k != "_mono"}
+
+def current_token(db=None) -> Optional[str]:
+    """Solo el token; None si la DB no responde (el llamador decide cómo degradar)."""
+    try:
+        return data_version(db)["token"]
+    except Exception:
+        return None
+
+def epoch() -> int:
+    """Época de este proceso: sube con cada `bump()` (parte del token y de las llaves de caché)."""
+    return _EPOCH
+
+def bump() -> None:
+    """
+    Invalida la versión en este proceso (nuevo token aunque la marca de agua no cambie) y la
+    época compartida del snapshot del libro, para que los demás procesos tampoco sirvan el
+    archivo viejo.
+    """
+    global _EPOCH
+    with _LOCK:
+        _EPOCH += 1
+        _LAST.clear()
+    try:
+        from app.ledger.snapshot import bump_shared_epoch
+        bump_shared_epoch()
+    except Exception:
+        pass  # sin carpeta de snapshots escribible: solo se invalida este proceso
+    cache = sys.modules.get("app.ledger.cache")
+    if cache is not None:
+        cache.ledger_cache().invalidate()
+    index = sys.modules.get("app.ledger.issued_index")
+    if index is not None:
+        index.invalidate()
+    snapshot = sys.modules.get("app.ledger.snapshot")
+    if snapshot is not None:
+        snapshot.invalidate()
@@ -2,6 +2,8 @@ import os
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 
+from app.sql_instrumentation import ENABLED as SQL_INSTRUMENT, instrument_engine
+
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT", "5432")
 DB_NAME = os.getenv("DB_NAME")
@@ -12,5 +14,7 @@ DB_SSLMODE = os.getenv("DB_SSLMODE", "prefer")
 DATABASE_URL = f"postgresql+psycopg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}?sslmode={DB_SSLMODE}"
 
 engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+if SQL_INSTRUMENT:
+    instrument_engine(engine)  # conteo por operación, N+1 y log de lentas
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
 Base = declarative_base()
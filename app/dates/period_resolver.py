@@ -24,6 +24,17 @@ def _start_of_month(year: int, month: int) -> datetime:
 def _current_now() -> datetime:
     return datetime.now(TZ)
 
+def parse_iso(value: str) -> datetime:
+    """
+    ISO-8601 → datetime. Usa el parser de la stdlib (cubre lo que emite el router) y solo
+    recurre a dateutil para formatos exóticos, evitando importarlo en el camino común.
+    """
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        from dateutil import parser as dateparser
+        return dateparser.isoparse(value)
+
 def resolve_period(nl: str | None, override: dict | None = None) -> dict:
     """
     Resuelve el período como rango [start, end] en TZ America/Costa_Rica.
@@ -135,9 +146,15 @@ def resolve_period(nl: str | None, override: dict | None = None) -> dict:
         return {"text": "esta semana", "start": start, "end": end, "granularity": "week", "source": "nlp", "tz": str(TZ)}
     if "este mes" in text or "de este mes" in text:
         return {"text": "este mes", "start": _start_of_month(now.year, now.month), "end": _end_of_month(now.year, now.month), "granularity": "month", "source": "nlp", "tz": str(TZ)}
-    if "mes pasado" in text or "del mes pasado" in text:
+    if "mes pasado" in text or "mes anterior" in text:
         prev_y, prev_m = (now.year - 1, 12) if now.month == 1 else (now.year, now.month - 1)
-        return {"text": "mes pasado", "start": _start_of_month(prev_y, prev_m), "end": _end_of_month(prev_y, prev_m), "granularity": "month", "source": "nlp", "tz": str(TZ)}
+        return {"text": "mes anterior" if "mes anterior" in text else "mes pasado", "start": _start_of_month(prev_y, prev_m), "end": _end_of_month(prev_y, prev_m), "granularity": "month", "source": "nlp", "tz": str(TZ)}
+    if "este trimestre" in text:
+        y0, m0 = now.year, 3 * ((now.month - 1) // 3) + 1
+        return {"text": "este trimestre", "start": _start_of_month(y0, m0), "end": _end_of_month(y0, m0 + 2), "granularity": "quarter", "source": "nlp", "tz": str(TZ)}
+    if re.search(r"(último|ultimo) trimestre|trimestre (pasado|anterior)", text):
+        y0, m0 = _shift_months(now.year, 3 * ((now.month - 1) // 3) + 1, -3)
+        return {"text": "último trimestre", "start": _start_of_month(y0, m0), "end": _end_of_month(y0, m0 + 2), "granularity": "quarter", "source": "nlp", "tz": str(TZ)}
     if "hoy" in text:
         start = now.replace(hour=0, minute=0, second=0, microsecond=0)
         end   = now.replace(hour=23, minute=59, second=59, microsecond=0)
@@ -157,3 +174,86 @@ def resolve_period(nl: str | None, override: dict | None = None) -> dict:
         "tz": str(TZ),
         "warning": "period_auto_default"
     }
+
+# -----------------------------
+# Períodos comparativos
+# -----------------------------
+# Solo pedidos explícitos: "anterior", "respecto"… describen un período o una lectura, no una
+# comparación ("DSO del mes anterior" es un período, no dos). "tendencia"/"evolución" solo
+# cuentan con una ventana ("tendencia del último trimestre"), no sueltas ("tendencia del DSO").
+_COMPARE_RE = re.compile(r"\b(compar\w*|vs\.?|versus|frente al?|interanual|yoy)\b")
+_TREND_RE = re.compile(r"\b(tendencia|evoluci[oó]n)\b.*\b(semanas?|mes|meses|trimestres?|semestres?|años?|anos?)\b")
+_MONTH_RE = re.compile(r"\b(" + "|".join(SPANISH_MONTHS) + r")\b(?:\s+(?:de\s+)?(\d{4}))?")
+
+def wants_comparison(nl: str | None) -> bool:
+    """
+    La pregunta pide comparar: verbo/conector explícito ('compara', 'vs', 'versus', 'frente al',
+    'interanual'), tendencia sobre una ventana ('evolución del último trimestre') o dos meses
+    nombrados ('DSO de julio y agosto').
+    """
+    text = (nl or "").lower()
+    return (bool(_COMPARE_RE.search(text) or _TREND_RE.search(text))
+            or len(_named_months(text, _current_now())) >= 2)
+
+def _window(text: str, start: datetime, end: datetime, granularity: str, source: str) -> dict:
+    return {"text": text, "start": start, "end": end, "granularity": granularity, "source": source, "tz": str(TZ)}
+
+def _month_window(year: int, month: int, text: str, source: str) -> dict:
+    return _window(text, _start_of_month(year, month), _end_of_month(year, month), "month", source)
+
+def _shift_months(year: int, month: int, delta: int) -> tuple[int, int]:
+    idx = year * 12 + (month - 1) + delta
+    return idx // 12, idx % 12 + 1
+
+def _minus_one_year(dt: datetime) -> datetime:
+    day = min(dt.day, calendar.monthrange(dt.year - 1, dt.month)[1])  # 29-feb → 28-feb
+    return dt.replace(year=dt.year - 1, day=day)
+
+def _previous_window(pr: dict) -> dict:
+    """Mes/trimestre calendario anterior; otras ventanas: misma duración inmediatamente antes."""
+    start, end, gran = pr["start"], pr["end"], pr.get("granularity")
+    months = {"month": 1, "quarter": 3}.get(gran)
+    if months and start.day == 1:
+        y0, m0 = _shift_months(start.year, start.month, -months)
+        y1, m1 = _shift_months(start.year, start.month, -1)
+        return _window(f"anterior: {y0:04d}-{m0:02d}" + (f"..{y1:04d}-{m1:02d}" if months > 1 else ""),
+                       _start_of_month(y0, m0), _end_of_month(y1, m1), gran, "compare")
+    span = end - start + timedelta(seconds=1)
+    return _window("período anterior", start - span, end - span, gran or "custom", "compare")
+
+def _last_year_window(pr: dict) -> dict:
+    start, end, gran = pr["start"], pr["end"], pr.get("granularity")
+    if gran in ("month", "quarter") and start.day == 1:
+        end = _end_of_month(end.year - 1, end.month)  # fin de mes real (febrero bisiesto)
+    else:
+        end = _minus_one_year(end)
+    return _window(f"año anterior: {pr.get('text', '')}".strip(), _minus_one_year(start), end, gran or "custom", "compare")
+
+def _named_months(text: str, now: datetime) -> list[tuple[int, int]]:
+    """Meses mencionados; sin año toman el del siguiente mes con año ('julio vs agosto 2025')."""
+    found = [(SPANISH_MONTHS[name], int(year) if year else None) for name, year in _MONTH_RE.findall(text)]
+    out: list[tuple[int, int]] = []
+    for i, (mo, y) in enumerate(found):
+        if y is None:
+            y = next((yy for _, yy in found[i + 1:] if yy is not None), None)
+        if y is None:
+            y = now.year - 1 if mo > now.month + 1 else now.year  # misma regla que resolve_period
+        if (y, mo) not in out:
+            out.append((y, mo))
+    return out
+
+def comparison_periods(nl: str | None, pr: dict) -> tuple[dict, dict[str, dict]]:
+    """
+    (período actual, {etiqueta: período}) para una pregunta comparativa.
+      - 'compara julio vs agosto': actual = el mes más reciente, "previous" = el otro
+      - si no: "previous" (mes/trimestre/ventana anterior) y "last_year" (mismo período un año antes)
+    Los períodos tienen la misma forma que resolve_period (datetimes con TZ CR).
+    """
+    text = (nl or "").lower()
+    if pr.get("source") == "nlp":
+        named = sorted(_named_months(text, _current_now()))
+        if len(named) >= 2:
+            (py, pm), (cy, cm) = named[-2], named[-1]
+            current = _month_window(cy, cm, f"{cy:04d}-{cm:02d}", "nlp")
+            return current, {"previous": _month_window(py, pm, f"{py:04d}-{pm:02d}", "compare")}
+    return pr, {"previous": _previous_window(pr), "last_year": _last_year_window(pr)}
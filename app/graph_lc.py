@@ -1,11 +1,97 @@
 # app/graph_lc.py
 from __future__ import annotations
-from typing import Dict, Any, Optional
+import queue
+import threading
+from typing import Dict, Any, Iterator, Optional, Tuple
 from app.state import GlobalState
-from app.router import Router
+from app.router import Router, OnEvent
+from app.agents.registry import get_agent, list_agents
+from app.admission import request_context
 
-def run_query(question: str, period: Optional[str] = None) -> Dict[str, Any]:
-    state = GlobalState()
-    state.period_raw = period  # para que el Router pueda leer el YYYY-MM de la sidebar
-    router = Router()
-    return router.dispatch({"payload": {"question": question, "period": period}}, state)
+def warm_up(db: bool = True, llm: bool = True) -> Dict[str, Any]:
+    """
+    Precalienta recursos de proceso (registro de agentes, pool de DB, cliente LLM)
+    para que la primera pregunta no pague imports ni conexiones. Tolerante a fallos:
+    devuelve qué se pudo calentar y qué no.
+    """
+    status: Dict[str, Any] = {}
+    for name in list_agents():
+        try:
+            get_agent(name)
+            status[name] = "ok"
+        except Exception as e:
+            status[name] = f"error: {e}"
+    if db:
+        try:
+            from sqlalchemy import text
+            from app.database import engine
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            status["db"] = "ok"
+        except Exception as e:
+            status["db"] = f"error: {e}"
+    if llm:
+        try:
+            from app.lc_llm import get_chat_model
+            get_chat_model()
+            status["llm"] = "ok"
+        except Exception as e:
+            status["llm"] = f"error: {e}"
+    return status
+
+def run_query(question: str, period: Optional[str] = None,
+              priority: str = "interactive", deadline_s: Optional[float] = None,
+              state: Optional[GlobalState] = None, router: Optional[Router] = None,
+              on_event: Optional[OnEvent] = None) -> Dict[str, Any]:
+    """
+    priority: "interactive" (UI/servicio) o "batch"; decide el orden en la cola de LLM.
+    deadline_s: presupuesto de la solicitud; si la cola de LLM lo excede se degrada a
+                reportes deterministas (ver app.admission).
+    state/router: para sesiones persistentes (REPL). Si se pasa `state`, se reutiliza su
+                `context` entre preguntas y se anota la respuesta en context['history'].
+    on_event:   callback de streaming (ver app.router.OnEvent); se invoca en el hilo que llama.
+    """
+    session = state is not None
+    if session:
+        state.start_turn()
+        if period is not None:
+            state.period_raw = period
+        period = state.period_raw
+    else:
+        state = GlobalState()
+        state.period_raw = period  # para que el Router pueda leer el YYYY-MM de la sidebar
+    router = router or Router()
+    with request_context(priority, deadline_s):
+        result = router.dispatch({"payload": {"question": question, "period": period}}, state,
+                                 on_event=on_event)
+    if session:
+        state.remember(question, result)
+    return result
+
+_DONE = object()
+
+def iter_query(question: str, period: Optional[str] = None, **kwargs) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Versión generador de run_query: produce (evento, datos) a medida que cada agente termina
+    y ("final", {"result": ...}) al cierre. Ejecuta el grafo en un hilo aparte, así el
+    consumidor puede pintar resultados parciales. Re-lanza la excepción del grafo si falla.
+    """
+    q: "queue.Queue[Any]" = queue.Queue()
+    failure: Dict[str, BaseException] = {}
+
+    def _work():
+        try:
+            run_query(question, period, on_event=lambda ev, data: q.put((ev, data)), **kwargs)
+        except BaseException as e:
+            failure["error"] = e
+        finally:
+            q.put(_DONE)
+
+    threading.Thread(target=_work, name="iter_query", daemon=True).start()
+    while True:
+        item = q.get()
+        if item is _DONE:
+            break
+        yield item
+    if "error" in failure:
+        raise failure["error"]
@@ -11,7 +11,8 @@ from app.utils.intent_es import (
     TRIGGERS_CXC,
     TRIGGERS_CXP,
 )
-from app.lc_llm import get_chat_model
+from app.lc_llm import get_chat_model, LLM_BACKEND
+from app.admission import admit, AdmissionRejected
 
 # Umbrales (puedes afinar luego)
 KW_MIN_SCORE = 1.25   # sube/baja según falsos positivos
@@ -98,7 +99,12 @@ def llm_proposal(question: str) -> List[Tuple[str, float, str]]:
         "Evalúa CxC, CxP, Contable y Administrativo. Si no hay suficiente señal, usa confidence<0.5."
     )
     user = f"Pregunta: {question}\nAgentes:\n{json.dumps(roles, ensure_ascii=False)}\nResponde SOLO JSON."
-    resp = llm.invoke([{"role":"system","content":system},{"role":"user","content":user}])
+    try:
+        with admit(LLM_BACKEND):
+            resp = llm.invoke([{"role":"system","content":system},{"role":"user","content":user}])
+    except AdmissionRejected:
+        # Backpressure: sin cupo dentro del deadline → decidir solo con keywords
+        return []
     try:
         txt = resp.content
         txt = txt[txt.find("{"): txt.rfind("}")+1]
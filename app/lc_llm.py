@@ -1,11 +1,24 @@
 # app/lc_llm.py
 import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 
 # Cargar variables de entorno desde .env
 load_dotenv()
 
+LLM_BACKEND = "openai"  # nombre del backend para el control de admisión (app.admission)
+
+@lru_cache(maxsize=8)
+def _build_chat_model(model: str, temperature: float, api_key: str):
+    # Un cliente por configuración y proceso: reutiliza el pool HTTP entre preguntas.
+    # Import tardío: langchain_openai solo se carga cuando de verdad se llama al LLM.
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(
+        model=model,
+        temperature=temperature,
+        api_key=api_key
+    )
+
 def get_chat_model():
     """
     Devuelve el modelo GPT-4o (completo) para tareas de análisis financiero y causalidad.
@@ -13,6 +26,7 @@ def get_chat_model():
       - OPENAI_API_KEY (obligatorio)
       - OPENAI_MODEL (por defecto 'gpt-4o')
       - OPENAI_TEMPERATURE (por defecto 0)
+    El cliente se cachea por (modelo, temperatura, api_key) a nivel de proceso.
     """
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -21,8 +35,4 @@ def get_chat_model():
     model = os.getenv("OPENAI_MODEL", "gpt-4o")  # ahora el grande por defecto
     temperature = float(os.getenv("OPENAI_TEMPERATURE", "0"))
 
-    return ChatOpenAI(
-        model=model,
-        temperature=temperature,
-        api_key=api_key
-    )
+    return _build_chat_model(model, temperature, api_key)
@@ -0,0 +1 @@
+# app/ledger/__init__.py
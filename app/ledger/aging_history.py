@@ -0,0 +1,124 @@
+# app/ledger/aging_history.py
+"""
+Historial diario de aging de CxC/CxP.
+
+El aging solo se podía calcular "al ref_date" contra el `monto_pagado` ACTUAL, así que
+"¿cómo estaba el aging el 30 de junio?" no tenía respuesta. Un job diario guarda la foto
+del día (una línea NDJSON por día y tipo, solo la del día nuevo) en AGING_HISTORY_DIR:
+
+    {"date": "2025-06-30", "kind": "cxc", "overdue": {"0_30": ¢, ...}, "current": ¢,
+     "no_due": ¢, "open_count": n, "by_entity": {"12": [corr, 0_30, 31_60, 61_90, 90+, s/f]}}
+
+(céntimos enteros; `by_entity` solo con --by-entity / AGING_HISTORY_BY_ENTITY=1).
+
+Los agentes usan `aging_as_of(kind, ref_date)`: si ref_date es pasado y existe la foto,
+se lee en O(1) de un índice por fecha (el archivo se relee solo si cambió); si no, se
+calcula con app.ledger.kernel (días pasados sobre saldos reconstruidos, app.ledger.balances). `aging_series(kind, start, end)` da la serie en O(días).
+
+Job (programarlo una vez al día, p. ej. al cierre):
+    python -m app.ledger.aging_history [--date 2025-06-30] [--by-entity]
+
+Configuración:
+  - AGING_HISTORY_DIR        carpeta (por defecto app/exports/aging_diario)
+  - AGING_HISTORY_BY_ENTITY  1/0 (por defecto 0)
+"""
+from __future__ import annotations
+
+import os
+import sys
+import argparse
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.serialization import append_ndjson, dumps, iter_ndjson
+
+AGING_HISTORY_DIR = Path(os.getenv("AGING_HISTORY_DIR",
+                                   str(Path(__file__).resolve().parent.parent / "exports" / "aging_diario")))
+AGING_HISTORY_BY_ENTITY = os.getenv("AGING_HISTORY_BY_ENTITY", "0") == "1"
+
+# -----------------------------
+# Lectura
+# -----------------------------
+_LOCK = threading.Lock()
+_INDEX: Dict[str, Any] = {}  # ruta → {"stamp": mtime, "days": {iso: registro}}
+
+def _path(kind: str, root: Path) -> Path:
+    return root / f"{kind}.ndjson"
+
+def _days(kind: str, root: Path = AGING_HISTORY_DIR) -> Dict[str, Dict[str, Any]]:
+    path = _path(kind, root)
+    try:
+        stamp = path.stat().st_mtime_ns
+    except OSError:
+        return {}
+    with _LOCK:
+        cur = _INDEX.get(str(path))
+        if cur is None or cur["stamp"] != stamp:
+            cur = _INDEX[str(path)] = {"stamp": stamp, "days": {r["date"]: r for r in iter_ndjson(path)}}
+        return cur["days"]
+
+def snapshot_on(kind: str, day: date, root: Path = AGING_HISTORY_DIR) -> Optional[Dict[str, Any]]:
+    return _days(kind, root).get(day.isoformat())
+
+def aging_series(kind: str, start: date, end: date, root: Path = AGING_HISTORY_DIR) -> List[Dict[str, Any]]:
+    """Fotos guardadas en [start, end], ordenadas por fecha."""
+    lo, hi = start.isoformat(), end.isoformat()
+    return [r for d, r in sorted(_days(kind, root).items()) if lo <= d <= hi]
+
+def aging_as_of(kind: str, ref_date: date, db=None) -> Dict[str, Any]:
+    """
+    Aging (formato de kernel.aging_totals, céntimos) a ref_date: foto histórica si ref_date es
+    pasado y existe; pasado sin foto → saldos reconstruidos desde los pagos (app.ledger.balances);
+    hoy o futuro → calendario de vencimientos de las partidas abiertas actuales.
+    """
+    if ref_date < date.today():
+        snap = snapshot_on(kind, ref_date)
+        if snap is not None:
+            return {k: snap[k] for k in ("overdue", "current", "no_due", "open_count")}
+        from app.ledger.balances import timeline
+        return timeline(kind, db=db).aging_at(ref_date)
+    from app.ledger.due_calendar import open_calendar
+    return open_calendar(kind, db=db).aging(ref_date)
+
+# -----------------------------
+# Job diario
+# -----------------------------
+def take_snapshot(kind: str, day: Optional[date] = None, by_entity: bool = AGING_HISTORY_BY_ENTITY,
+                  db=None, root: Path = AGING_HISTORY_DIR) -> Optional[Dict[str, Any]]:
+    """
+    Agrega la foto de `day` (hoy por defecto) si aún no existe; None si ya estaba.
+    Hoy usa los saldos actuales; un día pasado (backfill) los reconstruye desde los pagos.
+    """
+    from app.ledger import kernel as K
+    day = day or date.today()
+    if snapshot_on(kind, day, root) is not None:
+        return None
+    if day < date.today():
+        from app.ledger.balances import timeline
+        L = timeline(kind, db=db).ledger_at(day)
+    else:
+        from app.ledger.cache import open_ledger
+        L = open_ledger(kind, db=db)
+    rec: Dict[str, Any] = {"date": day.isoformat(), "kind": kind, **K.aging_totals(L, day)}
+    if by_entity:
+        rec["by_entity"] = {str(e): v for e, v in K.aging_by_entity(L, day).items()}
+    path = _path(kind, root)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as fh:
+        append_ndjson(fh, [rec])
+    return rec
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Foto diaria de aging CxC/CxP")
+    ap.add_argument("--date", help="día YYYY-MM-DD (por defecto hoy)")
+    ap.add_argument("--by-entity", action="store_true", default=AGING_HISTORY_BY_ENTITY)
+    args = ap.parse_args(argv)
+    day = date.fromisoformat(args.date) if args.date else None
+    written = {kind: take_snapshot(kind, day, by_entity=args.by_entity) is not None for kind in ("cxc", "cxp")}
+    print(dumps({"date": (day or date.today()).isoformat(), "written": written}), file=sys.stdout)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,244 @@
+# app/ledger/balances.py
+"""
+Saldos a cualquier fecha reconstruidos desde los eventos de pago (PagoCXC / PagoCXP).
+
+`monto - monto_pagado` es el saldo de HOY; para un mes pasado hace falta saber cuánto se
+había pagado a esa fecha. Aquí se carga una vez el libro completo (abiertas y pagadas) y
+los pagos ordenados por fecha como arreglos, y todo sale de sumas acumuladas:
+
+    tl = timeline("cxc")                     # BalanceTimeline (refresco incremental por marca de agua)
+    tl.outstanding_at(d)                     # Σ emitido hasta d − Σ pagado hasta d (2 búsquedas)
+    tl.outstanding_series(d0, d1)            # saldo diario en [d0, d1] (vectorizado)
+    tl.average_outstanding(d0, d1)           # promedio diario exacto (Decimal)
+    tl.issued_between(d0, d1)                # ventas/compras a crédito del rango
+    tl.aging_at(d)                           # aging como kernel.aging_totals, con saldos a d
+    tl.ledger_at(d)                          # partidas abiertas a d como LedgerArrays
+
+Si `monto_pagado` supera la suma de pagos registrados (cargas sin detalle de pagos), la
+diferencia se trata como un pago en `fecha_pago` de la factura, o en su emisión si no la
+tiene, para que el saldo de hoy coincida con `monto - monto_pagado`. Se asume que los
+pagos no son anteriores a la emisión de su factura.
+
+Como la caché de partidas abiertas (app.ledger.cache), `timeline()` se refresca por marca de
+agua: con solo facturas nuevas (ids mayores) y pagos nuevos, relee esas facturas y las que
+recibieron pagos (con todos sus pagos) y reemplaza solo sus eventos. Borrados, `bump()` o
+LEDGER_CACHE_MAX_AGE_S fuerzan la recarga completa.
+"""
+from __future__ import annotations
+
+import time
+import threading
+from datetime import date
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.ledger.items import _kind_columns, _session, to_cents, to_ordinal
+from app.ledger import kernel as K
+from app.ledger.kernel import LedgerArrays
+
+
+class BalanceTimeline:
+    __slots__ = ("ids", "amount_cents", "issue_ord", "due_ord", "entity_ids",
+                 "pay_inv", "pay_ord", "pay_cents", "_issue_sorted", "_issue_cum", "_pay_cum")
+
+    def __init__(self, ids: np.ndarray, amount_cents: np.ndarray, issue_ord: np.ndarray, due_ord: np.ndarray,
+                 entity_ids: np.ndarray, pay_inv: np.ndarray, pay_ord: np.ndarray, pay_cents: np.ndarray):
+        self.ids = ids                  # id de factura por posición; pay_inv apunta a posiciones
+        self.amount_cents = amount_cents
+        self.issue_ord = issue_ord
+        self.due_ord = due_ord
+        self.entity_ids = entity_ids
+        order = np.argsort(pay_ord, kind="stable")      # pagos ordenados por fecha
+        self.pay_inv, self.pay_ord, self.pay_cents = pay_inv[order], pay_ord[order], pay_cents[order]
+        iorder = np.argsort(issue_ord, kind="stable")
+        self._issue_sorted = issue_ord[iorder]
+        self._issue_cum = np.concatenate(([0], np.cumsum(amount_cents[iorder])))
+        self._pay_cum = np.concatenate(([0], np.cumsum(self.pay_cents)))
+
+    def __len__(self) -> int:
+        return int(self.amount_cents.shape[0])
+
+    # ---- Totales ----
+    def _issued_upto(self, ords: np.ndarray) -> np.ndarray:
+        return self._issue_cum[np.searchsorted(self._issue_sorted, ords, side="right")]
+
+    def _paid_upto(self, ords: np.ndarray) -> np.ndarray:
+        return self._pay_cum[np.searchsorted(self.pay_ord, ords, side="right")]
+
+    def outstanding_at(self, day: date) -> int:
+        """Saldo total (céntimos) al cierre de `day`."""
+        d = np.array([day.toordinal()])
+        return int((self._issued_upto(d) - self._paid_upto(d))[0])
+
+    def outstanding_series(self, start: date, end: date) -> np.ndarray:
+        """Saldo al cierre de cada día de [start, end] (céntimos int64)."""
+        days = np.arange(start.toordinal(), end.toordinal() + 1, dtype=np.int64)
+        return self._issued_upto(days) - self._paid_upto(days)
+
+    def average_outstanding(self, start: date, end: date) -> Decimal:
+        """Promedio diario exacto del saldo en [start, end], en céntimos."""
+        series = self.outstanding_series(start, end)
+        if series.size == 0:
+            return Decimal(0)
+        return Decimal(int(series.sum())) / Decimal(int(series.size))
+
+    def issued_between(self, start: date, end: date) -> int:
+        """Σ monto (céntimos) de lo emitido en [start, end]."""
+        lo, hi = self._issued_upto(np.array([start.toordinal() - 1, end.toordinal()]))
+        return int(hi - lo)
+
+    # ---- Por factura ----
+    def balances_at(self, day: date) -> Tuple[np.ndarray, np.ndarray]:
+        """(índices de facturas emitidas hasta `day` con saldo > 0, saldos en céntimos)."""
+        d = day.toordinal()
+        k = int(np.searchsorted(self.pay_ord, d, side="right"))
+        paid = np.zeros(len(self), dtype=np.int64)
+        np.add.at(paid, self.pay_inv[:k], self.pay_cents[:k])   # suma entera exacta
+        bal = self.amount_cents - paid
+        idx = np.flatnonzero((self.issue_ord <= d) & (bal > 0))
+        return idx, bal[idx]
+
+    def ledger_at(self, day: date) -> LedgerArrays:
+        """Partidas abiertas al cierre de `day` como LedgerArrays (sirven todas las funciones del kernel)."""
+        idx, bal = self.balances_at(day)
+        return LedgerArrays(self.ids[idx], self.entity_ids[idx], bal, np.zeros_like(bal), self.due_ord[idx],
+                            self.issue_ord[idx], [None] * int(idx.size))
+
+    def aging_at(self, day: date) -> Dict[str, Any]:
+        """Igual que kernel.aging_totals pero con los saldos que había al cierre de `day`."""
+        return K.aging_totals(self.ledger_at(day), day)
+
+# -----------------------------
+# Carga
+# -----------------------------
+def _payment_model(kind: str):
+    from app.ledger.cache import _payment_columns
+    return _payment_columns(kind)
+
+def _read_rows(kind: str, s, ids: Optional[List[int]] = None, after_id: Optional[int] = None):
+    """(facturas, pagos) de todas o solo de `ids` ∪ {id > after_id}, en 2 consultas."""
+    from sqlalchemy import or_, select
+    F, id_col, entity_col = _kind_columns(kind)
+    P, _, inv_fk = _payment_model(kind)
+    inv_stmt = select(id_col, entity_col, F.monto, F.monto_pagado, F.fecha_emision, F.fecha_limite, F.fecha_pago)
+    pay_stmt = select(inv_fk, P.fecha, P.monto)
+    if ids is not None or after_id is not None:
+        def _subset(col):
+            return or_(*([col.in_(ids)] if ids else []), *([col > after_id] if after_id is not None else []))
+        inv_stmt, pay_stmt = inv_stmt.where(_subset(id_col)), pay_stmt.where(_subset(inv_fk))
+    inv = s.execute(inv_stmt.execution_options(yield_per=20000)).all()
+    pays = s.execute(pay_stmt.execution_options(yield_per=20000)).all()
+    return inv, pays
+
+def _arrays(inv, pays) -> Tuple[np.ndarray, ...]:
+    """Columnas de facturas + eventos de pago (índices locales a `inv`), con el pago sintético del residual."""
+    pos = {row[0]: i for i, row in enumerate(inv)}
+    n = len(inv)
+    ids = np.fromiter((r[0] for r in inv), dtype=np.int64, count=n)
+    amount = np.fromiter((to_cents(r[2]) for r in inv), dtype=np.int64, count=n)
+    paid_now = np.fromiter((to_cents(r[3]) for r in inv), dtype=np.int64, count=n)
+    issue = np.fromiter((to_ordinal(r[4]) or 0 for r in inv), dtype=np.int64, count=n)
+    due = np.fromiter((to_ordinal(r[5]) or 0 for r in inv), dtype=np.int64, count=n)
+    ents = np.fromiter((-1 if r[1] is None else r[1] for r in inv), dtype=np.int64, count=n)
+
+    pay_inv, pay_ord, pay_cents = [], [], []
+    for fid, fecha, monto in pays:
+        i = pos.get(fid)
+        if i is None:
+            continue
+        pay_inv.append(i)
+        pay_ord.append(to_ordinal(fecha) or to_ordinal(inv[i][6]) or int(issue[i]))
+        pay_cents.append(to_cents(monto))
+    pay_inv_a = np.asarray(pay_inv, dtype=np.int64)
+    pay_cents_a = np.asarray(pay_cents, dtype=np.int64)
+
+    # monto_pagado sin pagos que lo respalden → pago sintético en fecha_pago (o emisión)
+    recorded = np.zeros(n, dtype=np.int64)
+    np.add.at(recorded, pay_inv_a, pay_cents_a)
+    residual = paid_now - recorded
+    extra = np.flatnonzero(residual > 0)
+    extra_ord = [to_ordinal(inv[i][6]) or int(issue[i]) for i in extra.tolist()]
+
+    return (ids, amount, issue, due, ents,
+            np.concatenate([pay_inv_a, extra]).astype(np.int64),
+            np.concatenate([np.asarray(pay_ord, dtype=np.int64), np.asarray(extra_ord, dtype=np.int64)]),
+            np.concatenate([pay_cents_a, residual[extra]]).astype(np.int64))
+
+def load_timeline(kind: str, db=None) -> BalanceTimeline:
+    """Todas las facturas de `kind` (también las pagadas) + sus pagos, en 2 consultas."""
+    with _session(db) as s:
+        inv, pays = _read_rows(kind, s)
+    return BalanceTimeline(*_arrays(inv, pays))
+
+def _apply_delta(tl: BalanceTimeline, replaced: np.ndarray, inv, pays) -> BalanceTimeline:
+    """Timeline nuevo: quita las facturas `replaced` (posiciones) y sus eventos, agrega `inv` releídas."""
+    keep = np.ones(len(tl), dtype=bool)
+    keep[replaced] = False
+    new_pos = np.cumsum(keep) - 1                     # posición vieja → nueva (solo las que quedan)
+    ev = keep[tl.pay_inv]
+    ids, amount, issue, due, ents, p_inv, p_ord, p_cents = _arrays(inv, pays)
+    base = int(keep.sum())
+    cat = np.concatenate
+    return BalanceTimeline(
+        cat([tl.ids[keep], ids]), cat([tl.amount_cents[keep], amount]), cat([tl.issue_ord[keep], issue]),
+        cat([tl.due_ord[keep], due]), cat([tl.entity_ids[keep], ents]),
+        cat([new_pos[tl.pay_inv[ev]], p_inv + base]), cat([tl.pay_ord[ev], p_ord]), cat([tl.pay_cents[ev], p_cents]),
+    )
+
+# -----------------------------
+# Instancias de proceso (refresco por marca de agua)
+# -----------------------------
+class _Memo:
+    __slots__ = ("token", "epoch", "tables", "tl", "loaded_at")
+
+    def __init__(self, token: str, epoch: int, tables: Dict[str, List], tl: BalanceTimeline):
+        self.token, self.epoch, self.tables, self.tl = token, epoch, tables, tl
+        self.loaded_at = time.monotonic()
+
+
+_MEMO: Dict[Tuple[str, str], _Memo] = {}
+_LOCK = threading.Lock()
+
+def _incremental(kind: str, s, memo: _Memo, tables: Dict[str, List]) -> Optional[BalanceTimeline]:
+    """Solo facturas nuevas y pagos nuevos: relee esas facturas y las pagadas; None si no aplica."""
+    from sqlalchemy import func, select
+    from app.ledger.cache import _new_invoices, _paid_invoice_ids
+    (old_max, old_count), (new_max, new_count) = memo.tables[f"factura_{kind}"][:2], tables[f"factura_{kind}"][:2]
+    (old_pay, old_pays), (new_pay, new_pays) = memo.tables[f"pago_{kind}"][:2], tables[f"pago_{kind}"][:2]
+    if new_max < old_max or new_pay < old_pay or new_count - old_count != _new_invoices(kind, s, old_max):
+        return None
+    _, pay_id, _ = _payment_model(kind)
+    if new_pays - old_pays != int(s.execute(select(func.count(pay_id)).where(pay_id > old_pay)).scalar() or 0):
+        return None  # pagos borrados
+    touched = [i for i in _paid_invoice_ids(kind, s, old_pay) if i <= old_max] if new_pay > old_pay else []
+    if new_max == old_max and not touched:
+        return memo.tl
+    inv, pays = _read_rows(kind, s, ids=touched, after_id=old_max)
+    replaced = np.flatnonzero(np.isin(memo.tl.ids, np.asarray(touched, dtype=np.int64)))
+    return _apply_delta(memo.tl, replaced, inv, pays)
+
+def timeline(kind: str, db=None) -> BalanceTimeline:
+    """BalanceTimeline al día con la base (una consulta de marca de agua, cacheada por data_version)."""
+    from app import data_version as DV
+    from app.ledger.cache import LEDGER_CACHE_MAX_AGE_S
+    from app.ledger.items import _bind_key
+    with _session(db) as s:
+        dv = DV.data_version(s)
+        epoch, key = DV.epoch(), (kind, _bind_key(s))
+        with _LOCK:
+            memo = _MEMO.get(key)
+            if memo is not None and memo.token == dv["token"]:
+                return memo.tl
+        tables = {t: dv["tables"][t] for t in (f"factura_{kind}", f"pago_{kind}")}
+        tl = None
+        if memo is not None and memo.epoch == epoch and time.monotonic() - memo.loaded_at <= LEDGER_CACHE_MAX_AGE_S:
+            tl = _incremental(kind, s, memo, tables)
+        # la carga corre fuera del lock: las lecturas de otros tipos/bases no esperan
+        fresh = _Memo(dv["token"], epoch, tables, tl if tl is not None else load_timeline(kind, db=s))
+        if tl is not None:
+            fresh.loaded_at = memo.loaded_at  # la antigüedad cuenta desde la última carga completa
+        with _LOCK:
+            _MEMO[key] = fresh
+        return fresh.tl
@@ -0,0 +1,249 @@
+# app/ledger/cache.py
+"""
+Caché de proceso de las partidas abiertas CxC/CxP en formato columnar (LedgerArrays).
+
+Cada pregunta volvía a leer todo el libro abierto desde Postgres aunque nada hubiera cambiado.
+Aquí se guarda una copia por (kind, base de datos) y, antes de servirla, se compara una
+marca de agua barata (app.data_version, una sola consulta de agregados indexados):
+
+    (max id factura, count facturas, max id pago, max fecha pago)
+
+  - igual            → hit (sin leer filas)
+  - solo crecieron ids de facturas/pagos → refresco INCREMENTAL: facturas nuevas (id > max
+    anterior) + facturas tocadas por pagos nuevos se releen y reemplazan en los arreglos
+  - cualquier otra cosa (borrados, ids que retroceden) → recarga completa
+
+Ediciones en sitio sin pago nuevo (p. ej. corregir `monto`) no mueven la marca: para eso
+están `invalidate()` y LEDGER_CACHE_MAX_AGE_S (recarga completa por antigüedad).
+
+Configuración:
+  - LEDGER_SOURCE           "cache" (por defecto), "snapshot" (Arrow compartido entre procesos,
+                            ver app.ledger.snapshot) o "db" (siempre directo)
+  - LEDGER_CACHE            1/0 (por defecto 1); con 0 equivale a LEDGER_SOURCE=db
+  - LEDGER_CACHE_MAX_MB     memoria máxima de todas las entradas, LRU (por defecto 256)
+  - LEDGER_CACHE_CHECK_S    segundos sin volver a consultar la marca de agua (por defecto 2)
+  - LEDGER_CACHE_MAX_AGE_S  antigüedad máxima antes de recargar completo (por defecto 3600)
+
+Cada entrada lleva además sus calendarios de vencimiento (app.ledger.due_calendar), que
+en un refresco incremental se actualizan con la diferencia en vez de reconstruirse.
+
+`ledger_cache().stats()` expone hits/misses/refrescos/tiempos; el router lo deja en
+`_meta["ledger_cache"]`.
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from app.ledger.items import _bind_key, _kind_columns, _session, open_items_query
+from app.ledger.kernel import LedgerArrays
+
+LEDGER_CACHE = os.getenv("LEDGER_CACHE", "1") != "0"
+LEDGER_SOURCE = os.getenv("LEDGER_SOURCE", "cache" if LEDGER_CACHE else "db").strip().lower()
+LEDGER_CACHE_MAX_MB = float(os.getenv("LEDGER_CACHE_MAX_MB", "256"))
+LEDGER_CACHE_CHECK_S = float(os.getenv("LEDGER_CACHE_CHECK_S", "2"))
+LEDGER_CACHE_MAX_AGE_S = float(os.getenv("LEDGER_CACHE_MAX_AGE_S", "3600"))
+
+Watermark = Tuple[int, int, int, Any]  # (max_id, count, max_pago_id, max_pago_fecha)
+
+# -----------------------------
+# Consultas de marca de agua
+# -----------------------------
+def _payment_columns(kind: str):
+    from app.models import PagoCXC, PagoCXP
+    if kind == "cxc":
+        return PagoCXC, PagoCXC.id_pago_cxc, PagoCXC.id_cxc
+    if kind == "cxp":
+        return PagoCXP, PagoCXP.id_pago_cxp, PagoCXP.id_cxp
+    raise ValueError(f"kind desconocido: {kind!r} (use 'cxc' o 'cxp')")
+
+def read_watermark(kind: str, db) -> Watermark:
+    """Marca de facturas + pagos de `kind` (app.data_version): una consulta de agregados."""
+    from app.data_version import table_watermarks
+    wm = table_watermarks(db, (f"factura_{kind}", f"pago_{kind}"))
+    max_id, count = wm[f"factura_{kind}"]
+    max_pay, _, last_pay = wm[f"pago_{kind}"]
+    return max_id, count, max_pay, last_pay
+
+def _paid_invoice_ids(kind: str, db, after_payment_id: int) -> list:
+    from sqlalchemy import select
+    _, pay_id, inv_fk = _payment_columns(kind)
+    stmt = select(inv_fk).where(pay_id > after_payment_id).distinct()
+    return [i for (i,) in db.execute(stmt) if i is not None]
+
+def _new_invoices(kind: str, db, after_id: int) -> int:
+    from sqlalchemy import func, select
+    _, inv_id, _ = _kind_columns(kind)
+    return int(db.execute(select(func.count(inv_id)).where(inv_id > after_id)).scalar() or 0)
+
+def _approx_nbytes(L: LedgerArrays) -> int:
+    return L.nbytes + sum(sys.getsizeof(n) for n in L.numbers) + 8 * len(L.numbers)
+
+# -----------------------------
+# Caché
+# -----------------------------
+class _Entry:
+    __slots__ = ("ledger", "watermark", "nbytes", "loaded_at", "checked_at", "calendars")
+
+    def __init__(self, ledger: LedgerArrays, watermark: Watermark):
+        self.ledger = ledger
+        self.watermark = watermark
+        self.nbytes = _approx_nbytes(ledger)
+        self.loaded_at = self.checked_at = time.monotonic()
+        self.calendars: Dict[Optional[int], Any] = {}  # entidad (None = todas) → DueCalendar
+
+
+class OpenItemsCache:
+    def __init__(self, max_bytes: int = int(LEDGER_CACHE_MAX_MB * 1024 * 1024),
+                 check_s: float = LEDGER_CACHE_CHECK_S, max_age_s: float = LEDGER_CACHE_MAX_AGE_S):
+        self.max_bytes = max_bytes
+        self.check_s = check_s
+        self.max_age_s = max_age_s
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._lock = threading.RLock()
+        self._stats = {"hits": 0, "misses": 0, "incremental": 0, "full_loads": 0, "evictions": 0,
+                       "last_refresh_ms": 0.0, "refresh_ms_total": 0.0}
+
+    # ---- API ----
+    def get(self, kind: str, db=None) -> LedgerArrays:
+        """Partidas abiertas de `kind` (ordenadas por id), servidas desde caché si la marca no cambió."""
+        with _session(db) as s, self._lock:
+            key = (kind, _bind_key(s))
+            entry = self._entries.get(key)
+            now = time.monotonic()
+            if entry is not None and now - entry.loaded_at > self.max_age_s:
+                entry = None
+            if entry is not None and now - entry.checked_at < self.check_s:
+                return self._hit(key, entry)
+            wm = read_watermark(kind, s)
+            if entry is not None and wm == entry.watermark:
+                entry.checked_at = now
+                return self._hit(key, entry)
+
+            self._stats["misses"] += 1
+            t0 = time.perf_counter()
+            delta = self._incremental(kind, s, entry, wm) if entry is not None else None
+            if delta is None:
+                ledger = LedgerArrays.from_rows(s.execute(open_items_query(kind)
+                                                          .execution_options(yield_per=20000))).sorted_by_id()
+                new_entry = _Entry(ledger, wm)
+                self._stats["full_loads"] += 1
+            else:
+                ledger, removed, added = delta
+                new_entry = _Entry(ledger, wm)
+                # calendarios de vencimiento: solo se aplica la diferencia
+                new_entry.calendars = {e: cal.apply(removed, added, entity_id=e) for e, cal in entry.calendars.items()}
+                self._stats["incremental"] += 1
+            self._timing(time.perf_counter() - t0)
+            self._store(key, new_entry)
+            return ledger
+
+    def calendar(self, kind: str, db=None, entity_id: Optional[int] = None):
+        """DueCalendar (app.ledger.due_calendar) de las partidas abiertas, mantenido junto a ellas."""
+        from app.ledger.due_calendar import DueCalendar
+        with _session(db) as s, self._lock:
+            ledger = self.get(kind, db=s)
+            entry = self._entries.get((kind, _bind_key(s)))
+            if entry is None or entry.ledger is not ledger:
+                return DueCalendar.from_ledger(ledger, entity_id)  # no retenida (no cabe en memoria)
+            cal = entry.calendars.get(entity_id)
+            if cal is None:
+                cal = entry.calendars[entity_id] = DueCalendar.from_ledger(ledger, entity_id)
+            return cal
+
+    def invalidate(self, kind: Optional[str] = None) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if kind is None or k[0] == kind]:
+                del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            out = dict(self._stats)
+            out["entries"] = {f"{k[0]}@{k[1]}": {"rows": len(e.ledger), "bytes": e.nbytes,
+                                                  "watermark": list(e.watermark[:3]),
+                                                  "calendars": len(e.calendars)}
+                              for k, e in self._entries.items()}
+            out["bytes"] = sum(e.nbytes for e in self._entries.values())
+            out["max_bytes"] = self.max_bytes
+        return out
+
+    # ---- Internos ----
+    def _hit(self, key, entry: _Entry) -> LedgerArrays:
+        self._stats["hits"] += 1
+        self._entries.move_to_end(key)
+        return entry.ledger
+
+    def _timing(self, seconds: float) -> None:
+        ms = round(seconds * 1000, 2)
+        self._stats["last_refresh_ms"] = ms
+        self._stats["refresh_ms_total"] = round(self._stats["refresh_ms_total"] + ms, 2)
+
+    def _incremental(self, kind: str, db, entry: _Entry, wm: Watermark):
+        """
+        Aplica solo lo nuevo: (libro, partidas quitadas, partidas agregadas); None si la marca
+        no admite un refresco incremental.
+        """
+        old_max, old_count, old_pay, _ = entry.watermark
+        new_max, new_count, new_pay, _ = wm
+        if new_max < old_max or new_pay < old_pay or new_count - old_count != _new_invoices(kind, db, old_max):
+            return None  # borrados o ids que retroceden: no se puede reconciliar por diferencia
+        # facturas ya retenidas con pagos nuevos (las nuevas entran completas por after_id)
+        touched = [i for i in _paid_invoice_ids(kind, db, old_pay) if i <= old_max] if new_pay > old_pay else []
+        parts, removed = [], []
+        L = entry.ledger
+        if touched:
+            hit = np.isin(L.ids, np.asarray(touched, dtype=np.int64))
+            parts.append(L.take(np.flatnonzero(~hit)))
+            removed.append(L.take(np.flatnonzero(hit)))
+            parts.append(LedgerArrays.from_rows(db.execute(open_items_query(kind, ids=touched))))
+        else:
+            parts.append(L)
+        if new_max > old_max:
+            parts.append(LedgerArrays.from_rows(db.execute(open_items_query(kind, after_id=old_max))))
+        return LedgerArrays.concat(parts).sorted_by_id(), removed, parts[1:]
+
+    def _store(self, key, entry: _Entry) -> None:
+        self._entries.pop(key, None)
+        if entry.nbytes > self.max_bytes:
+            return  # no cabe ni sola: se sirve sin retener
+        self._entries[key] = entry
+        while sum(e.nbytes for e in self._entries.values()) > self.max_bytes:
+            self._entries.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
+# -----------------------------
+# Instancia de proceso
+# -----------------------------
+_CACHE: Optional[OpenItemsCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def ledger_cache() -> OpenItemsCache:
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = OpenItemsCache()
+        return _CACHE
+
+def set_ledger_source(source: str) -> None:
+    """Cambia la fuente en caliente (p. ej. workers de batch en modo proceso → "snapshot")."""
+    global LEDGER_SOURCE
+    if source not in ("cache", "snapshot", "db"):
+        raise ValueError(f"fuente desconocida: {source!r} (use 'cache', 'snapshot' o 'db')")
+    LEDGER_SOURCE = source
+
+def open_ledger(kind: str, db=None) -> LedgerArrays:
+    """Punto de lectura de agentes y repo según LEDGER_SOURCE (cache | snapshot | db)."""
+    if LEDGER_SOURCE == "snapshot":
+        from app.ledger.snapshot import snapshot_ledger
+        return snapshot_ledger(kind, db=db)
+    if LEDGER_SOURCE == "db":
+        from app.ledger.kernel import load_ledger
+        return load_ledger(kind, db=db)
+    return ledger_cache().get(kind, db=db)
@@ -0,0 +1,157 @@
+# app/ledger/due_calendar.py
+"""
+Calendario de vencimientos: saldo abierto agregado por `fecha_limite`, con sumas prefijas.
+
+El aging y los totales de "vence pronto" solo dependen de cómo se reparte el saldo abierto
+por fecha de vencimiento, pero recorrían todas las partidas para cada ref_date. Aquí se
+agregan una vez por día de vencimiento (unos miles de fechas) y cada consulta es un par
+de búsquedas binarias:
+
+    cal = open_calendar("cxc")                   # DueCalendar de las partidas abiertas
+    cal.aging(ref)                               # == kernel.aging_totals(L, ref)
+    cal.between(d0, d1)                          # (céntimos, n) que vencen en [d0, d1]
+    cal.due_within(ref, 7)                       # lo que vence en la próxima semana
+    cal.by_day(d0, d1)                           # [(fecha, céntimos, n)] por día de vencimiento
+    open_calendar("cxp", entity_id=12)           # lo mismo para una entidad
+
+La caché de partidas (app.ledger.cache) lo mantiene incrementalmente: en un refresco
+incremental resta las partidas reemplazadas y suma las releídas (`apply`), sin recorrer
+el libro completo.
+"""
+from __future__ import annotations
+
+import threading
+from datetime import date
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.ledger.items import AGING_KEYS
+from app.ledger.kernel import _AGING_EDGES, LedgerArrays
+
+
+def _aggregate(L: LedgerArrays, entity_id: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray, int, int]:
+    """(días, céntimos, conteos) por fecha de vencimiento + (céntimos, n) sin fecha, solo saldo > 0."""
+    out = L.outstanding_cents
+    mask = out > 0
+    if entity_id is not None:
+        mask &= L.entity_ids == int(entity_id)
+    due = L.due_ord[mask]
+    out = out[mask]
+    no_due = due == 0
+    days, inv = np.unique(due[~no_due], return_inverse=True)
+    cents = np.zeros(days.size, dtype=np.int64)
+    counts = np.zeros(days.size, dtype=np.int64)
+    np.add.at(cents, inv, out[~no_due])
+    np.add.at(counts, inv, 1)
+    return days.astype(np.int64), cents, counts, int(out[no_due].sum()), int(no_due.sum())
+
+
+class DueCalendar:
+    __slots__ = ("days", "cents", "counts", "no_due_cents", "no_due_count", "_cum_cents", "_cum_counts")
+
+    def __init__(self, days: np.ndarray, cents: np.ndarray, counts: np.ndarray, no_due_cents: int, no_due_count: int):
+        self.days = days            # ordinales de vencimiento, ascendentes y únicos
+        self.cents = cents
+        self.counts = counts
+        self.no_due_cents = no_due_cents
+        self.no_due_count = no_due_count
+        self._cum_cents = np.concatenate(([0], np.cumsum(cents))).astype(np.int64)
+        self._cum_counts = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    @classmethod
+    def from_ledger(cls, L: LedgerArrays, entity_id: Optional[int] = None) -> "DueCalendar":
+        return cls(*_aggregate(L, entity_id))
+
+    def __len__(self) -> int:
+        return int(self.days.shape[0])
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.days.nbytes + self.cents.nbytes + self.counts.nbytes
+                   + self._cum_cents.nbytes + self._cum_counts.nbytes)
+
+    # ---- Mantenimiento ----
+    def apply(self, removed: Sequence[LedgerArrays] = (), added: Sequence[LedgerArrays] = (),
+              entity_id: Optional[int] = None) -> "DueCalendar":
+        """Calendario nuevo restando `removed` y sumando `added` (el actual no se modifica)."""
+        parts = [(p, -1) for p in removed if len(p)] + [(p, 1) for p in added if len(p)]
+        if not parts:
+            return self
+        aggs = [(_aggregate(p, entity_id), sign) for p, sign in parts]
+        days = np.unique(np.concatenate([self.days] + [a[0] for a, _ in aggs]))
+        cents = np.zeros(days.size, dtype=np.int64)
+        counts = np.zeros(days.size, dtype=np.int64)
+        pos = np.searchsorted(days, self.days)
+        cents[pos] += self.cents
+        counts[pos] += self.counts
+        no_due_cents, no_due_count = self.no_due_cents, self.no_due_count
+        for (d, c, n, nd_c, nd_n), sign in aggs:
+            pos = np.searchsorted(days, d)
+            cents[pos] += sign * c
+            counts[pos] += sign * n
+            no_due_cents += sign * nd_c
+            no_due_count += sign * nd_n
+        keep = counts > 0
+        return DueCalendar(days[keep], cents[keep], counts[keep], no_due_cents, no_due_count)
+
+    # ---- Consultas ----
+    def _upto(self, ords) -> Tuple[np.ndarray, np.ndarray]:
+        """(céntimos, n) acumulados con vencimiento <= cada ordinal."""
+        k = np.searchsorted(self.days, ords, side="right")
+        return self._cum_cents[k], self._cum_counts[k]
+
+    def between(self, start: date, end: date) -> Tuple[int, int]:
+        """(céntimos, n) de partidas que vencen en [start, end]."""
+        cents, counts = self._upto(np.array([start.toordinal() - 1, end.toordinal()]))
+        return int(cents[1] - cents[0]), int(counts[1] - counts[0])
+
+    def due_within(self, ref: date, max_days: int) -> Tuple[int, int]:
+        """Igual que kernel.due_soon pero solo totales: vencen en [ref, ref + max_days]."""
+        lo = ref.toordinal()
+        cents, counts = self._upto(np.array([lo - 1, lo + int(max_days)]))
+        return int(cents[1] - cents[0]), int(counts[1] - counts[0])
+
+    def by_day(self, start: date, end: date) -> List[Tuple[date, int, int]]:
+        lo = int(np.searchsorted(self.days, start.toordinal(), side="left"))
+        hi = int(np.searchsorted(self.days, end.toordinal(), side="right"))
+        return [(date.fromordinal(d), c, n) for d, c, n in
+                zip(self.days[lo:hi].tolist(), self.cents[lo:hi].tolist(), self.counts[lo:hi].tolist())]
+
+    def aging(self, ref: date) -> Dict[str, Any]:
+        """Equivalente exacto de kernel.aging_totals: atraso >= e  ⇔  vencimiento <= ref - e."""
+        cents, counts = self._upto(ref.toordinal() - _AGING_EDGES)
+        total = int(self._cum_cents[-1])
+        sums = [total - int(cents[0])] + [int(cents[i] - cents[i + 1]) for i in range(len(cents) - 1)] + [int(cents[-1])]
+        return {
+            "overdue": dict(zip(AGING_KEYS, sums[1:])),
+            "current": sums[0],
+            "no_due": self.no_due_cents,
+            "open_count": int(self._cum_counts[-1]) + self.no_due_count,
+        }
+
+
+# -----------------------------
+# Punto de lectura
+# -----------------------------
+_BUILT: Dict[Tuple[str, Optional[int]], Tuple[LedgerArrays, DueCalendar]] = {}
+_LOCK = threading.Lock()
+
+def calendar_for(kind: str, L: LedgerArrays, entity_id: Optional[int] = None) -> DueCalendar:
+    """Calendario de un libro ya cargado, reutilizado mientras sea el mismo objeto."""
+    key = (kind, entity_id)
+    with _LOCK:
+        hit = _BUILT.get(key)
+        if hit is not None and hit[0] is L:
+            return hit[1]
+    cal = DueCalendar.from_ledger(L, entity_id)
+    with _LOCK:
+        _BUILT[key] = (L, cal)
+    return cal
+
+def open_calendar(kind: str, db=None, entity_id: Optional[int] = None) -> DueCalendar:
+    """Calendario de las partidas abiertas según LEDGER_SOURCE (mantenido por la caché si aplica)."""
+    from app.ledger import cache
+    if cache.LEDGER_SOURCE == "cache":
+        return cache.ledger_cache().calendar(kind, db=db, entity_id=entity_id)
+    return calendar_for(kind, cache.open_ledger(kind, db=db), entity_id)
@@ -0,0 +1,161 @@
+# app/ledger/issued_index.py
+"""
+Índice diario de montos emitidos (ventas/compras a crédito) con sumas prefijas.
+
+Los denominadores de DSO/DPO (Σ monto por fecha_emision en una ventana) se recalculaban
+con un recorrido de facturas en cada llamada, y ventanas arbitrarias ("últimos 30 días",
+"del 5 al 20 de octubre") no tenían soporte. Aquí se agrega una vez por día de emisión
+(GROUP BY en la base) y cualquier total [inicio, fin] son dos búsquedas binarias:
+
+    idx = issued_index("cxc")                        # total por día
+    idx.total(date(2025, 10, 5), date(2025, 10, 20)) # (céntimos, n facturas)
+    issued_index("cxc", by="entity").total(d0, d1, key=12)
+    issued_index("cxp", by="punto_venta").total(d0, d1, key=3)
+
+Refresco incremental con la marca de agua de la tabla de facturas (app.data_version):
+si solo llegaron facturas nuevas (ids mayores), se agregan solo esas y se fusionan con
+los días existentes; si hubo borrados, recarga completa. Como en la caché de partidas,
+las ediciones en sitio de `monto` requieren `invalidate()` (lo llama data_version.bump()).
+"""
+from __future__ import annotations
+
+import threading
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from app.ledger.items import _kind_columns, _session, to_cents
+
+_DIMENSIONS = ("entity", "punto_venta")
+
+
+def _as_date(value) -> date:
+    return value.date() if isinstance(value, datetime) else value
+
+
+class DailyTotals:
+    __slots__ = ("days", "cents", "counts", "_cum_cents", "_cum_counts")
+
+    def __init__(self, days: np.ndarray, cents: np.ndarray, counts: np.ndarray):
+        self.days = days            # ordinales de emisión, ascendentes y únicos
+        self.cents = cents
+        self.counts = counts
+        self._cum_cents = np.concatenate(([0], np.cumsum(cents))).astype(np.int64)
+        self._cum_counts = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+
+    def __len__(self) -> int:
+        return int(self.days.shape[0])
+
+    def merge(self, days: np.ndarray, cents: np.ndarray, counts: np.ndarray) -> "DailyTotals":
+        """Serie nueva sumando (days, cents, counts) a la actual (que no se modifica)."""
+        all_days = np.union1d(self.days, days)
+        out_c = np.zeros(all_days.size, dtype=np.int64)
+        out_n = np.zeros(all_days.size, dtype=np.int64)
+        for d, c, n in ((self.days, self.cents, self.counts), (days, cents, counts)):
+            pos = np.searchsorted(all_days, d)
+            np.add.at(out_c, pos, c)
+            np.add.at(out_n, pos, n)
+        return DailyTotals(all_days, out_c, out_n)
+
+    def total(self, start: date, end: date) -> Tuple[int, int]:
+        """(céntimos, n) emitidos en [start, end] (días completos)."""
+        k = np.searchsorted(self.days, [_as_date(start).toordinal() - 1, _as_date(end).toordinal()], side="right")
+        return int(self._cum_cents[k[1]] - self._cum_cents[k[0]]), int(self._cum_counts[k[1]] - self._cum_counts[k[0]])
+
+
+_EMPTY = DailyTotals(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64))
+
+
+def _group_column(kind: str, by: Optional[str]):
+    F, _, entity_col = _kind_columns(kind)
+    if by is None:
+        return None
+    if by == "entity":
+        return entity_col
+    if by == "punto_venta":
+        return F.id_punto_venta
+    raise ValueError(f"dimensión desconocida: {by!r} (use None, {', '.join(map(repr, _DIMENSIONS))})")
+
+def _daily_rows(kind: str, db, by: Optional[str], after_id: Optional[int] = None) -> Dict[Any, Tuple[np.ndarray, ...]]:
+    """{clave: (días, céntimos, conteos)} agregados en la base por (clave, día de emisión)."""
+    from sqlalchemy import extract, func, select
+    F, id_col, _ = _kind_columns(kind)
+    dim = _group_column(kind, by)
+    y, m, d = (extract(p, F.fecha_emision) for p in ("year", "month", "day"))
+    keys = ([dim] if dim is not None else []) + [y, m, d]
+    stmt = select(*keys, func.sum(F.monto), func.count(id_col)).group_by(*keys)
+    if after_id is not None:
+        stmt = stmt.where(id_col > after_id)
+    acc: Dict[Any, Tuple[list, list, list]] = {}
+    for row in db.execute(stmt):
+        key = row[0] if dim is not None else None
+        yy, mm, dd, amount, count = row[-5:]
+        if yy is None:
+            continue
+        days, cents, counts = acc.setdefault(key, ([], [], []))
+        days.append(date(int(yy), int(mm), int(dd)).toordinal())
+        cents.append(to_cents(amount))
+        counts.append(int(count or 0))
+    out = {}
+    for key, (days, cents, counts) in acc.items():
+        order = np.argsort(np.asarray(days, dtype=np.int64), kind="stable")
+        out[key] = tuple(np.asarray(a, dtype=np.int64)[order] for a in (days, cents, counts))
+    return out
+
+
+class IssuedIndex:
+    def __init__(self, kind: str, by: Optional[str] = None):
+        _group_column(kind, by)  # valida kind/dimensión
+        self.kind = kind
+        self.by = by
+        self.series: Dict[Any, DailyTotals] = {}
+        self.watermark: Optional[Tuple[int, int]] = None
+
+    def total(self, start: date, end: date, key: Any = None) -> Tuple[int, int]:
+        """(céntimos, n) en [start, end]; con `by`, de la entidad / punto de venta `key`."""
+        return self.series.get(key, _EMPTY).total(start, end)
+
+    def keys(self) -> Iterable[Any]:
+        return self.series.keys()
+
+    # ---- Refresco ----
+    def refresh(self, db, watermark: Tuple[int, int]) -> str:
+        """Lleva el índice a `watermark` (max_id, count): "hit", "incremental" o "full"."""
+        if watermark == self.watermark:
+            return "hit"
+        from app.ledger.cache import _new_invoices
+        old = self.watermark
+        if old is not None and watermark[0] >= old[0] and watermark[1] - old[1] == _new_invoices(self.kind, db, old[0]):
+            for key, (days, cents, counts) in _daily_rows(self.kind, db, self.by, after_id=old[0]).items():
+                self.series[key] = self.series.get(key, _EMPTY).merge(days, cents, counts)
+            self.watermark = watermark
+            return "incremental"
+        self.series = {key: DailyTotals(*cols) for key, cols in _daily_rows(self.kind, db, self.by).items()}
+        self.watermark = watermark
+        return "full"
+
+
+# -----------------------------
+# Instancias de proceso
+# -----------------------------
+_INDEXES: Dict[Tuple[str, Optional[str], str], IssuedIndex] = {}
+_LOCK = threading.Lock()
+
+def issued_index(kind: str, by: Optional[str] = None, db=None) -> IssuedIndex:
+    """Índice de `kind` al día con la base (una consulta de marca de agua, cacheada por data_version)."""
+    from app.data_version import data_version
+    from app.ledger.cache import _bind_key
+    with _session(db) as s:
+        max_id, count = data_version(s)["tables"][f"factura_{kind}"][:2]
+        with _LOCK:
+            key = (kind, by, _bind_key(s))
+            idx = _INDEXES.get(key)
+            if idx is None:
+                idx = _INDEXES[key] = IssuedIndex(kind, by)
+            idx.refresh(s, (int(max_id), int(count)))
+            return idx
+
+def invalidate() -> None:
+    with _LOCK:
+        _INDEXES.clear()
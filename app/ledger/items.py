@@ -0,0 +1,224 @@
+# app/ledger/items.py
+"""
+Partidas abiertas (facturas CxC/CxP) como filas compactas.
+
+Antes cada factura era una instancia ORM completa (con relaciones selectin: cliente, pagos,
+detalles…), luego un Decimal y luego un dict. Aquí se proyectan SOLO las columnas necesarias
+a un objeto con __slots__ y enteros:
+
+    OpenItem(id, entity_id, amount_cents, paid_cents, due_ordinal, issue_ordinal, number)
+
+Montos en céntimos (Numeric(14,2) → int exacto) y fechas como date.toordinal(); todo el
+código de aging/listados/KPIs de CxC, CxP y FinanzasRepoDB comparte estas funciones.
+"""
+from __future__ import annotations
+
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+AGING_KEYS = ("0_30", "31_60", "61_90", "90_plus")
+
+
+class OpenItem:
+    __slots__ = ("id", "entity_id", "amount_cents", "paid_cents", "due_ordinal", "issue_ordinal", "number")
+
+    def __init__(self, id: int, entity_id: Optional[int], amount_cents: int, paid_cents: int,
+                 due_ordinal: Optional[int], issue_ordinal: Optional[int], number: Optional[str] = None):
+        self.id = id
+        self.entity_id = entity_id
+        self.amount_cents = amount_cents
+        self.paid_cents = paid_cents
+        self.due_ordinal = due_ordinal
+        self.issue_ordinal = issue_ordinal
+        self.number = number
+
+    @property
+    def outstanding_cents(self) -> int:
+        return self.amount_cents - self.paid_cents
+
+    @property
+    def outstanding(self) -> float:
+        return self.outstanding_cents / 100
+
+    @property
+    def due_date(self) -> Optional[date]:
+        return date.fromordinal(self.due_ordinal) if self.due_ordinal else None
+
+    @property
+    def issue_date(self) -> Optional[date]:
+        return date.fromordinal(self.issue_ordinal) if self.issue_ordinal else None
+
+    def days_overdue(self, ref_ordinal: int) -> int:
+        """Días de atraso (>= 0) al ref; 0 si no tiene fecha límite."""
+        return max(ref_ordinal - self.due_ordinal, 0) if self.due_ordinal else 0
+
+    def __repr__(self) -> str:
+        return (f"OpenItem(id={self.id}, entity_id={self.entity_id}, outstanding={self.outstanding:.2f}, "
+                f"due={self.due_date}, number={self.number!r})")
+
+# -----------------------------
+# Conversión
+# -----------------------------
+def to_cents(value: Any) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, Decimal):
+        return int(value.scaleb(2).to_integral_value())
+    if isinstance(value, int):
+        return value * 100
+    return int(round(float(value) * 100))
+
+def to_ordinal(value: Any) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()  # datetime.toordinal() usa solo la parte de fecha
+    return None
+
+def cents_to_float(cents: int) -> float:
+    return cents / 100
+
+# -----------------------------
+# Proyección desde la DB
+# -----------------------------
+@contextmanager
+def _session(db=None) -> Iterator[Any]:
+    """Reutiliza la sesión del llamador o abre (y cierra) una propia."""
+    if db is not None:
+        yield db
+        return
+    from app.database import SessionLocal
+    own = SessionLocal()
+    try:
+        yield own
+    finally:
+        own.close()
+
+def _bind_key(db) -> str:
+    """Identidad de la base detrás de la sesión (URL sin contraseña), para separar cachés."""
+    try:
+        return db.get_bind().url.render_as_string(hide_password=True)
+    except Exception:
+        return "default"
+
+def _kind_columns(kind: str):
+    # Import tardío: el tipo OpenItem y las agregaciones no requieren SQLAlchemy
+    from app.models import FacturaCXC, FacturaCXP
+    if kind == "cxc":
+        F = FacturaCXC
+        return F, F.id_cxc, F.id_entidad_cliente
+    if kind == "cxp":
+        F = FacturaCXP
+        return F, F.id_cxp, F.id_entidad_proveedor
+    raise ValueError(f"kind desconocido: {kind!r} (use 'cxc' o 'cxp')")
+
+def open_items_query(kind: str, open_only: bool = True, entity_id: Optional[int] = None,
+                     issued_from: Optional[datetime] = None, issued_to: Optional[datetime] = None,
+                     ids: Optional[Iterable[int]] = None, after_id: Optional[int] = None):
+    """
+    SELECT con solo las 7 columnas de OpenItem (sin cargar relaciones ORM).
+    `ids` / `after_id` acotan por id de factura (refresco incremental de app.ledger.cache).
+    """
+    from sqlalchemy import func, select
+    F, id_col, entity_col = _kind_columns(kind)
+    stmt = select(id_col, entity_col, F.monto, F.monto_pagado, F.fecha_limite, F.fecha_emision, F.numero_factura)
+    if open_only:
+        stmt = stmt.where(func.coalesce(F.monto, 0) - func.coalesce(F.monto_pagado, 0) > 0)
+    if entity_id is not None:
+        stmt = stmt.where(entity_col == entity_id)
+    if issued_from is not None:
+        stmt = stmt.where(F.fecha_emision >= issued_from)
+    if issued_to is not None:
+        stmt = stmt.where(F.fecha_emision < issued_to)
+    if ids is not None:
+        stmt = stmt.where(id_col.in_(list(ids)))
+    if after_id is not None:
+        stmt = stmt.where(id_col > after_id)
+    return stmt
+
+def count_open_items(kind: str, db=None) -> int:
+    """COUNT(*) de partidas con saldo > 0, resuelto en la DB."""
+    from sqlalchemy import func, select
+    F, id_col, _ = _kind_columns(kind)
+    stmt = select(func.count(id_col)).where(func.coalesce(F.monto, 0) - func.coalesce(F.monto_pagado, 0) > 0)
+    with _session(db) as s:
+        return int(s.execute(stmt).scalar() or 0)
+
+def items_from_rows(rows: Iterable[Tuple]) -> List[OpenItem]:
+    return [
+        OpenItem(rid, ent, to_cents(monto), to_cents(pagado), to_ordinal(limite), to_ordinal(emision), num)
+        for rid, ent, monto, pagado, limite, emision, num in rows
+    ]
+
+def load_open_items(kind: str, db=None, **filters) -> List[OpenItem]:
+    """
+    Partidas de factura_cxc/factura_cxp como OpenItem. filters: open_only, entity_id,
+    issued_from, issued_to (ver open_items_query). Usa `db` si se pasa; si no, abre una sesión.
+    """
+    stmt = open_items_query(kind, **filters)
+    with _session(db) as s:
+        return items_from_rows(s.execute(stmt.execution_options(yield_per=5000)))
+
+def entity_names(ids: Iterable[Optional[int]], db=None) -> Dict[int, str]:
+    """nombre_legal por id_entidad en UNA consulta (evita el lazy-load fila a fila)."""
+    wanted = sorted({i for i in ids if i is not None})
+    if not wanted:
+        return {}
+    from sqlalchemy import select
+    from app.models import Entidad
+    stmt = select(Entidad.id_entidad, Entidad.nombre_legal).where(Entidad.id_entidad.in_(wanted))
+    with _session(db) as s:
+        return {i: n for i, n in s.execute(stmt)}
+
+def entity_label(names: Dict[int, str], entity_id: Optional[int]) -> str:
+    name = names.get(entity_id) if entity_id is not None else None
+    return name if name else str(entity_id if entity_id is not None else "")
+
+# -----------------------------
+# Agregaciones compartidas
+# -----------------------------
+def aging_bucket(days: int) -> Optional[str]:
+    """Bucket de vencido para días de atraso > 0; None si no está vencido."""
+    if days <= 0:
+        return None
+    if days <= 30:
+        return "0_30"
+    if days <= 60:
+        return "31_60"
+    if days <= 90:
+        return "61_90"
+    return "90_plus"
+
+def aging_totals(items: Iterable[OpenItem], ref: date) -> Dict[str, Any]:
+    """
+    Aging SOLO vencido + totales, en céntimos:
+      {"overdue": {0_30, 31_60, 61_90, 90_plus}, "current", "no_due", "open_count"}
+    Solo cuenta partidas con saldo > 0.
+    """
+    ref_ord = ref.toordinal()
+    overdue = dict.fromkeys(AGING_KEYS, 0)
+    current = no_due = open_count = 0
+    for it in items:
+        saldo = it.amount_cents - it.paid_cents
+        if saldo <= 0:
+            continue
+        open_count += 1
+        if not it.due_ordinal:
+            no_due += saldo
+            continue
+        bucket = aging_bucket(ref_ord - it.due_ordinal)
+        if bucket is None:
+            current += saldo
+        else:
+            overdue[bucket] += saldo
+    return {"overdue": overdue, "current": current, "no_due": no_due, "open_count": open_count}
+
+def issued_totals(items: Iterable[OpenItem]) -> Tuple[int, int]:
+    """(suma de montos, suma de saldos) en céntimos — base de DSO/DPO y saldos por mes."""
+    amount = outstanding = 0
+    for it in items:
+        amount += it.amount_cents
+        outstanding += it.amount_cents - it.paid_cents
+    return amount, outstanding
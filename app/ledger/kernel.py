@@ -0,0 +1,184 @@
+# app/ledger/kernel.py
+"""
+Kernel vectorizado del libro de partidas (NumPy, céntimos int64, fechas como ordinales).
+
+Mismo contrato y resultados EXACTOS que las agregaciones fila a fila de app.ledger.items
+(enteros en céntimos, sin floats intermedios):
+
+    L = load_ledger("cxc")                       # LedgerArrays
+    aging_totals(L, ref_date)                    # == items.aging_totals(...)
+    issued_totals(L)                             # == items.issued_totals(...)
+    top_overdue(L, ref_date, n)                  # índices, mismo orden que heapq.nlargest
+    due_soon(L, ref_date, max_days)              # índices ordenados por (días, -saldo)
+
+Las fechas nulas se guardan como ordinal 0 y las entidades nulas como -1.
+"""
+from __future__ import annotations
+
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.ledger.items import AGING_KEYS, OpenItem, open_items_query, _session, to_cents, to_ordinal
+
+# Límites de np.digitize sobre días de atraso: (<=0) | 1-30 | 31-60 | 61-90 | >90
+_AGING_EDGES = np.array([1, 31, 61, 91], dtype=np.int64)
+
+
+class LedgerArrays:
+    __slots__ = ("ids", "entity_ids", "amount_cents", "paid_cents", "due_ord", "issue_ord", "numbers")
+
+    def __init__(self, ids, entity_ids, amount_cents, paid_cents, due_ord, issue_ord, numbers):
+        self.ids = ids
+        self.entity_ids = entity_ids
+        self.amount_cents = amount_cents
+        self.paid_cents = paid_cents
+        self.due_ord = due_ord
+        self.issue_ord = issue_ord
+        self.numbers = numbers  # lista de str (no se vectoriza: solo se lee al listar)
+
+    def __len__(self) -> int:
+        return int(self.ids.shape[0])
+
+    @property
+    def outstanding_cents(self) -> np.ndarray:
+        return self.amount_cents - self.paid_cents
+
+    @property
+    def nbytes(self) -> int:
+        arrays = (self.ids, self.entity_ids, self.amount_cents, self.paid_cents, self.due_ord, self.issue_ord)
+        return int(sum(a.nbytes for a in arrays))
+
+    @classmethod
+    def from_columns(cls, ids: List[int], entity_ids: List[Optional[int]], amount: List[int], paid: List[int],
+                     due: List[Optional[int]], issue: List[Optional[int]], numbers: List[Optional[str]]) -> "LedgerArrays":
+        i64 = lambda xs, null: np.fromiter((null if x is None else x for x in xs), dtype=np.int64, count=len(xs))
+        return cls(i64(ids, -1), i64(entity_ids, -1), i64(amount, 0), i64(paid, 0),
+                   i64(due, 0), i64(issue, 0), list(numbers))
+
+    @classmethod
+    def from_items(cls, items: List[OpenItem]) -> "LedgerArrays":
+        return cls.from_columns(
+            [it.id for it in items], [it.entity_id for it in items],
+            [it.amount_cents for it in items], [it.paid_cents for it in items],
+            [it.due_ordinal for it in items], [it.issue_ordinal for it in items],
+            [it.number for it in items],
+        )
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple]) -> "LedgerArrays":
+        """Filas (id, entidad, monto, pagado, fecha_limite, fecha_emision, numero) de open_items_query."""
+        ids, ents, amount, paid, due, issue, numbers = [], [], [], [], [], [], []
+        for rid, ent, monto, pagado, limite, emision, num in rows:
+            ids.append(rid); ents.append(ent)
+            amount.append(to_cents(monto)); paid.append(to_cents(pagado))
+            due.append(to_ordinal(limite)); issue.append(to_ordinal(emision))
+            numbers.append(num)
+        return cls.from_columns(ids, ents, amount, paid, due, issue, numbers)
+
+    @classmethod
+    def empty(cls) -> "LedgerArrays":
+        return cls.from_columns([], [], [], [], [], [], [])
+
+    @classmethod
+    def concat(cls, parts: List["LedgerArrays"]) -> "LedgerArrays":
+        parts = [p for p in parts if len(p)] or [cls.empty()]
+        cat = lambda name: np.concatenate([getattr(p, name) for p in parts])
+        return cls(cat("ids"), cat("entity_ids"), cat("amount_cents"), cat("paid_cents"),
+                   cat("due_ord"), cat("issue_ord"), [n for p in parts for n in p.numbers])
+
+    def sorted_by_id(self) -> "LedgerArrays":
+        """Orden estable por id: una carga completa y una incremental quedan idénticas."""
+        return self.take(np.argsort(self.ids, kind="stable"))
+
+    def take(self, idx: np.ndarray) -> "LedgerArrays":
+        return LedgerArrays(self.ids[idx], self.entity_ids[idx], self.amount_cents[idx], self.paid_cents[idx],
+                            self.due_ord[idx], self.issue_ord[idx], [self.numbers[i] for i in idx.tolist()])
+
+    def item(self, i: int) -> OpenItem:
+        ent = int(self.entity_ids[i])
+        due, issue = int(self.due_ord[i]), int(self.issue_ord[i])
+        return OpenItem(int(self.ids[i]), None if ent < 0 else ent, int(self.amount_cents[i]),
+                        int(self.paid_cents[i]), due or None, issue or None, self.numbers[i])
+
+
+def load_ledger(kind: str, db=None, **filters) -> LedgerArrays:
+    """Como items.load_open_items pero directo a arreglos (sin objeto por fila)."""
+    stmt = open_items_query(kind, **filters)
+    with _session(db) as s:
+        return LedgerArrays.from_rows(s.execute(stmt.execution_options(yield_per=20000)))
+
+# -----------------------------
+# Agregaciones
+# -----------------------------
+def aging_totals(L: LedgerArrays, ref: date) -> Dict[str, Any]:
+    """Equivalente exacto de items.aging_totals (céntimos int)."""
+    out = L.outstanding_cents
+    open_mask = out > 0
+    no_due = open_mask & (L.due_ord == 0)
+    dated = open_mask & ~no_due
+    bins = np.digitize(ref.toordinal() - L.due_ord[dated], _AGING_EDGES)  # 0=corriente, 1..4=buckets
+    out_dated = out[dated]
+    sums = [int(out_dated[bins == b].sum()) for b in range(len(AGING_KEYS) + 1)]
+    return {
+        "overdue": dict(zip(AGING_KEYS, sums[1:])),
+        "current": sums[0],
+        "no_due": int(out[no_due].sum()),
+        "open_count": int(open_mask.sum()),
+    }
+
+def aging_by_entity(L: LedgerArrays, ref: date) -> Dict[int, List[int]]:
+    """
+    Por entidad, céntimos en [corriente, 0_30, 31_60, 61_90, 90_plus, sin_fecha] (suma entera
+    exacta con np.add.at). Entidad nula = -1.
+    """
+    out = L.outstanding_cents
+    open_idx = np.flatnonzero(out > 0)
+    due = L.due_ord[open_idx]
+    col = np.digitize(ref.toordinal() - due, _AGING_EDGES)
+    col[due == 0] = len(AGING_KEYS) + 1
+    ents, row = np.unique(L.entity_ids[open_idx], return_inverse=True)
+    acc = np.zeros((ents.size, len(AGING_KEYS) + 2), dtype=np.int64)
+    np.add.at(acc, (row, col), out[open_idx])
+    return {int(e): acc[i].tolist() for i, e in enumerate(ents.tolist())}
+
+def issued_totals(L: LedgerArrays, start_ord: Optional[int] = None, end_ord: Optional[int] = None) -> Tuple[int, int]:
+    """(montos, saldos) en céntimos; opcionalmente solo emitidas en [start_ord, end_ord)."""
+    mask = np.ones(len(L), dtype=bool)
+    if start_ord is not None:
+        mask &= L.issue_ord >= start_ord
+    if end_ord is not None:
+        mask &= L.issue_ord < end_ord
+    return int(L.amount_cents[mask].sum()), int(L.outstanding_cents[mask].sum())
+
+def days_overdue(L: LedgerArrays, ref: date) -> np.ndarray:
+    days = ref.toordinal() - L.due_ord
+    return np.where(L.due_ord > 0, np.maximum(days, 0), 0)
+
+def top_overdue(L: LedgerArrays, ref: date, n: int) -> np.ndarray:
+    """
+    Índices de las n partidas abiertas más vencidas, ordenadas por (días, saldo) desc.
+    argpartition acota candidatos por días; el desempate estable replica heapq.nlargest.
+    """
+    out = L.outstanding_cents
+    days = days_overdue(L, ref)
+    cand = np.flatnonzero((out > 0) & (days > 0))
+    n = int(n)
+    if n <= 0 or cand.size == 0:
+        return cand[:0]
+    if cand.size > n:
+        kth = cand.size - n
+        cand_days = days[cand]
+        threshold = cand_days[np.argpartition(cand_days, kth)[kth]]  # n-ésimo mayor número de días
+        cand = cand[cand_days >= threshold]
+    order = np.lexsort((-out[cand], -days[cand]))          # estable: empates en orden original
+    return cand[order[:n]]
+
+def due_soon(L: LedgerArrays, ref: date, max_days: int) -> np.ndarray:
+    """Índices de partidas abiertas que vencen en [0, max_days] días, por (días, -saldo)."""
+    out = L.outstanding_cents
+    days_to = L.due_ord - ref.toordinal()
+    idx = np.flatnonzero((out > 0) & (L.due_ord > 0) & (days_to >= 0) & (days_to <= int(max_days)))
+    order = np.lexsort((-out[idx], days_to[idx]))
+    return idx[order]
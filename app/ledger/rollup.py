@@ -0,0 +1,319 @@
+# app/ledger/rollup.py
+"""
+Rollup mensual de KPIs (kpi_mensual) en un archivo local, con refresco incremental.
+
+Los meses cerrados se recalculaban desde las facturas crudas en cada pregunta. Aquí un job
+los persiste una vez por mes en KPI_ROLLUP_PATH (JSON, escritura atómica):
+
+    {"months": {"2025-07": {"fingerprint": {...}, "kpis": {dso_method, dso, dpo, ccc, cxc_balance_cents,
+                 cxp_balance_cents, cxc_aging}, "computed_at": ...}},
+     "watermarks": {"factura_cxc": [max_id, count], "pago_cxc": [max_id, count, max_fecha], ...},
+     "updated_at": ...}
+
+Recalcula SOLO los meses cuya huella cambió desde la última corrida. La huella de un mes
+sale de un GROUP BY por mes de emisión (count, max id, Σ monto, Σ monto_pagado) de
+factura_cxc y factura_cxp: un pago nuevo sube monto_pagado y cambia la huella del mes de
+la factura. El aging al cierre depende de TODAS las facturas emitidas hasta ese mes, así
+que su huella es acumulada (un cambio en marzo recalcula el aging de marzo en adelante);
+lo mismo el DSO/DPO con saldos promedio (KPI_DSO_METHOD=average, app.ledger.balances).
+Un rollup guardado con otro método no se usa y se recalcula en la siguiente corrida.
+
+El mes en curso nunca se guarda: FinanzasRepoDB y el agente contable leen los meses
+cerrados de aquí (`closed_month_kpis`) y calculan en vivo solo el abierto.
+
+Frescura: el job guarda la marca de agua de facturas y pagos (app.data_version) leída ANTES
+de calcular. Si después llegan filas nuevas fechadas dentro de un mes ya guardado (un pago
+del 14/07 registrado en agosto), `closed_month_kpis` omite los KPIs afectados de ese mes y
+el llamador los calcula en vivo hasta la siguiente corrida:
+  - aging al cierre y DSO/DPO promedio: facturas emitidas o pagos fechados <= fin de mes
+  - saldos y DSO/DPO "closing": facturas emitidas <= fin de mes o pagos a esas facturas
+Si desaparecieron filas (borrados) se descarta todo el rollup. `rollup_stats()` (en
+`_meta["kpi_rollup"]`) expone desde qué fecha está desactualizado y cuántas lecturas cayeron
+a vivo.
+
+Job:
+    python -m app.ledger.rollup [--from 2024-01] [--to 2025-08] [--force]
+
+Configuración:
+  - KPI_ROLLUP          1/0 (por defecto 1): leer del rollup si existe
+  - KPI_ROLLUP_PATH     archivo (por defecto app/exports/kpi_mensual.json)
+"""
+from __future__ import annotations
+
+import os
+import sys
+import time
+import hashlib
+import argparse
+import threading
+from datetime import date, datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from app.serialization import dumps, dumps_bytes, loads
+
+_WATERMARK_TABLES = ("factura_cxc", "pago_cxc", "factura_cxp", "pago_cxp")
+
+KPI_ROLLUP = os.getenv("KPI_ROLLUP", "1") != "0"
+KPI_ROLLUP_PATH = Path(os.getenv("KPI_ROLLUP_PATH",
+                                 str(Path(__file__).resolve().parent.parent / "exports" / "kpi_mensual.json")))
+
+# -----------------------------
+# Huellas por mes
+# -----------------------------
+def _month_key(year: int, month: int) -> str:
+    return f"{int(year):04d}-{int(month):02d}"
+
+def _is_closed(key: str, today: Optional[date] = None) -> bool:
+    today = today or date.today()
+    return key < _month_key(today.year, today.month)
+
+def month_fingerprints(db) -> Dict[str, Dict[str, List[int]]]:
+    """{"YYYY-MM": {"cxc": [count, max_id, Σmonto¢, Σpagado¢], "cxp": [...]}} en 2 consultas."""
+    from sqlalchemy import extract, func, select
+    from app.ledger.items import _kind_columns, to_cents
+    out: Dict[str, Dict[str, List[int]]] = {}
+    for kind in ("cxc", "cxp"):
+        F, id_col, _ = _kind_columns(kind)
+        y, m = extract("year", F.fecha_emision), extract("month", F.fecha_emision)
+        stmt = (select(y, m, func.count(id_col), func.max(id_col), func.sum(F.monto), func.sum(F.monto_pagado))
+                .group_by(y, m))
+        for yy, mm, count, max_id, amount, paid in db.execute(stmt):
+            if yy is None or mm is None:
+                continue
+            out.setdefault(_month_key(yy, mm), {})[kind] = [int(count or 0), int(max_id or 0),
+                                                             to_cents(amount), to_cents(paid)]
+    return out
+
+def _digest(obj: Any) -> str:
+    return hashlib.sha1(dumps(obj).encode("utf-8")).hexdigest()[:16]
+
+def _fingerprint_chain(prints: Dict[str, Dict[str, List[int]]]) -> Dict[str, Dict[str, str]]:
+    """Por mes: huella propia ("month") y acumulada hasta ese mes ("upto") para el aging al cierre."""
+    out, acc = {}, ""
+    for key in sorted(prints):
+        own = _digest(prints[key])
+        acc = _digest([acc, own])
+        out[key] = {"month": own, "upto": acc}
+    return out
+
+# -----------------------------
+# Almacenamiento
+# -----------------------------
+_LOCK = threading.Lock()
+_LOADED: Dict[str, Any] = {"mtime": None, "data": None}
+
+def load_rollup(path: Path = KPI_ROLLUP_PATH) -> Dict[str, Any]:
+    """Contenido del rollup (releído solo si cambió el archivo); vacío si no existe."""
+    try:
+        mtime = path.stat().st_mtime_ns
+    except OSError:
+        return {"months": {}}
+    with _LOCK:
+        if _LOADED["mtime"] != (str(path), mtime):
+            _LOADED["data"] = loads(path.read_bytes())
+            _LOADED["mtime"] = (str(path), mtime)
+        return _LOADED["data"]
+
+def _save(data: Dict[str, Any], path: Path) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    tmp.write_bytes(dumps_bytes(data, pretty=True))
+    os.replace(tmp, path)
+
+# -----------------------------
+# Frescura
+# -----------------------------
+_STALE: Dict[str, Any] = {"key": None, "since": None}
+_STATS = {"hits": 0, "stale": 0}
+
+def _new_rows_since(kind: str, stored: Dict[str, List], db) -> Dict[str, Optional[date]]:
+    """
+    Fecha más antigua afectada por las filas de `kind` posteriores a la marca guardada:
+    {"dated": min(emisión nueva, fecha de pago nuevo), "issued": min(emisión nueva, emisión
+    de la factura de un pago nuevo)}; date.min si hubo borrados (no se puede acotar).
+    """
+    from sqlalchemy import func, select
+    from app.ledger.cache import _payment_columns
+    from app.ledger.items import _kind_columns
+    F, inv_id, _ = _kind_columns(kind)
+    P, pay_id, inv_fk = _payment_columns(kind)
+    inv_wm, pay_wm = stored.get(f"factura_{kind}") or [0, 0], stored.get(f"pago_{kind}") or [0, 0]
+    new_inv = select(func.count(inv_id), func.min(F.fecha_emision)).where(inv_id > inv_wm[0])
+    new_pay = (select(func.count(pay_id), func.min(P.fecha), func.min(F.fecha_emision))
+               .select_from(P).outerjoin(F, inv_id == inv_fk).where(pay_id > pay_wm[0]))
+    n_inv, inv_min = db.execute(new_inv).one()
+    n_pay, pay_min, pay_issued_min = db.execute(new_pay).one()
+    totals = db.execute(select(select(func.count(inv_id)).scalar_subquery(),
+                               select(func.count(pay_id)).scalar_subquery())).one()
+    if totals[0] - inv_wm[1] != n_inv or totals[1] - pay_wm[1] != n_pay:
+        return {"dated": date.min, "issued": date.min}
+    as_date = lambda v: v.date() if isinstance(v, datetime) else v
+    dated = [as_date(v) for v in (inv_min, pay_min) if v is not None]
+    issued = [as_date(v) for v in (inv_min, pay_issued_min) if v is not None]
+    return {"dated": min(dated) if dated else None, "issued": min(issued) if issued else None}
+
+def stale_since(path: Path = KPI_ROLLUP_PATH) -> Dict[str, Dict[str, Optional[date]]]:
+    """{"cxc"|"cxp": {"dated", "issued"}}: desde qué fecha el rollup ya no refleja la base."""
+    from app.data_version import data_version
+    data = load_rollup(path)
+    stored = data.get("watermarks") or {}
+    clean = {kind: {"dated": None, "issued": None} for kind in ("cxc", "cxp")}
+    dv = data_version()
+    if not stored:
+        return clean if not data.get("months") else {k: {"dated": date.min, "issued": date.min} for k in clean}
+    if all(list(dv["tables"][t][:2]) == list(stored.get(t, [])[:2]) for t in _WATERMARK_TABLES):
+        return clean
+    memo_key = (dv["token"], str(path), _LOADED["mtime"])
+    with _LOCK:
+        if _STALE["key"] == memo_key:
+            return _STALE["since"]
+    from app.ledger.items import _session
+    with _session() as s:
+        since = {kind: _new_rows_since(kind, stored, s) for kind in ("cxc", "cxp")}
+    with _LOCK:
+        _STALE.update(key=memo_key, since=since)
+    return since
+
+def _kpi_scope(key: str, method: str) -> List[tuple]:
+    """(tipo, alcance de fecha) de los que depende cada KPI guardado."""
+    dso_scope = "dated" if method == "average" else "issued"
+    return {
+        "dso": [("cxc", dso_scope)],
+        "dpo": [("cxp", dso_scope)],
+        "ccc": [("cxc", dso_scope), ("cxp", dso_scope)],
+        "cxc_balance_cents": [("cxc", "issued")],
+        "cxp_balance_cents": [("cxp", "issued")],
+        "cxc_aging": [("cxc", "dated")],
+    }.get(key, [])
+
+def closed_month_kpis(year: int, month: int, path: Path = KPI_ROLLUP_PATH) -> Optional[Dict[str, Any]]:
+    """
+    KPIs persistidos de un mes CERRADO, sin los que quedaron desactualizados por filas nuevas
+    fechadas dentro del mes; None si es el mes en curso, no hay rollup o KPI_ROLLUP=0.
+    """
+    from calendar import monthrange
+    key = _month_key(year, month)
+    if not KPI_ROLLUP or not _is_closed(key):
+        return None
+    rec = (load_rollup(path).get("months") or {}).get(key)
+    if not rec:
+        return None
+    kpis = dict(rec.get("kpis") or {})
+    try:
+        since = stale_since(path)
+    except Exception:
+        return kpis  # sin base no hay cálculo en vivo con qué reemplazarlo
+    close = date(year, month, monthrange(year, month)[1])
+    method = kpis.get("dso_method", "closing")
+    stale = [k for k in list(kpis) for kind, scope in _kpi_scope(k, method)
+             if since[kind][scope] is not None and since[kind][scope] <= close]
+    for k in set(stale):
+        kpis.pop(k, None)
+    with _LOCK:
+        _STATS["stale" if stale else "hits"] += 1
+    return kpis
+
+def rollup_stats(path: Path = KPI_ROLLUP_PATH) -> Dict[str, Any]:
+    """Estado del rollup para `_meta`: última corrida, desde cuándo está desactualizado y lecturas."""
+    data = load_rollup(path)
+    try:
+        since = {kind: {scope: (d.isoformat() if d else None) for scope, d in v.items()}
+                 for kind, v in stale_since(path).items()}
+    except Exception:
+        since = None
+    with _LOCK:
+        stats = dict(_STATS)
+    return {"updated_at": data.get("updated_at"), "months": len(data.get("months") or {}),
+            "stale_since": since, **stats}
+
+# -----------------------------
+# Job de refresco
+# -----------------------------
+def _month_kpis(repo, year: int, month: int) -> Dict[str, Any]:
+    from app.ledger.items import to_cents
+    from app.repo_finanzas_db import KPI_DSO_METHOD
+    dso, dpo = repo.dso(year, month), repo.dpo(year, month)
+    return {
+        "dso_method": KPI_DSO_METHOD,
+        "dso": dso,
+        "dpo": dpo,
+        "ccc": dso - dpo,
+        # saldos en céntimos: el repo los devuelve como Decimal exacto
+        "cxc_balance_cents": to_cents(repo.cxc_balance_by_month(year, month)),
+        "cxp_balance_cents": to_cents(repo.cxp_balance_by_month(year, month)),
+    }
+
+def _month_end_aging(tl, year: int, month: int) -> Dict[str, float]:
+    """Aging CxC al último día del mes con los saldos de ese día (pagos posteriores no cuentan)."""
+    from calendar import monthrange
+    from app.repo_finanzas_db import repo_aging_buckets
+    return repo_aging_buckets(tl.aging_at(date(year, month, monthrange(year, month)[1])))
+
+def refresh_rollup(db=None, start: Optional[str] = None, end: Optional[str] = None, force: bool = False,
+                   path: Path = KPI_ROLLUP_PATH, log=None) -> Dict[str, Any]:
+    """
+    Recalcula los meses cerrados cuya huella cambió (o todos con `force`) y guarda el archivo.
+    Devuelve un resumen {"months", "recomputed", "aging_recomputed", "skipped", "elapsed_s"}.
+    """
+    from app.data_version import table_watermarks
+    from app.ledger.items import _session
+    from app.repo_finanzas_db import KPI_DSO_METHOD, FinanzasRepoDB
+    log = log or (lambda msg: None)
+    t0 = time.perf_counter()
+    with _session(db) as s:
+        # marca ANTES de calcular: lo que llegue durante la corrida queda como pendiente
+        watermarks = {t: list(v[:2]) for t, v in table_watermarks(s, _WATERMARK_TABLES).items()}
+        chain = _fingerprint_chain(month_fingerprints(s))
+    data = load_rollup(path)
+    months: Dict[str, Any] = dict(data.get("months") or {})
+    repo = FinanzasRepoDB(cache=False, rollup=False)  # siempre desde las facturas
+    tl = None
+    recomputed, aging_recomputed, skipped = [], [], 0
+    for key, fp in chain.items():
+        if not _is_closed(key) or (start and key < start) or (end and key > end):
+            continue
+        prev = months.get(key) or {}
+        prev_fp = prev.get("fingerprint") or {}
+        # con saldos promedio el DSO/DPO depende de pagos a facturas de meses anteriores → huella acumulada
+        kpis_fp = "upto" if KPI_DSO_METHOD == "average" else "month"
+        kpis_stale = (force or prev_fp.get(kpis_fp) != fp[kpis_fp]
+                      or (prev.get("kpis") or {}).get("dso_method", "closing") != KPI_DSO_METHOD)
+        aging_stale = force or prev_fp.get("upto") != fp["upto"]
+        if not (kpis_stale or aging_stale):
+            skipped += 1
+            continue
+        y, m = map(int, key.split("-"))
+        kpis = dict(prev.get("kpis") or {})
+        if kpis_stale:
+            kpis.update(_month_kpis(repo, y, m))
+        if aging_stale:
+            if tl is None:
+                from app.ledger.balances import load_timeline
+                with _session(db) as s:
+                    tl = load_timeline("cxc", s)
+            kpis["cxc_aging"] = _month_end_aging(tl, y, m)
+        months[key] = {"fingerprint": fp, "kpis": kpis, "computed_at": datetime.now().isoformat(timespec="seconds")}
+        (recomputed if kpis_stale else aging_recomputed).append(key)
+        log(f"[rollup] {key} {'kpis+aging' if kpis_stale else 'aging'}")
+    if start or end:  # corrida parcial: los meses fuera del rango siguen con la marca anterior
+        watermarks = data.get("watermarks")
+    _save({"months": dict(sorted(months.items())), "watermarks": watermarks,
+           "updated_at": datetime.now().isoformat(timespec="seconds")}, path)
+    return {"months": len(months), "recomputed": recomputed, "aging_recomputed": aging_recomputed,
+            "skipped": skipped, "elapsed_s": round(time.perf_counter() - t0, 3)}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="Refresca el rollup mensual de KPIs (kpi_mensual)")
+    ap.add_argument("--from", dest="start", help="primer mes YYYY-MM")
+    ap.add_argument("--to", dest="end", help="último mes YYYY-MM")
+    ap.add_argument("--force", action="store_true", help="recalcular todos los meses cerrados")
+    ap.add_argument("--path", default=str(KPI_ROLLUP_PATH))
+    args = ap.parse_args(argv)
+    summary = refresh_rollup(start=args.start, end=args.end, force=args.force, path=Path(args.path),
+                             log=lambda msg: print(msg, file=sys.stderr, flush=True))
+    print(dumps(summary, pretty=True))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
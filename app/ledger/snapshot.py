@@ -0,0 +1,180 @@
+# app/ledger/snapshot.py
+"""
+Snapshot del libro en Arrow IPC, memory-mapped y compartido entre procesos.
+
+Con varios procesos (batch --mode process, workers del servicio, sesiones de Streamlit) cada
+uno tenía su propia copia de las partidas en app.ledger.cache. Aquí la copia vive en disco:
+
+    LEDGER_SNAPSHOT_DIR/cxc-<token>.arrow        partidas abiertas (columnas de LedgerArrays)
+
+`<token>` sale de la marca de agua (app.ledger.cache.read_watermark), de la época
+compartida (LEDGER_SNAPSHOT_DIR/epoch, que sube con app.data_version.bump() en cualquier
+proceso tras una edición en sitio) y de la generación de antigüedad (una por cada
+LEDGER_CACHE_MAX_AGE_S segundos de reloj, igual en todos los procesos): así un monto
+corregido sin filas nuevas no sobrevive más que en la caché en proceso. Si cambia,
+el primer proceso que lo note escribe un archivo nuevo (tmp + os.replace, atómico) y los
+demás lo abren con `pa.memory_map`. Las columnas int64 se exponen como vistas NumPy de
+solo lectura sobre el mapa (zero-copy): el sistema operativo comparte una sola copia física
+de las páginas entre todos los procesos.
+
+Se usa Arrow IPC sin compresión y no Parquet: Parquet hay que decodificarlo al leer, así que
+cada proceso volvería a tener su copia.
+
+Configuración:
+  - LEDGER_SOURCE=snapshot    activa esta fuente en app.ledger.cache.open_ledger
+  - LEDGER_SNAPSHOT_DIR       carpeta (por defecto app/exports/ledger_snapshot)
+  - LEDGER_SNAPSHOT_KEEP      snapshots por tipo que se conservan (por defecto 2)
+
+Requiere pyarrow (extra `perf`).
+"""
+from __future__ import annotations
+
+import os
+import time
+import hashlib
+import threading
+from pathlib import Path
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+
+from app.ledger.cache import LEDGER_CACHE_CHECK_S, LEDGER_CACHE_MAX_AGE_S, _bind_key, read_watermark
+from app.ledger.items import _session
+from app.ledger.kernel import LedgerArrays, load_ledger
+
+LEDGER_SNAPSHOT_DIR = Path(os.getenv("LEDGER_SNAPSHOT_DIR",
+                                     str(Path(__file__).resolve().parent.parent / "exports" / "ledger_snapshot")))
+LEDGER_SNAPSHOT_KEEP = int(os.getenv("LEDGER_SNAPSHOT_KEEP", "2"))
+EPOCH_FILE = LEDGER_SNAPSHOT_DIR / "epoch"
+
+_INT_COLUMNS = ("ids", "entity_ids", "amount_cents", "paid_cents", "due_ord", "issue_ord")
+
+
+class _ArrowStrings(Sequence):
+    """Columna de texto del snapshot sin materializar: solo se convierte lo que se indexa."""
+    __slots__ = ("_arr",)
+
+    def __init__(self, arr):
+        self._arr = arr
+
+    def __len__(self) -> int:
+        return len(self._arr)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return self._arr[i].to_pylist()
+        return self._arr[i].as_py()
+
+    def __iter__(self):
+        return iter(self._arr.to_pylist())
+
+# -----------------------------
+# Escritura
+# -----------------------------
+def _generation(max_age_s: float = LEDGER_CACHE_MAX_AGE_S) -> int:
+    """Ventana de antigüedad en reloj de pared (compartida entre procesos); 0 = sin vencimiento."""
+    return int(time.time() // max_age_s) if max_age_s > 0 else 0
+
+def _token(kind: str, bind_key: str, watermark, epoch: int = 0, generation: int = 0) -> str:
+    raw = f"{kind}|{bind_key}|{watermark!r}|e{epoch}|g{generation}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+def shared_epoch() -> int:
+    """Época compartida entre procesos (archivo junto a los snapshots); 0 si aún no existe."""
+    try:
+        return int(EPOCH_FILE.read_text(encoding="utf-8").strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+def bump_shared_epoch() -> int:
+    """Sube la época en disco: todos los procesos calculan un token (y un snapshot) nuevo."""
+    value = shared_epoch() + 1
+    EPOCH_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp = EPOCH_FILE.with_name(f"epoch.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(str(value), encoding="utf-8")
+    os.replace(tmp, EPOCH_FILE)
+    return value
+
+def _write_ipc(table, path: Path) -> None:
+    import pyarrow as pa
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table, max_chunksize=max(table.num_rows, 1))  # un solo lote: vistas contiguas
+    os.replace(tmp, path)  # atómico: los lectores ven el archivo completo o no lo ven
+
+def _ledger_table(L: LedgerArrays):
+    import pyarrow as pa
+    cols = {c: pa.array(getattr(L, c), type=pa.int64()) for c in _INT_COLUMNS}
+    cols["numbers"] = pa.array(list(L.numbers), type=pa.string())
+    return pa.table(cols)
+
+def _prune(kind: str, keep: int = LEDGER_SNAPSHOT_KEEP) -> None:
+    """Borra snapshots viejos; en POSIX los procesos que aún los tengan mapeados siguen leyendo."""
+    files = sorted(LEDGER_SNAPSHOT_DIR.glob(f"{kind}-[0-9a-f]*.arrow"), key=lambda p: p.stat().st_mtime, reverse=True)
+    for old in files[keep:]:
+        try:
+            old.unlink()
+        except OSError:
+            pass  # Windows no deja borrar un archivo mapeado: se reintenta en la próxima exportación
+
+def export_snapshot(kind: str, db=None) -> Path:
+    """Escribe (si no existe) el snapshot de la versión actual de los datos y devuelve su ruta."""
+    with _session(db) as s:
+        wm = read_watermark(kind, s)
+        token = _token(kind, _bind_key(s), wm, shared_epoch(), _generation())
+        path = LEDGER_SNAPSHOT_DIR / f"{kind}-{token}.arrow"
+        if not path.exists():
+            _write_ipc(_ledger_table(load_ledger(kind, db=s).sorted_by_id()), path)
+            _prune(kind)
+    return path
+
+# -----------------------------
+# Lectura (memory-mapped)
+# -----------------------------
+def _map_table(path: Path):
+    import pyarrow as pa
+    # sin `with`: los buffers de la tabla mantienen vivo el mapa mientras se usen
+    return pa.ipc.open_file(pa.memory_map(str(path), "r")).read_all()
+
+def _column(table, name: str) -> np.ndarray:
+    col = table.column(name)
+    return col.chunk(0).to_numpy(zero_copy_only=True) if col.num_chunks == 1 else col.to_numpy()
+
+def map_ledger(path: Path) -> LedgerArrays:
+    table = _map_table(path)
+    if table.num_rows == 0:
+        return LedgerArrays.empty()
+    arrays = [_column(table, c) for c in _INT_COLUMNS]
+    return LedgerArrays(*arrays, _ArrowStrings(table.column("numbers").chunk(0)))
+
+
+class _Mapped:
+    __slots__ = ("path", "ledger", "checked_at")
+
+    def __init__(self, path: Path, ledger: LedgerArrays):
+        self.path = path
+        self.ledger = ledger
+        self.checked_at = time.monotonic()
+
+
+_MAPPED: Dict[Tuple[str, str], _Mapped] = {}
+_LOCK = threading.Lock()
+
+def snapshot_ledger(kind: str, db=None) -> LedgerArrays:
+    """Partidas abiertas desde el snapshot compartido; lo regenera si cambió la marca de agua."""
+    with _session(db) as s, _LOCK:
+        key = (kind, _bind_key(s))
+        cur = _MAPPED.get(key)
+        if cur is not None and time.monotonic() - cur.checked_at < LEDGER_CACHE_CHECK_S:
+            return cur.ledger
+        path = export_snapshot(kind, db=s)
+        if cur is None or cur.path != path:
+            cur = _MAPPED[key] = _Mapped(path, map_ledger(path))
+        cur.checked_at = time.monotonic()
+        return cur.ledger
+
+def invalidate() -> None:
+    """Olvida los snapshots mapeados (lo llama data_version.bump(); el próximo acceso exporta uno nuevo)."""
+    with _LOCK:
+        _MAPPED.clear()
@@ -1,12 +1,97 @@
 # app/main_lc.py
-import sys, json
+"""
+CLI del asistente.
+
+    python -m app.main "¿Cuál es el DSO de agosto 2025?"      # una pregunta, salida JSON
+    python -m app.main --repl [--period 2025-08]               # sesión caliente interactiva
+
+En modo REPL se mantienen vivos Router, registro de agentes, engine de DB y cliente LLM,
+y un `GlobalState` persistente (memoria de la conversación en context['history']).
+Comandos: :period YYYY-MM | :period - | :json | :history | :warm | :q
+"""
+import time, argparse
 from app.graph_lc import run_query
+from app.serialization import dumps
+
+def _print_summary(out: dict, elapsed: float) -> None:
+    exec_pack = (out.get("gerente") or {}).get("executive_decision_bsc") or {}
+    m = out.get("metrics") or {}
+    fmt = lambda v: f"{v:.1f}d" if isinstance(v, (int, float)) else "N/D"
+    period = ((out.get("_meta") or {}).get("period_resolved") or {}).get("text", "")
+    print(f"\n[{period}] DSO={fmt(m.get('dso'))}  DPO={fmt(m.get('dpo'))}  CCC={fmt(m.get('ccc'))}")
+    print(exec_pack.get("resumen_ejecutivo", "(sin resumen)"))
+    for h in exec_pack.get("hallazgos", [])[:5]:
+        print(f"  - {h}")
+    print(f"⏱️  {elapsed * 1000:.0f} ms")
+
+def repl(period: str | None = None) -> None:
+    from app.graph_lc import warm_up
+    from app.router import Router
+    from app.state import GlobalState
+
+    t0 = time.perf_counter()
+    warm = warm_up()
+    print(f"Warm-up en {(time.perf_counter() - t0) * 1000:.0f} ms: "
+          + ", ".join(f"{k}={'ok' if v == 'ok' else 'error'}" for k, v in warm.items()))
+    state = GlobalState()
+    state.period_raw = period
+    router = Router()
+    show_json = False
+    print("Escribe tu pregunta (':q' para salir, ':period YYYY-MM' para fijar período).")
+
+    while True:
+        try:
+            line = input(f"\n{state.period_raw or 'auto'}> ").strip()
+        except (EOFError, KeyboardInterrupt):
+            print()
+            break
+        if not line:
+            continue
+        if line in (":q", ":quit", "salir", "exit"):
+            break
+        if line.startswith(":period"):
+            arg = line[len(":period"):].strip()
+            state.period_raw = None if arg in ("", "-") else arg
+            print(f"Período: {state.period_raw or 'auto (según la pregunta)'}")
+            continue
+        if line == ":json":
+            show_json = not show_json
+            print(f"Salida JSON completa: {'sí' if show_json else 'no'}")
+            continue
+        if line == ":history":
+            for i, h in enumerate(state.context.get("history", []), 1):
+                print(f"{i:>2}. {h['question']}  → {h.get('metrics')}")
+            continue
+        if line == ":warm":
+            print(warm_up())
+            continue
+
+        t0 = time.perf_counter()
+        try:
+            out = run_query(line, state=state, router=router)
+        except Exception as e:
+            print(f"❌ {type(e).__name__}: {e}  ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+            continue
+        elapsed = time.perf_counter() - t0
+        if show_json:
+            print(dumps(out, pretty=True))
+            print(f"⏱️  {elapsed * 1000:.0f} ms")
+        else:
+            _print_summary(out, elapsed)
 
 def main():
-    question = " ".join(sys.argv[1:]).strip()
-    period = None  # o fija "2025-08" si quieres
-    out = run_query(question, period)
-    print(json.dumps(out, ensure_ascii=False, indent=2))
+    ap = argparse.ArgumentParser(description="Asistente virtual (CLI)")
+    ap.add_argument("question", nargs="*")
+    ap.add_argument("--repl", action="store_true", help="Sesión interactiva con recursos calientes")
+    ap.add_argument("--period", default=None, help="Período 'YYYY-MM' (opcional)")
+    args = ap.parse_args()
+
+    if args.repl:
+        repl(args.period)
+        return
+    question = " ".join(args.question).strip()
+    out = run_query(question, args.period)
+    print(dumps(out, pretty=True))
 
 if __name__ == "__main__":
     main()
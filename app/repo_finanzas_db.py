@@ -1,10 +1,22 @@
 # app/repo_finanzas_db.py
-from datetime import datetime, date
+import os
+from datetime import datetime, date, time, timedelta
 from decimal import Decimal
-from collections import defaultdict
+from functools import wraps
 
 from database import SessionLocal
-from app.models import FacturaCXC, FacturaCXP
+from app.ledger.items import AGING_KEYS, to_cents
+from app.ledger import kernel as K
+from app.ledger.due_calendar import open_calendar
+from app.data_version import current_token
+from app.result_cache import MISS, ResultCache, make_key, shared_result_cache
+from app.ledger.rollup import closed_month_kpis
+
+# Vigencia (s) de resultados del mes en curso / dependientes de hoy; los meses cerrados no vencen
+REPO_CACHE_TTL_S = float(os.getenv("REPO_CACHE_TTL_S", "300"))
+# DSO/DPO: "average" = saldo promedio diario real del mes (app.ledger.balances);
+# "closing" = saldo actual de lo emitido en el mes (cálculo histórico)
+KPI_DSO_METHOD = os.getenv("KPI_DSO_METHOD", "average").strip().lower()
 
 def _month_bounds(year: int, month: int):
     """[inicio, fin) en datetime para comparar contra columnas timestamp sin perder registros por hora."""
@@ -15,119 +27,244 @@ def _month_bounds(year: int, month: int):
         end = datetime(year, month + 1, 1, 0, 0, 0)
     return start, end
 
+def _month_days(year: int, month: int) -> tuple[date, date]:
+    """[primer día, último día] del mes como fechas."""
+    start, end = _month_bounds(year, month)
+    return start.date(), end.date() - timedelta(days=1)
+
+def _window_days(start, end) -> tuple[date, date]:
+    """Ventana del router (datetimes con TZ, fin 23:59:59) o fechas → [primer día, último día]."""
+    first = start.date() if isinstance(start, datetime) else start
+    last = end.date() if isinstance(end, datetime) else end
+    if last < first:
+        raise ValueError(f"ventana inválida: {first} > {last}")
+    return first, last
+
+def _cents_to_decimal(cents: int) -> Decimal:
+    return Decimal(cents).scaleb(-2)
+
+def _is_closed_period(args, kwargs) -> bool:
+    dates = [a for a in args if isinstance(a, date)]
+    if dates:  # ventana [primer día, último día]: cerrada si ya terminó
+        return max(dates) < date.today()
+    year, month = (list(args[:2]) + [kwargs.get("year"), kwargs.get("month")])[:2]
+    if year is None or month is None:
+        return False
+    today = date.today()
+    return (int(year), int(month)) < (today.year, today.month)
+
+def _read_through(by_day: bool = False):
+    """
+    Resultado cacheado por (método, argumentos, versión de datos[, día]). Sin versión de
+    datos (DB no disponible) o sin caché, llama directo.
+    """
+    def deco(fn):
+        name = f"FinanzasRepoDB.{fn.__name__}"
+
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            version = current_token() if self.cache is not None else None
+            if version is None:
+                return fn(self, *args, **kwargs)
+            if by_day:
+                version = f"{version}|{date.today().isoformat()}"
+            key = make_key(name, args, kwargs, version)
+            value = self.cache.get(key)
+            if value is MISS:
+                value = fn(self, *args, **kwargs)
+                ttl = None if (not by_day and _is_closed_period(args, kwargs)) else REPO_CACHE_TTL_S
+                self.cache.put(key, value, ttl_s=ttl)
+            return dict(value) if isinstance(value, dict) else value  # el llamador puede mutarlo
+        return wrapper
+    return deco
+
+# Llaves de aging históricas de este repo (vs. 0_30/31_60/... de los agentes)
+_REPO_AGING_LABELS = dict(zip(AGING_KEYS, ("1-30", "31-60", "61-90", "+90")))
+
+def repo_aging_buckets(agg: dict) -> dict[str, float]:
+    """Salida de kernel.aging_totals (céntimos) → buckets con etiquetas de este repo."""
+    buckets = {
+        "Sin vencimiento": agg["no_due"],
+        "No vencido": agg["current"],
+        **{_REPO_AGING_LABELS[k]: v for k, v in agg["overdue"].items()},
+    }
+    # solo buckets con saldo (como antes: aparecían al encontrar la primera factura)
+    return {k: v / 100 for k, v in buckets.items() if v}  # JSON-friendly
+
 class FinanzasRepoDB:
-    """Consultas contra factura_cxc / factura_cxp para CxC, CxP, DSO/DPO y aging."""
+    """
+    Consultas contra factura_cxc / factura_cxp para CxC, CxP, DSO/DPO y aging.
+    Lee las partidas como arreglos de céntimos (app.ledger.kernel) en vez de instancias ORM y
+    agrega vectorizado; el aging sale de la caché de partidas abiertas (app.ledger.cache).
+    Los resultados son idénticos a la versión con Decimal.
 
-    # ---- CxC ----
-    def cxc_balance_by_month(self, year: int, month: int) -> Decimal:
-        start, end = _month_bounds(year, month)
+    Los métodos públicos son funciones puras de (argumentos, versión de datos) y pasan por
+    una caché read-through (app.result_cache): `cache=True` usa la compartida del proceso,
+    `cache=False` la desactiva, o se inyecta un ResultCache propio.
+
+    Los meses cerrados se leen del rollup mensual (app.ledger.rollup) si el job ya los
+    guardó; solo el mes en curso se calcula en vivo. `rollup=False` fuerza el cálculo.
+
+    `dso_range` / `dpo_range` aceptan la ventana exacta del router (semana, rango, trimestre,
+    año): días completos [inicio, fin], ponderados por la cantidad de días de la ventana.
+    """
+
+    def __init__(self, cache: "ResultCache | bool | None" = True, rollup: bool = True):
+        self.cache = shared_result_cache() if cache is True else (cache or None)
+        self.rollup = rollup
+
+    def _rolled(self, year: int, month: int, key: str):
+        if not self.rollup:
+            return None
+        kpis = closed_month_kpis(year, month)
+        if not kpis:
+            return None
+        if key in ("dso", "dpo", "ccc") and kpis.get("dso_method", "closing") != KPI_DSO_METHOD:
+            return None  # rollup calculado con el otro método
+        return kpis.get(key)
+
+    def _issued(self, kind: str, first: date, last: date):
+        """Facturas emitidas en [first, last] (días completos) y el número de días."""
+        start, end = datetime.combine(first, time.min), datetime.combine(last + timedelta(days=1), time.min)
         db = SessionLocal()
         try:
-            q = (
-                db.query(FacturaCXC)
-                .filter(FacturaCXC.fecha_emision >= start,
-                        FacturaCXC.fecha_emision < end)
-            )
-            total = Decimal("0")
-            for f in q:
-                monto = Decimal(f.monto or 0)
-                pagado = Decimal(f.monto_pagado or 0)
-                saldo = monto - pagado
-                total += saldo
-            return total
+            # incluye facturas ya pagadas: no sale de la caché de partidas abiertas
+            ledger = K.load_ledger(kind, db=db, open_only=False, issued_from=start, issued_to=end)
         finally:
             db.close()
+        return ledger, (end - start).days
 
-    def cxc_aging(self, today: date | None = None) -> dict[str, float]:
-        """Aging por buckets usando fecha_limite; suma saldos pendientes."""
-        today = today or date.today()
+    def _issued_cents(self, kind: str, first: date, last: date, by: str | None = None, key=None) -> int:
+        """Σ monto (céntimos) emitido en [first, last] desde el índice diario (app.ledger.issued_index)."""
+        from app.ledger.issued_index import issued_index
         db = SessionLocal()
-        buckets = defaultdict(Decimal)
         try:
-            for f in db.query(FacturaCXC):
-                monto = Decimal(f.monto or 0)
-                pagado = Decimal(f.monto_pagado or 0)
-                saldo = monto - pagado
-                if saldo <= 0:
-                    continue
-                if not f.fecha_limite:
-                    buckets["Sin vencimiento"] += saldo
-                    continue
-                # fecha_limite es DateTime → convierto a date
-                days = (today - f.fecha_limite.date()).days
-                if days <= 0:
-                    buckets["No vencido"] += saldo
-                elif days <= 30:
-                    buckets["1-30"] += saldo
-                elif days <= 60:
-                    buckets["31-60"] += saldo
-                elif days <= 90:
-                    buckets["61-90"] += saldo
-                else:
-                    buckets["+90"] += saldo
-            return {k: float(v) for k, v in buckets.items()}  # JSON-friendly
+            return issued_index(kind, by=by, db=db).total(first, last, key=key)[0]
         finally:
             db.close()
 
-    def dso(self, year: int, month: int, credit_sales: Decimal | None = None) -> float:
-        """DSO ≈ (CxC promedio / ventas a crédito) * días del período.
-        Si no pasas 'credit_sales', usamos sum(monto) del período como aproximación."""
-        start, end = _month_bounds(year, month)
+    def _ratio_days(self, kind: str, first: date, last: date, credit_base: Decimal | None) -> float:
+        """(saldo de lo emitido en el período / base) * días del período."""
+        ledger, days = self._issued(kind, first, last)
+        _, outstanding = K.issued_totals(ledger)
+        if credit_base is not None:
+            denom = to_cents(Decimal(credit_base))
+        else:
+            denom = self._issued_cents(kind, first, last) or 100  # 100 céntimos = 1
+        return float((Decimal(outstanding) / Decimal(denom)) * days)
+
+    def _avg_ratio_days(self, kind: str, first: date, last: date, credit_base: Decimal | None) -> float:
+        """
+        (saldo promedio diario del período / base) * días, con saldos reconstruidos a cada día.
+        En un período abierto solo cuentan los días transcurridos (hasta hoy).
+        """
+        from app.ledger.balances import timeline
+        last = min(last, date.today())
+        if last < first:
+            return 0.0  # período futuro
         db = SessionLocal()
         try:
-            ar_end = Decimal("0")
-            sales = Decimal("0")
-            q = db.query(FacturaCXC).filter(FacturaCXC.fecha_emision >= start,
-                                            FacturaCXC.fecha_emision < end)
-            for f in q:
-                monto = Decimal(f.monto or 0)
-                pagado = Decimal(f.monto_pagado or 0)
-                sales += monto
-                ar_end += (monto - pagado)
-            ar_avg = ar_end  # aproximación (si quieres, promedia con mes anterior)
-            denom = Decimal(credit_sales) if credit_sales is not None else (sales or Decimal("1"))
-            days = (end - start).days
-            return float((ar_avg / denom) * days)
+            tl = timeline(kind, db=db)
         finally:
             db.close()
+        avg = tl.average_outstanding(first, last)
+        if credit_base is not None:
+            denom = to_cents(Decimal(credit_base))
+        else:
+            denom = self._issued_cents(kind, first, last) or 100
+        return float((avg / Decimal(denom)) * ((last - first).days + 1))
 
-    # ---- CxP ----
-    def cxp_balance_by_month(self, year: int, month: int) -> Decimal:
-        start, end = _month_bounds(year, month)
+    def _days_ratio(self, kind: str, first: date, last: date, credit_base: Decimal | None) -> float:
+        if KPI_DSO_METHOD == "closing":
+            return self._ratio_days(kind, first, last, credit_base)
+        return self._avg_ratio_days(kind, first, last, credit_base)
+
+    def _window_kpi(self, name: str, start, end, credit_base: Decimal | None) -> float:
+        """KPI de días sobre [start, end]; un mes calendario completo pasa por el método mensual (rollup)."""
+        first, last = _window_days(start, end)
+        if first.day == 1 and last == _month_days(first.year, first.month)[1]:
+            return getattr(self, name)(first.year, first.month, credit_base)
+        return self._window_ratio(name, first, last, credit_base)
+
+    @_read_through()
+    def _window_ratio(self, name: str, first: date, last: date, credit_base: Decimal | None) -> float:
+        return self._days_ratio("cxc" if name == "dso" else "cxp", first, last, credit_base)
+
+    def _issued_between(self, kind: str, start, end, entity_id: int | None,
+                        punto_venta_id: int | None) -> Decimal:
+        if entity_id is not None and punto_venta_id is not None:
+            raise ValueError("use entity_id o punto_venta_id, no ambos")
+        by, key = ("entity", entity_id) if entity_id is not None else \
+                  ("punto_venta", punto_venta_id) if punto_venta_id is not None else (None, None)
+        return _cents_to_decimal(self._issued_cents(kind, *_window_days(start, end), by=by, key=key))
+
+    # ---- Ventanas arbitrarias (índice diario de emitidos) ----
+    def sales_between(self, start: date, end: date, entity_id: int | None = None,
+                      punto_venta_id: int | None = None) -> Decimal:
+        """Σ monto CxC emitido en [start, end] (días completos; fechas o datetimes del router), opcionalmente por cliente o punto de venta."""
+        return self._issued_between("cxc", start, end, entity_id, punto_venta_id)
+
+    def purchases_between(self, start: date, end: date, entity_id: int | None = None,
+                          punto_venta_id: int | None = None) -> Decimal:
+        """Σ monto CxP emitido en [start, end] (días completos; fechas o datetimes del router), opcionalmente por proveedor o punto de venta."""
+        return self._issued_between("cxp", start, end, entity_id, punto_venta_id)
+
+    # ---- CxC ----
+    @_read_through()
+    def cxc_balance_by_month(self, year: int, month: int) -> Decimal:
+        rolled = self._rolled(year, month, "cxc_balance_cents")
+        if rolled is not None:
+            return _cents_to_decimal(rolled)
+        ledger, _ = self._issued("cxc", *_month_days(year, month))
+        return _cents_to_decimal(K.issued_totals(ledger)[1])
+
+    @_read_through(by_day=True)
+    def cxc_aging(self, today: date | None = None) -> dict[str, float]:
+        """Aging por buckets usando fecha_limite; suma saldos pendientes a `today` (hoy por defecto).
+        Un cierre de mes pasado sale del rollup; otro día pasado, de app.ledger.aging_history."""
+        today = today or date.today()
+        if today < date.today() and today == _month_days(today.year, today.month)[1]:
+            rolled = self._rolled(today.year, today.month, "cxc_aging")
+            if rolled is not None:
+                return dict(rolled)
         db = SessionLocal()
         try:
-            q = (
-                db.query(FacturaCXP)
-                .filter(FacturaCXP.fecha_emision >= start,
-                        FacturaCXP.fecha_emision < end)
-            )
-            total = Decimal("0")
-            for f in q:
-                monto = Decimal(f.monto or 0)
-                pagado = Decimal(f.monto_pagado or 0)
-                saldo = monto - pagado
-                total += saldo
-            return total
+            if today < date.today():
+                from app.ledger.aging_history import aging_as_of
+                agg = aging_as_of("cxc", today, db=db)  # saldos de ese día, no los actuales
+            else:
+                agg = open_calendar("cxc", db=db).aging(today)
         finally:
             db.close()
+        return repo_aging_buckets(agg)
 
+    @_read_through()
+    def dso(self, year: int, month: int, credit_sales: Decimal | None = None) -> float:
+        """DSO = (CxC promedio / ventas a crédito) * días del período.
+        Si no pasas 'credit_sales', usamos sum(monto) del período como aproximación."""
+        # ar_avg = promedio diario del saldo reconstruido con los pagos (KPI_DSO_METHOD=closing: saldo actual)
+        rolled = self._rolled(year, month, "dso") if credit_sales is None else None
+        return rolled if rolled is not None else self._days_ratio("cxc", *_month_days(year, month), credit_sales)
+
+    def dso_range(self, start, end, credit_sales: Decimal | None = None) -> float:
+        """DSO sobre una ventana exacta [start, end] (datetimes del router o fechas), ponderado por días."""
+        return self._window_kpi("dso", start, end, credit_sales)
+
+    # ---- CxP ----
+    @_read_through()
+    def cxp_balance_by_month(self, year: int, month: int) -> Decimal:
+        rolled = self._rolled(year, month, "cxp_balance_cents")
+        if rolled is not None:
+            return _cents_to_decimal(rolled)
+        ledger, _ = self._issued("cxp", *_month_days(year, month))
+        return _cents_to_decimal(K.issued_totals(ledger)[1])
+
+    @_read_through()
     def dpo(self, year: int, month: int, credit_purchases: Decimal | None = None) -> float:
         """DPO ≈ (CxP promedio / compras a crédito) * días del período."""
-        start, end = _month_bounds(year, month)
-        db = SessionLocal()
-        try:
-            ap_end = Decimal("0")
-            purchases = Decimal("0")
-            q = db.query(FacturaCXP).filter(FacturaCXP.fecha_emision >= start,
-                                            FacturaCXP.fecha_emision < end)
-            for f in q:
-                monto = Decimal(f.monto or 0)
-                pagado = Decimal(f.monto_pagado or 0)
-                purchases += monto
-                ap_end += (monto - pagado)
-            ap_avg = ap_end
-            denom = Decimal(credit_purchases) if credit_purchases is not None else (purchases or Decimal("1"))
-            days = (end - start).days
-            return float((ap_avg / denom) * days)
-        finally:
-            db.close()
+        rolled = self._rolled(year, month, "dpo") if credit_purchases is None else None
+        return rolled if rolled is not None else self._days_ratio("cxp", *_month_days(year, month), credit_purchases)
+
+    def dpo_range(self, start, end, credit_purchases: Decimal | None = None) -> float:
+        """DPO sobre una ventana exacta [start, end] (datetimes del router o fechas), ponderado por días."""
+        return self._window_kpi("dpo", start, end, credit_purchases)
@@ -0,0 +1,209 @@
+# app/result_cache.py
+"""
+Caché de resultados read-through en dos niveles para funciones puras de (argumentos, datos).
+
+  - memoria: LRU por proceso (RESULT_CACHE_MAX_ENTRIES)
+  - disco (opcional): un archivo por llave en RESULT_CACHE_DIR, compartido entre procesos
+    (workers del batch, servicio, Streamlit); escritura atómica con tmp + os.replace
+
+La llave la arma el llamador con `make_key(nombre, args, kwargs, data_version)`: al cambiar
+los datos (app.data_version) cambia la llave y las entradas viejas simplemente dejan de usarse.
+Cada entrada tiene TTL opcional; `ttl_s=None` = sin vencimiento (períodos cerrados).
+
+Como la llave incluye data_version, cada cambio de datos deja huérfanos los archivos de la
+versión anterior (los de períodos cerrados nunca vencen). El nivel disco se poda en la
+primera escritura de cada proceso y luego cada RESULT_CACHE_PRUNE_EVERY: borra lo no usado
+en RESULT_CACHE_DISK_MAX_AGE_S (cada hit en disco renueva el mtime) y, si aún supera
+RESULT_CACHE_DISK_MAX_MB, lo menos usado primero.
+
+Los valores se guardan como JSON (app.serialization) con Decimal etiquetado para devolver
+exactamente el mismo tipo que la función original.
+
+Configuración:
+  - RESULT_CACHE               1/0 (por defecto 1)
+  - RESULT_CACHE_MAX_ENTRIES   entradas en memoria (por defecto 512)
+  - RESULT_CACHE_DIR           carpeta del nivel disco; vacío = solo memoria (por defecto vacío)
+  - RESULT_CACHE_DISK_MAX_MB   tamaño máximo del nivel disco (por defecto 512)
+  - RESULT_CACHE_DISK_MAX_AGE_S  segundos sin uso antes de borrar un archivo (por defecto 7 días)
+  - RESULT_CACHE_PRUNE_EVERY   escrituras a disco entre podas (por defecto 256)
+"""
+from __future__ import annotations
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from app.serialization import dumps_bytes, loads
+
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "512"))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "").strip()
+RESULT_CACHE_DISK_MAX_MB = float(os.getenv("RESULT_CACHE_DISK_MAX_MB", "512"))
+RESULT_CACHE_DISK_MAX_AGE_S = float(os.getenv("RESULT_CACHE_DISK_MAX_AGE_S", str(7 * 24 * 3600)))
+RESULT_CACHE_PRUNE_EVERY = int(os.getenv("RESULT_CACHE_PRUNE_EVERY", "256"))
+
+MISS = object()
+
+
+def make_key(name: str, args: Tuple, kwargs: Dict[str, Any], data_version: str) -> str:
+    raw = f"{name}|{args!r}|{sorted(kwargs.items())!r}|{data_version}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _encode(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return {"$decimal": str(value)}
+    return value
+
+def _decode(value: Any) -> Any:
+    if isinstance(value, dict) and "$decimal" in value:
+        return Decimal(value["$decimal"])
+    return value
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = RESULT_CACHE_MAX_ENTRIES, disk_dir: Optional[str] = RESULT_CACHE_DIR,
+                 disk_max_mb: float = RESULT_CACHE_DISK_MAX_MB, disk_max_age_s: float = RESULT_CACHE_DISK_MAX_AGE_S,
+                 prune_every: int = RESULT_CACHE_PRUNE_EVERY):
+        self.max_entries = max_entries
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_max_bytes = int(disk_max_mb * 1024 * 1024)
+        self.disk_max_age_s = disk_max_age_s
+        self.prune_every = max(1, prune_every)
+        self._mem: "OrderedDict[str, Tuple[Optional[float], Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._prune_lock = threading.Lock()
+        self._disk_writes = 0
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "pruned": 0}
+
+    # ---- API ----
+    def get(self, key: str) -> Any:
+        now = time.time()
+        with self._lock:
+            item = self._mem.get(key)
+            if item is not None:
+                expires, value = item
+                if expires is None or expires > now:
+                    self._mem.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return value
+                del self._mem[key]
+        value, expires = self._disk_get(key, now)
+        with self._lock:
+            if value is MISS:
+                self._stats["misses"] += 1
+                return MISS
+            self._stats["disk_hits"] += 1
+            self._mem_put(key, value, expires)
+        return value
+
+    def put(self, key: str, value: Any, ttl_s: Optional[float] = None) -> None:
+        expires = time.time() + ttl_s if ttl_s is not None else None
+        with self._lock:
+            self._mem_put(key, value, expires)
+            self._stats["puts"] += 1
+        self._disk_put(key, value, expires)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def prune(self) -> int:
+        """Poda del nivel disco (antigüedad, luego tamaño, menos usado primero); devuelve archivos borrados."""
+        if self.disk_dir is None or not self._prune_lock.acquire(blocking=False):
+            return 0  # otra poda en curso en este proceso
+        try:
+            now = time.time()
+            files = []
+            for path in self.disk_dir.glob("*/*"):
+                try:
+                    st = path.stat()
+                except OSError:
+                    continue  # borrado por otro proceso
+                files.append((st.st_mtime, st.st_size, path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            removed = 0
+            for mtime, size, path in files:
+                stale = now - mtime > self.disk_max_age_s
+                # .tmp huérfanos de escrituras interrumpidas: solo si ya tienen edad
+                if path.suffix == ".tmp" and now - mtime < 3600:
+                    continue
+                if not stale and path.suffix != ".tmp" and total <= self.disk_max_bytes:
+                    continue
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            with self._lock:
+                self._stats["pruned"] += removed
+            return removed
+        finally:
+            self._prune_lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "entries": len(self._mem), "disk": str(self.disk_dir) if self.disk_dir else None}
+
+    # ---- Internos ----
+    def _mem_put(self, key: str, value: Any, expires: Optional[float]) -> None:
+        self._mem[key] = (expires, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _disk_get(self, key: str, now: float) -> Tuple[Any, Optional[float]]:
+        if self.disk_dir is None:
+            return MISS, None
+        try:
+            rec = loads(self._path(key).read_bytes())
+        except (OSError, ValueError):
+            return MISS, None
+        expires = rec.get("expires")
+        if expires is not None and expires <= now:
+            return MISS, None
+        try:
+            os.utime(self._path(key))  # mtime = último uso, para la poda
+        except OSError:
+            pass
+        return _decode(rec.get("value")), expires
+
+    def _disk_put(self, key: str, value: Any, expires: Optional[float]) -> None:
+        if self.disk_dir is None:
+            return
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+            tmp.write_bytes(dumps_bytes({"expires": expires, "value": _encode(value)}))
+            os.replace(tmp, path)
+        except OSError:
+            return  # el nivel disco es best-effort: la memoria ya tiene el valor
+        with self._lock:
+            self._disk_writes += 1
+            due = (self._disk_writes - 1) % self.prune_every == 0  # la primera escritura del proceso también poda
+        if due:
+            self.prune()
+
+
+_SHARED: Optional[ResultCache] = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_result_cache() -> Optional[ResultCache]:
+    """Instancia de proceso; None si RESULT_CACHE=0."""
+    global _SHARED
+    if not RESULT_CACHE:
+        return None
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = ResultCache()
+        return _SHARED
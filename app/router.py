@@ -1,16 +1,37 @@
 # app/router.py
 from __future__ import annotations
-from typing import Dict, Any, List, Optional
+import os
+import sys
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import replace
+from typing import Dict, Any, List, Optional, Callable
 from datetime import datetime
 from calendar import monthrange
 from zoneinfo import ZoneInfo
 
 from .state import GlobalState
 from .agents.registry import get_agent
-from .dates.period_resolver import resolve_period
+from .dates.period_resolver import comparison_periods, resolve_period, wants_comparison
 from app.intent.engine import decide_agents  # keywords + LLM + umbrales
+from app.sql_instrumentation import track_queries
+from app.admission import current_request
+from app.artifacts import ArtifactStore
+from app.data_version import current_token
 
 TZ = ZoneInfo("America/Costa_Rica")
+# Espera máxima (s) por los pipelines de períodos comparativos
+ROUTER_COMPARE_TIMEOUT_S = float(os.getenv("ROUTER_COMPARE_TIMEOUT_S", "60"))
+# Agentes que se re-ejecutan por cada período comparativo (solo KPIs)
+_COMPARE_AGENTS = ("aaav_cxc", "aaav_cxp")
+
+# Callback de progreso: on_event(evento, datos) con evento en
+#   "period"  → {"period": {...}}                  (período resuelto)
+#   "agent"   → {"agent": nombre, "result": {...}} (cada subagente al terminar)
+#   "metrics" → {"metrics": {...}}                 (KPIs derivados, antes del gerente)
+#   "comparison" → {"label": ..., "kpis": {...}}   (KPIs de cada período comparativo)
+#   "final"   → {"result": {...}}                  (salida completa para la UI)
+OnEvent = Callable[[str, Dict[str, Any]], None]
 
 # -----------------------------
 # Helpers de período
@@ -36,6 +57,36 @@ def _coerce_sidebar_period(period_str: Optional[str]) -> Optional[dict]:
         }
     return None
 
+def _ledger_cache_stats() -> Optional[Dict[str, Any]]:
+    """Métricas de app.ledger.cache solo si algún agente ya lo cargó (no arrastra numpy al arranque)."""
+    mod = sys.modules.get("app.ledger.cache")
+    return mod.ledger_cache().stats() if mod is not None else None
+
+def _result_cache_stats() -> Optional[Dict[str, Any]]:
+    mod = sys.modules.get("app.result_cache")
+    cache = mod.shared_result_cache() if mod is not None else None
+    return cache.stats() if cache is not None else None
+
+def _rollup_stats() -> Optional[Dict[str, Any]]:
+    mod = sys.modules.get("app.ledger.rollup")
+    if mod is None or not mod.KPI_ROLLUP:
+        return None
+    try:
+        return mod.rollup_stats()
+    except Exception:
+        return None
+
+def _period_dict(pr: Dict[str, Any]) -> Dict[str, Any]:
+    """Salida de resolve_period (datetimes) → dict serializable que reciben los agentes."""
+    return {
+        "text": pr["text"],
+        "start": pr["start"].isoformat(),
+        "end":   pr["end"].isoformat(),
+        "granularity": pr["granularity"],
+        "source": pr["source"],
+        "tz": pr["tz"],
+    }
+
 def _dedup_preserving_order(names: List[str]) -> List[str]:
     seen, out = set(), []
     for n in names:
@@ -80,7 +131,54 @@ class Router:
     def __init__(self, default_agent: str = "av_gerente"):
         self.default_agent = default_agent  # no se usa para activar por defecto
 
-    def dispatch(self, task: Dict[str, Any], state: GlobalState) -> Dict[str, Any]:
+    @staticmethod
+    def _safe_emit(on_event: Optional[OnEvent]) -> Callable[[str, Dict[str, Any]], None]:
+        """El callback es solo de UI: si falla se anota en el log y la consulta sigue."""
+        if on_event is None:
+            return lambda event, data: None
+
+        def emit(event: str, data: Dict[str, Any]) -> None:
+            try:
+                on_event(event, data)
+            except Exception as e:
+                print(f"[router] on_event({event!r}) falló: {type(e).__name__}: {e}", file=sys.stderr)
+        return emit
+
+    def _run_kpi_pipeline(self, agents: List[str], period: Dict[str, Any],
+                          state: GlobalState) -> tuple[Dict[str, Any], Dict[str, Any]]:
+        """
+        CxC/CxP (acción "metrics") + Contable para un período comparativo. Estado propio para
+        no mezclar trace/contexto con el período actual. Devuelve ({DSO, DPO, CCC}, sql_stats).
+        """
+        sub_state = replace(state, period=period, context={}, trace=[], errors=[])
+        blobs: Dict[str, Optional[Dict[str, Any]]] = {}
+        trace: List[Dict[str, Any]] = []
+        stats: Dict[str, Any] = {}
+        for name in agents:
+            with track_queries(name) as qs:
+                result = get_agent(name).handle({"payload": {"period_range": period, "action": "metrics"}},
+                                                sub_state) or {}
+            stats[name] = qs.as_dict()
+            result["agent"] = name
+            trace.append(result)
+            blobs[name] = None if result.get("error") else result
+        with track_queries("aav_contable") as qs:
+            cont_res = get_agent("aav_contable").handle({"payload": {
+                "period_range": period, "cxc_data": blobs.get("aaav_cxc"), "cxp_data": blobs.get("aaav_cxp"),
+            }}, sub_state) or {}
+        stats["aav_contable"] = qs.as_dict()
+        cont_res["agent"] = "aav_contable"
+        trace.append(cont_res)
+        m = _derive_metrics_from_trace(trace)
+        return {"DSO": m["dso"], "DPO": m["dpo"], "CCC": m["ccc"]}, stats
+
+    def dispatch(self, task: Dict[str, Any], state: GlobalState,
+                 on_event: Optional[OnEvent] = None) -> Dict[str, Any]:
+        """
+        on_event: callback opcional para streaming; recibe cada resultado apenas está listo
+                  (CxC/CxP → Contable → métricas → gerente al final).
+        """
+        emit = self._safe_emit(on_event)
         payload  = task.get("payload", {}) or {}
         question = payload.get("question", "") or ""
 
@@ -89,15 +187,20 @@ class Router:
         override = _coerce_sidebar_period(sidebar_period_str)
         pr = resolve_period(question, override)  # devuelve datetimes (aware) TZ CR
 
-        period = {
-            "text": pr["text"],
-            "start": pr["start"].isoformat(),
-            "end":   pr["end"].isoformat(),
-            "granularity": pr["granularity"],
-            "source": pr["source"],
-            "tz": pr["tz"],
-        }
+        # 1.b) Preguntas comparativas: período anterior y mismo período del año anterior
+        compare = payload.get("compare")
+        if compare is None:
+            compare = wants_comparison(question)
+        compare_prs: Dict[str, Dict[str, Any]] = {}
+        if compare:
+            pr, compare_prs = comparison_periods(question, pr)
+
+        period = _period_dict(pr)
+        comparisons = {label: _period_dict(p) for label, p in compare_prs.items()}
         state.period = period  # queda disponible para todos los agentes
+        # versión de los datos al inicio de la solicitud: llave común para cachés de cualquier capa
+        state.data_version = current_token()
+        emit("period", {"period": period})
 
         # 2) Decisión exhaustiva de agentes (keywords + LLM, SIN defaults)
         intent_pack = decide_agents(question)  # {selected: [...], reasons: {...}}
@@ -118,7 +221,7 @@ class Router:
 
         # 4) Si no hay señales suficientes, NO ejecutar y explicar
         if not agent_sequence:
-            return {
+            empty = {
                 "intent": {"informe": False, "cxc": False, "cxp": False, "reason": "no-signals"},
                 "gerente": {"executive_decision_bsc": {
                     "resumen_ejecutivo": "No se activaron agentes: la pregunta no aportó señales suficientes.",
@@ -134,25 +237,50 @@ class Router:
                 "administrativo": {"hallazgos": [], "orders": []},
                 "metrics": {"dso": None, "dpo": None, "ccc": None, "cash": None},
                 "trace": state.trace,
-                "_meta": {"period_resolved": period, "router_sequence": []}
+                "_meta": {"period_resolved": period, "router_sequence": [], "data_version": state.data_version}
             }
+            emit("final", {"result": empty})
+            return empty
+
+        # 5.a) Períodos comparativos en paralelo (solo KPIs), mientras corre el período actual.
+        # Cada hilo abre sus propias sesiones (el repo usa una por llamada): no es una sola
+        # transacción REPEATABLE READ. La coherencia entre períodos viene de las cachés
+        # atadas a data_version (libro, línea de saldos, índice de emisión, rollup).
+        #      Comparten las cachés de proceso y la versión de datos de esta solicitud.
+        compare_agents = [a for a in agent_sequence if a in _COMPARE_AGENTS]
+        pool: Optional[ThreadPoolExecutor] = None
+        compare_futures: Dict[str, Future] = {}
+        if comparisons and compare_agents:
+            pool = ThreadPoolExecutor(max_workers=len(comparisons), thread_name_prefix="av-compare")
+            for label, cmp_period in comparisons.items():
+                ctx = contextvars.copy_context()  # admisión / conteo SQL del request
+                compare_futures[label] = pool.submit(ctx.run, self._run_kpi_pipeline,
+                                                     compare_agents, cmp_period, state)
 
         # 5) Ejecutar subagentes en orden (CxC/CxP primero; Contable después con insumos)
         trace: List[Dict[str, Any]] = []
         cxc_blob: Optional[Dict[str, Any]] = None
         cxp_blob: Optional[Dict[str, Any]] = None
+        sql_stats: Dict[str, Any] = {}  # conteo de sentencias / N+1 por agente
+        # Tablas grandes (list_open, list_overdue…) se guardan una vez fuera del trace;
+        # el trace, la respuesta y los exports llevan solo referencias + resumen.
+        artifacts = ArtifactStore()
 
         for agent_name in [a for a in agent_sequence if a != "aav_contable"]:
             agent = get_agent(agent_name)
-            try:
-                # IMPORTANTE: pasar period_range (el dict unificado)
-                result = agent.handle({"payload": {"question": question, "period_range": period}}, state)
-            except TypeError:
-                result = agent.handle({"payload": {"period_range": period}}, state)
+            with track_queries(agent_name) as qs:
+                try:
+                    # IMPORTANTE: pasar period_range (el dict unificado)
+                    result = agent.handle({"payload": {"question": question, "period_range": period}}, state)
+                except TypeError:
+                    result = agent.handle({"payload": {"period_range": period}}, state)
+            sql_stats[agent_name] = qs.as_dict()
 
             result = result or {}
             result["agent"] = agent_name
+            artifacts.compact_agent_result(result)
             trace.append(result)
+            emit("agent", {"agent": agent_name, "result": result})
 
             # conservar blobs exitosos para el contable
             if agent_name == "aaav_cxc" and not result.get("error"):
@@ -171,15 +299,38 @@ class Router:
                     "cxp_data": cxp_blob,
                 }
             }
-            cont_res = contable.handle(cont_payload, state) or {}
+            with track_queries("aav_contable") as qs:
+                cont_res = contable.handle(cont_payload, state) or {}
+            sql_stats["aav_contable"] = qs.as_dict()
             cont_res["agent"] = "aav_contable"
             trace.append(cont_res)
+            emit("agent", {"agent": "aav_contable", "result": cont_res})
+
+        # KPIs listos antes del LLM: la UI puede pintar cards/aging sin esperar al gerente
+        derived_metrics = _derive_metrics_from_trace(trace)
+        emit("metrics", {"metrics": derived_metrics})
+
+        # 6.b) Recoger los períodos comparativos → prev_kpis para el gerente
+        prev_kpis: Dict[str, Any] = {}
+        try:
+            for label, fut in compare_futures.items():
+                try:
+                    kpis, stats = fut.result(timeout=ROUTER_COMPARE_TIMEOUT_S)
+                    sql_stats.update({f"{name}@{label}": s for name, s in stats.items()})
+                except Exception as e:
+                    kpis = {"error": f"{type(e).__name__}: {e}"}
+                prev_kpis[label] = {"period": comparisons[label], **kpis}
+                emit("comparison", {"label": label, "kpis": prev_kpis[label]})
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
 
         # 7) Gerente al final (consolidación ejecutiva)
         gerente = get_agent("av_gerente")
-        final_report = gerente.handle({
-            "payload": {"trace": trace, "question": question, "period": period}
-        }, state) or {}
+        gerente_payload = {"trace": trace, "question": question, "period": period}
+        if prev_kpis:
+            gerente_payload["prev_kpis"] = prev_kpis
+        final_report = gerente.handle({"payload": gerente_payload}, state) or {}
 
         # 8) Normalización de salida para la UI
         #    Tomar el pack correcto desde 'executive_decision_bsc' (o usar todo el dict si ya viene plano)
@@ -197,9 +348,6 @@ class Router:
             }),
         }
 
-        # Derivar KPIs para las cards (contable primero, luego mirrors CxC/CxP)
-        derived_metrics = _derive_metrics_from_trace(trace)
-
         ui_result = {
             "intent": final_report.get("intent") or {
                 "informe": True,
@@ -215,9 +363,30 @@ class Router:
             "metrics": derived_metrics,
             "trace": state.trace + trace
         }
+        if prev_kpis:
+            ui_result["prev_kpis"] = prev_kpis
 
         # 9) Metadatos útiles
         ui_result.setdefault("_meta", {})
         ui_result["_meta"]["router_sequence"] = agent_sequence + ["av_gerente"]
         ui_result["_meta"]["period_resolved"]  = period
+        if comparisons:
+            ui_result["_meta"]["periods_compared"] = comparisons
+        ui_result["_meta"]["data_version"] = state.data_version
+        ui_result["_meta"]["sql"] = sql_stats
+        ui_result["_meta"]["request_id"] = artifacts.request_id
+        ui_result["_meta"]["artifacts"] = artifacts.refs
+        rc = current_request()
+        if rc is not None:
+            ui_result["_meta"]["admission"] = rc.summary()
+        cache_stats = _ledger_cache_stats()
+        if cache_stats is not None:
+            ui_result["_meta"]["ledger_cache"] = cache_stats
+        repo_stats = _result_cache_stats()
+        if repo_stats is not None:
+            ui_result["_meta"]["result_cache"] = repo_stats
+        rollup_stats = _rollup_stats()
+        if rollup_stats is not None:
+            ui_result["_meta"]["kpi_rollup"] = rollup_stats  # incluye desde cuándo está desactualizado
+        emit("final", {"result": ui_result})
         return ui_result
@@ -0,0 +1,153 @@
+# app/serialization.py
+"""
+Serialización única para resultados, exports y logs.
+
+- `to_jsonable(obj)`: convierte a tipos JSON nativos (Decimal, date/datetime, dataclasses,
+  numpy, objetos fuzzy low/mid/high, modelos con to_dict/model_dump, sets…).
+- `dumps` / `dumps_bytes` / `loads`: JSON con orjson si está instalado (rápido y con soporte
+  nativo de date/datetime/dataclass/numpy); si no, `json` estándar con el mismo `default`.
+- `packb` / `unpackb`: binario compacto con msgpack (opcional).
+- `append_ndjson` / `iter_ndjson`: una línea por registro (logs, batch, artefactos).
+- `dump_file(obj, path)`: elige formato por extensión (.json, .ndjson, .msgpack).
+"""
+from __future__ import annotations
+
+import json
+import dataclasses
+from array import array
+from datetime import date, datetime, time
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, Iterable, Iterator, IO
+
+try:
+    import orjson as _orjson
+except ImportError:  # orjson es opcional: mismo resultado con json estándar
+    _orjson = None
+
+# -----------------------------
+# Conversión a tipos nativos
+# -----------------------------
+def _is_numpy(obj: Any) -> bool:
+    return type(obj).__module__ == "numpy"
+
+def _default(obj: Any) -> Any:
+    """Hook `default` para json/orjson/msgpack: solo ve lo que el encoder no sabe serializar."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, (datetime, date, time)):
+        return obj.isoformat()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return dataclasses.asdict(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if _is_numpy(obj) or isinstance(obj, array):
+        return obj.tolist() if hasattr(obj, "tolist") else obj.item()
+    # Objetos tipo fuzzy con atributos low/mid/high → dict
+    if all(hasattr(obj, a) for a in ("low", "mid", "high")):
+        try:
+            return {"low": float(obj.low), "mid": float(obj.mid), "high": float(obj.high)}
+        except (TypeError, ValueError):
+            pass
+    for attr in ("to_jsonable_payload", "to_dict", "as_dict", "model_dump"):
+        fn = getattr(obj, attr, None)
+        if callable(fn):
+            try:
+                return fn()
+            except Exception:
+                pass
+    if hasattr(obj, "items"):
+        try:
+            return dict(obj.items())
+        except Exception:
+            pass
+    return str(obj)
+
+def to_jsonable(obj: Any) -> Any:
+    """Copia recursiva con solo dict/list/str/int/float/bool/None."""
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, dict):
+        return {str(k): to_jsonable(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [to_jsonable(v) for v in obj]
+    converted = _default(obj)
+    if converted is obj or isinstance(converted, str):
+        return converted
+    return to_jsonable(converted)
+
+# -----------------------------
+# JSON
+# -----------------------------
+def dumps_bytes(obj: Any, pretty: bool = False) -> bytes:
+    if _orjson is not None:
+        opts = _orjson.OPT_NON_STR_KEYS | _orjson.OPT_SERIALIZE_NUMPY | _orjson.OPT_PASSTHROUGH_SUBCLASS
+        if pretty:
+            opts |= _orjson.OPT_INDENT_2
+        try:
+            return _orjson.dumps(obj, default=_default, option=opts)
+        except TypeError:
+            # p. ej. enteros fuera de 64 bits: se normaliza y se reintenta por la vía estándar
+            obj = to_jsonable(obj)
+    return json.dumps(obj, ensure_ascii=False, default=_default,
+                      indent=2 if pretty else None,
+                      separators=None if pretty else (",", ":")).encode("utf-8")
+
+def dumps(obj: Any, pretty: bool = False) -> str:
+    return dumps_bytes(obj, pretty=pretty).decode("utf-8")
+
+def loads(data: str | bytes) -> Any:
+    if _orjson is not None:
+        return _orjson.loads(data)
+    return json.loads(data)
+
+# -----------------------------
+# msgpack (opcional)
+# -----------------------------
+def packb(obj: Any) -> bytes:
+    import msgpack
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+def unpackb(data: bytes) -> Any:
+    import msgpack
+    return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+# -----------------------------
+# NDJSON
+# -----------------------------
+def append_ndjson(fh: IO[str], records: Iterable[Any]) -> int:
+    n = 0
+    for rec in records:
+        fh.write(dumps(rec))
+        fh.write("\n")
+        n += 1
+    return n
+
+def iter_ndjson(path: str | Path, skip_invalid: bool = True) -> Iterator[Any]:
+    """Registros de un NDJSON; por defecto ignora líneas truncadas (corte a medio escribir)."""
+    with Path(path).open("r", encoding="utf-8") as fh:
+        for line in fh:
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except ValueError:
+                if not skip_invalid:
+                    raise
+
+# -----------------------------
+# Archivos
+# -----------------------------
+def dump_file(obj: Any, path: str | Path, pretty: bool = False) -> Path:
+    """Escribe según la extensión: .msgpack/.mpk binario, .ndjson una línea por elemento, si no JSON."""
+    p = Path(path)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    suffix = p.suffix.lower()
+    if suffix in (".msgpack", ".mpk"):
+        p.write_bytes(packb(obj))
+    elif suffix == ".ndjson":
+        with p.open("w", encoding="utf-8") as fh:
+            append_ndjson(fh, obj if isinstance(obj, list) else [obj])
+    else:
+        p.write_bytes(dumps_bytes(obj, pretty=pretty))
+    return p
@@ -0,0 +1,234 @@
+# app/service.py
+"""
+Modo servicio: HTTP/JSON de larga duración sobre `graph_lc.run_query`.
+
+- Mantiene calientes pool de DB, cliente LLM y registro de agentes (`warm_up` al arrancar).
+- Atiende con un pool acotado de workers; si las solicitudes en espera (cómputos propios +
+  las que esperan un cómputo coalescido) llegan a `max_pending` responde 503.
+- Coalesce solicitudes idénticas en vuelo `(question, period)`: los usuarios concurrentes
+  que preguntan lo mismo comparten un único cómputo.
+
+Endpoints:
+    POST /query   {"question": str, "period": "YYYY-MM"|null, "inline": bool}  -> resultado de run_query
+    GET  /artifacts/<request_id>/<artifact_id>?offset=0&limit=100  -> filas de una tabla referenciada
+    GET  /health  -> estado del warm-up y estadísticas del pool/coalescing
+
+Las tablas grandes del resultado llegan como referencias de app.artifacts ({"$artifact": …})
+y se paginan con /artifacts mientras sigan en el backend (el de memoria retiene las últimas
+ARTIFACT_MAX_REQUESTS solicitudes; ARTIFACT_BACKEND=disk las conserva). Con "inline": true
+la respuesta trae las filas completas en lugar de referencias.
+
+Uso:
+    python -m app.service --host 127.0.0.1 --port 8765 --workers 4
+"""
+from __future__ import annotations
+
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from app.serialization import dumps_bytes
+
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "4"))
+SERVICE_MAX_PENDING = int(os.getenv("SERVICE_MAX_PENDING", "64"))
+SERVICE_TIMEOUT_S = float(os.getenv("SERVICE_TIMEOUT_S", "300"))
+
+
+class Overloaded(RuntimeError):
+    """La cola del servicio está llena."""
+
+
+def _normalize_key(question: str, period: Optional[str]) -> Tuple[str, str]:
+    return (" ".join((question or "").split()).lower(), (period or "").strip())
+
+
+class QueryService:
+    """Pool acotado + coalescing de solicitudes idénticas en vuelo."""
+
+    def __init__(self, backend: Optional[Callable[[str, Optional[str]], Dict[str, Any]]] = None,
+                 workers: int = SERVICE_WORKERS, max_pending: int = SERVICE_MAX_PENDING):
+        if backend is None:
+            from app.graph_lc import run_query
+            backend = run_query
+        self.backend = backend
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="av-worker")
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._waiting = 0  # solicitudes aceptadas sin respuesta todavía (incluye coalescidas)
+        self.stats = {"requests": 0, "computed": 0, "coalesced": 0, "rejected": 0, "errors": 0}
+
+    def submit(self, question: str, period: Optional[str]) -> Tuple[Future, bool]:
+        """Devuelve (future, coalesced). Lanza Overloaded si la cola está llena."""
+        key = _normalize_key(question, period)
+        with self._lock:
+            self.stats["requests"] += 1
+            if self._waiting >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise Overloaded(f"Cola llena ({self.max_pending} solicitudes en espera)")
+            self._waiting += 1
+            fut = self._inflight.get(key)
+            coalesced = fut is not None
+            if coalesced:
+                self.stats["coalesced"] += 1
+            else:
+                fut = self._pool.submit(self._compute, question, period)
+                self._inflight[key] = fut
+                self.stats["computed"] += 1
+        if not coalesced:
+            fut.add_done_callback(lambda _f, k=key: self._release(k))
+        fut.add_done_callback(lambda _f: self._waiter_done())
+        return fut, coalesced
+
+    def _compute(self, question: str, period: Optional[str]) -> Dict[str, Any]:
+        try:
+            return self.backend(question, period)
+        except Exception:
+            with self._lock:
+                self.stats["errors"] += 1
+            raise
+
+    def _release(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _waiter_done(self) -> None:
+        with self._lock:
+            self._waiting -= 1
+
+    def query(self, question: str, period: Optional[str], timeout: float = SERVICE_TIMEOUT_S) -> Tuple[Dict[str, Any], bool]:
+        fut, coalesced = self.submit(question, period)
+        return fut.result(timeout=timeout), coalesced
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, inflight=len(self._inflight), waiting=self._waiting,
+                        max_pending=self.max_pending)
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+# -----------------------------
+# HTTP
+# -----------------------------
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # backlog de sockets; el límite real lo pone QueryService
+
+
+def _make_handler(service: QueryService, warm_status: Dict[str, Any]):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "AsistenteVirtual/0.1"
+
+        def _send(self, code: int, body: Dict[str, Any]) -> None:
+            raw = dumps_bytes(body)
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(raw)))
+            self.end_headers()
+            self.wfile.write(raw)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            parts = [p for p in url.path.split("/") if p]
+            if parts == ["health"]:
+                from app.admission import admission_snapshot
+                self._send(200, {"status": "ok", "warm": warm_status, "service": service.snapshot(),
+                                 "admission": admission_snapshot()})
+            elif len(parts) == 3 and parts[0] == "artifacts":
+                self._artifact(parts[1], parts[2], parse_qs(url.query))
+            else:
+                self._send(404, {"error": "not found"})
+
+        def _artifact(self, request_id: str, artifact_id: str, qs: Dict[str, Any]) -> None:
+            from app.artifacts import ArtifactNotFound, fetch_artifact
+            try:
+                offset = max(0, int((qs.get("offset") or ["0"])[0]))
+                limit = qs.get("limit")
+                limit = max(0, int(limit[0])) if limit else None
+            except ValueError:
+                self._send(400, {"error": "offset/limit deben ser enteros"})
+                return
+            try:
+                rows = fetch_artifact(request_id, artifact_id, offset, limit)
+            except ArtifactNotFound:
+                self._send(404, {"error": f"artefacto expirado o inexistente: {request_id}/{artifact_id}"})
+                return
+            self._send(200, {"request_id": request_id, "artifact": artifact_id, "offset": offset, "rows": rows})
+
+        def do_POST(self):
+            if self.path.rstrip("/") != "/query":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+            except Exception as e:
+                self._send(400, {"error": f"JSON inválido: {e}"})
+                return
+            question = str(body.get("question") or "").strip()
+            if not question:
+                self._send(400, {"error": "Falta 'question'"})
+                return
+            t0 = time.perf_counter()
+            try:
+                result, coalesced = service.query(question, body.get("period"))
+            except Overloaded as e:
+                self._send(503, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send(500, {"error": f"{type(e).__name__}: {e}"})
+                return
+            if body.get("inline"):
+                from app.artifacts import resolve_refs
+                result = resolve_refs(result)
+            result = dict(result)
+            meta = dict(result.get("_meta") or {})
+            meta["service"] = {"coalesced": coalesced, "latency_ms": round((time.perf_counter() - t0) * 1000, 1)}
+            result["_meta"] = meta
+            self._send(200, result)
+
+        def log_message(self, fmt, *args):  # silencia el log por request de http.server
+            pass
+
+    return Handler
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765, workers: int = SERVICE_WORKERS,
+          max_pending: int = SERVICE_MAX_PENDING, warm: bool = True) -> None:
+    warm_status: Dict[str, Any] = {}
+    if warm:
+        from app.graph_lc import warm_up
+        warm_status = warm_up()
+    service = QueryService(workers=workers, max_pending=max_pending)
+    httpd = _Server((host, port), _make_handler(service, warm_status))
+    print(f"Servicio escuchando en http://{host}:{port} (workers={workers}, max_pending={max_pending})")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.shutdown()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Servicio HTTP/JSON sobre run_query")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    ap.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING)
+    ap.add_argument("--no-warm", action="store_true", help="No precalentar DB/LLM/agentes al arrancar")
+    args = ap.parse_args()
+    serve(args.host, args.port, args.workers, args.max_pending, warm=not args.no_warm)
+
+
+if __name__ == "__main__":
+    main()
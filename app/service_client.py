@@ -0,0 +1,111 @@
+# app/service_client.py
+"""
+Cliente local para `app.service` (sustituto de usuarios reales en pruebas de carga).
+
+Uso:
+    python -m app.service_client "¿Cuál es el DSO?" --period 2025-08
+    python -m app.service_client --load 200 --concurrency 20 --period 2025-08 \
+        "¿Cuál es el DSO?" "Aging de proveedores" "Informe de liquidez"
+"""
+from __future__ import annotations
+
+import json
+import time
+import argparse
+import statistics
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+DEFAULT_URL = "http://127.0.0.1:8765"
+
+
+def query(question: str, period: Optional[str] = None, url: str = DEFAULT_URL,
+          timeout: float = 600.0, inline: bool = False) -> Dict[str, Any]:
+    body = json.dumps({"question": question, "period": period, "inline": inline}).encode("utf-8")
+    req = urllib.request.Request(f"{url}/query", data=body,
+                                 headers={"Content-Type": "application/json"}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return {"error": json.loads(e.read() or b"{}").get("error"), "status": e.code}
+    except (urllib.error.URLError, ConnectionError) as e:
+        return {"error": str(e), "status": None}
+
+
+def artifact(ref: Dict[str, Any], offset: int = 0, limit: Optional[int] = None,
+             url: str = DEFAULT_URL) -> Dict[str, Any]:
+    """Página de filas de una referencia {"$artifact": …, "request_id": …} del resultado."""
+    qs = f"offset={offset}" + (f"&limit={limit}" if limit is not None else "")
+    try:
+        with urllib.request.urlopen(f"{url}/artifacts/{ref['request_id']}/{ref['$artifact']}?{qs}", timeout=60) as resp:
+            return json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return {"error": json.loads(e.read() or b"{}").get("error"), "status": e.code}
+
+
+def health(url: str = DEFAULT_URL) -> Dict[str, Any]:
+    with urllib.request.urlopen(f"{url}/health", timeout=10) as resp:
+        return json.loads(resp.read())
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100.0 * (len(s) - 1))))]
+
+
+def load_test(questions: List[str], total: int, concurrency: int, period: Optional[str] = None,
+              url: str = DEFAULT_URL) -> Dict[str, Any]:
+    """Lanza `total` solicitudes (ciclando `questions`) con `concurrency` clientes simultáneos."""
+    def _one(i: int) -> Dict[str, Any]:
+        t0 = time.perf_counter()
+        out = query(questions[i % len(questions)], period, url)
+        svc = (out.get("_meta") or {}).get("service") or {}
+        return {"latency_s": time.perf_counter() - t0, "ok": "error" not in out,
+                "coalesced": bool(svc.get("coalesced")), "status": out.get("status", 200)}
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as ex:
+        results = list(ex.map(_one, range(total)))
+    wall = time.perf_counter() - t0
+    lat = [r["latency_s"] for r in results]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "ok": sum(r["ok"] for r in results),
+        "rejected_503": sum(r["status"] == 503 for r in results),
+        "coalesced": sum(r["coalesced"] for r in results),
+        "wall_s": round(wall, 2),
+        "req_per_s": round(total / wall, 2) if wall > 0 else None,
+        "latency_s": {
+            "mean": round(statistics.mean(lat), 3) if lat else None,
+            "p50": round(_pct(lat, 50), 3),
+            "p95": round(_pct(lat, 95), 3),
+            "max": round(max(lat), 3) if lat else None,
+        },
+        "server": health(url).get("service"),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Cliente / prueba de carga de app.service")
+    ap.add_argument("questions", nargs="+")
+    ap.add_argument("--period", default=None)
+    ap.add_argument("--url", default=DEFAULT_URL)
+    ap.add_argument("--load", type=int, default=0, help="Número total de solicitudes (activa modo carga)")
+    ap.add_argument("--concurrency", type=int, default=10)
+    args = ap.parse_args()
+
+    if args.load:
+        out = load_test(args.questions, args.load, args.concurrency, args.period, args.url)
+    else:
+        out = query(" ".join(args.questions), args.period, args.url)
+    print(json.dumps(out, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# app/sql_instrumentation.py
+"""
+Instrumentación de SQLAlchemy a nivel de engine.
+
+- Cuenta sentencias y tiempo por *operación lógica* (p. ej. un agente) con `track_queries`.
+- Detecta formas de sentencia repetidas (patrón N+1) normalizando literales/IN-lists.
+- Envía las sentencias lentas a un log dedicado (`app.sql.slow`) con sus parámetros y,
+  opcionalmente, el plan `EXPLAIN (ANALYZE, BUFFERS)` (solo PostgreSQL y solo SELECT).
+
+Configuración (variables de entorno):
+  - SQL_INSTRUMENT      (1/0, por defecto 1)
+  - SQL_SLOW_QUERY_MS   (umbral de lentitud en ms, por defecto 250)
+  - SQL_N1_THRESHOLD    (repeticiones de una misma forma para marcar N+1, por defecto 5)
+  - SQL_EXPLAIN_SLOW    (1 para capturar EXPLAIN ANALYZE de las lentas, por defecto 0)
+
+No importa SQLAlchemy a nivel de módulo: `instrument_engine` lo hace al registrar eventos.
+"""
+from __future__ import annotations
+
+import os
+import re
+import time
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+ENABLED = os.getenv("SQL_INSTRUMENT", "1") != "0"
+SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "250"))
+N1_THRESHOLD = int(os.getenv("SQL_N1_THRESHOLD", "5"))
+EXPLAIN_SLOW = os.getenv("SQL_EXPLAIN_SLOW", "0") == "1"
+
+log = logging.getLogger("app.sql")
+slow_log = logging.getLogger("app.sql.slow")
+
+# -----------------------------
+# Normalización de sentencias
+# -----------------------------
+_RE_IN_LIST = re.compile(r"\bIN\s*\(\s*[^()]*\)", re.IGNORECASE)
+_RE_PARAM = re.compile(r"%\(\w+\)s|%s|\?|:\w+")
+_RE_STRING = re.compile(r"'(?:[^']|'')*'")
+_RE_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_RE_WS = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    """Forma canónica de una sentencia: sin literales, parámetros ni tamaño de IN-lists."""
+    s = _RE_STRING.sub("?", statement or "")
+    s = _RE_PARAM.sub("?", s)
+    s = _RE_NUMBER.sub("?", s)
+    s = _RE_IN_LIST.sub("IN (?)", s)
+    return _RE_WS.sub(" ", s).strip()
+
+# -----------------------------
+# Estadísticas por operación
+# -----------------------------
+@dataclass
+class QueryStats:
+    operation: str
+    statements: int = 0
+    total_ms: float = 0.0
+    shapes: Dict[str, int] = field(default_factory=dict)
+    slow: List[Dict[str, Any]] = field(default_factory=list)
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.statements += 1
+        self.total_ms += elapsed_ms
+        shape = statement_shape(statement)
+        self.shapes[shape] = self.shapes.get(shape, 0) + 1
+
+    def merge(self, other: "QueryStats") -> None:
+        self.statements += other.statements
+        self.total_ms += other.total_ms
+        for shape, n in other.shapes.items():
+            self.shapes[shape] = self.shapes.get(shape, 0) + n
+        self.slow.extend(other.slow)
+
+    def n_plus_one(self, threshold: int | None = None) -> List[Dict[str, Any]]:
+        """Formas repetidas >= threshold veces (sospechosas de N+1)."""
+        th = N1_THRESHOLD if threshold is None else threshold
+        return [
+            {"shape": shape[:300], "count": n}
+            for shape, n in sorted(self.shapes.items(), key=lambda kv: kv[1], reverse=True)
+            if n >= th
+        ]
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "statements": self.statements,
+            "distinct_shapes": len(self.shapes),
+            "total_ms": round(self.total_ms, 2),
+            "n_plus_one": self.n_plus_one(),
+            "slow": list(self.slow),
+        }
+
+_current: ContextVar[Optional[QueryStats]] = ContextVar("sql_query_stats", default=None)
+
+def current_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+@contextmanager
+def track_queries(operation: str) -> Iterator[QueryStats]:
+    """
+    Acumula las sentencias ejecutadas dentro del bloque bajo `operation`.
+    Si hay una operación externa activa, al salir se le suman los totales.
+    """
+    parent = _current.get()
+    stats = QueryStats(operation=operation)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+        suspects = stats.n_plus_one()
+        if suspects:
+            log.warning(
+                "Posible N+1 en '%s': %d sentencias, formas repetidas=%s",
+                operation, stats.statements, [(s["count"], s["shape"][:120]) for s in suspects],
+            )
+        if parent is not None:
+            parent.merge(stats)
+
+# -----------------------------
+# Eventos del engine
+# -----------------------------
+def _explain(conn, statement: str, parameters: Any) -> Optional[str]:
+    if conn.dialect.name != "postgresql" or not statement.lstrip().upper().startswith("SELECT"):
+        return None
+    conn.info["_av_explaining"] = True
+    try:
+        rows = conn.exec_driver_sql("EXPLAIN (ANALYZE, BUFFERS) " + statement, parameters).fetchall()
+        return "\n".join(str(r[0]) for r in rows)
+    except Exception as e:  # nunca romper la consulta original por el EXPLAIN
+        return f"(EXPLAIN falló: {e})"
+    finally:
+        conn.info["_av_explaining"] = False
+
+def _log_slow(conn, statement: str, parameters: Any, elapsed_ms: float, executemany: bool) -> None:
+    entry: Dict[str, Any] = {
+        "elapsed_ms": round(elapsed_ms, 2),
+        "statement": statement,
+        "parameters": parameters,
+    }
+    if EXPLAIN_SLOW and not executemany:
+        entry["explain"] = _explain(conn, statement, parameters)
+    stats = _current.get()
+    if stats is not None:
+        stats.slow.append({"elapsed_ms": entry["elapsed_ms"], "shape": statement_shape(statement)[:300]})
+    slow_log.warning(
+        "SQL lenta (%.1f ms) op=%s\n%s\nparams=%r%s",
+        elapsed_ms,
+        stats.operation if stats else "-",
+        statement,
+        parameters,
+        ("\n" + entry["explain"]) if entry.get("explain") else "",
+    )
+
+def instrument_engine(engine) -> None:
+    """Registra los listeners de conteo/lentitud en `engine` (idempotente)."""
+    from sqlalchemy import event
+
+    if getattr(engine, "_av_instrumented", False):
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_av_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("_av_query_start") or []
+        if not starts:
+            return
+        elapsed_ms = (time.perf_counter() - starts.pop()) * 1000.0
+        if conn.info.get("_av_explaining"):
+            return
+        stats = _current.get()
+        if stats is not None:
+            stats.record(statement, elapsed_ms)
+        if elapsed_ms >= SLOW_QUERY_MS:
+            _log_slow(conn, statement, parameters, elapsed_ms, executemany)
+
+    setattr(engine, "_av_instrumented", True)
@@ -39,12 +39,14 @@ class GlobalState:
     - period_raw: string crudo (e.g., 'YYYY-MM' desde la sidebar) para trazabilidad
     - context: bolsa para compartir artefactos entre agentes
     - trace: acumulador de eventos/resultados
+    - data_version: token de app.data_version al iniciar la solicitud (llave de cachés)
     """
     period: Dict[str, Any] = field(default_factory=_default_period)
     period_raw: Optional[str] = None
     context: Dict[str, Any] = field(default_factory=dict)
     trace: List[Dict[str, Any]] = field(default_factory=list)
     errors: List[str] = field(default_factory=list)
+    data_version: Optional[str] = None
 
     # ---- Utilidades de período (con tolerancia a valores faltantes) ----
     def period_start_dt(self) -> datetime:
@@ -81,6 +83,26 @@ class GlobalState:
     def add_error(self, msg: str) -> None:
         self.errors.append(msg)
 
+    # ---- Sesión (REPL / conversación) ----
+    MAX_HISTORY = 50
+
+    def start_turn(self) -> None:
+        """Nueva pregunta en una sesión persistente: limpia trace/errores, conserva `context`."""
+        self.trace = []
+        self.errors = []
+
+    def remember(self, question: str, result: Dict[str, Any]) -> None:
+        """Guarda un resumen compacto de la respuesta en context['history'] (memoria de sesión)."""
+        exec_pack = ((result or {}).get("gerente") or {}).get("executive_decision_bsc") or {}
+        history = self.context.setdefault("history", [])
+        history.append({
+            "question": question,
+            "period": ((result or {}).get("_meta") or {}).get("period_resolved") or self.period,
+            "metrics": (result or {}).get("metrics"),
+            "resumen_ejecutivo": exec_pack.get("resumen_ejecutivo"),
+        })
+        del history[: -self.MAX_HISTORY]
+
     # ---- Helper general ----
     def set_period(self, period_dict: Dict[str, Any]) -> None:
         """
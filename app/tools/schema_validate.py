@@ -1,6 +1,7 @@
-import json, jsonschema
+import json
 from pathlib import Path
 
 def validate_with(schema_path: str, payload: dict) -> None:
+    import jsonschema  # import tardío: solo cuando se valida
     schema = json.loads(Path(schema_path).read_text(encoding="utf-8"))
     jsonschema.validate(payload, schema)
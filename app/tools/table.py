@@ -0,0 +1,152 @@
+# app/tools/table.py
+"""
+Tabla columnar mínima para los resultados de los agentes.
+
+Las tablas de detalle (list_open, due_soon, by_customer…) son listas de dicts: cada fila repite
+todas las llaves, en memoria y en el JSON. `Table` guarda una columna por llave (array tipado
+para números, textos repetidos compartidos) y viaja como:
+
+    {"$table": "columnar", "columns": ["id", "customer", ...], "rows": 4210,
+     "data": {"id": [...], "customer": [...], ...}}
+
+Los agentes emiten con `emit_table(rows)`, que respeta TABLE_FORMAT:
+  - "rows"      (por defecto) lista de dicts, compatible con consumidores previos
+  - "columnar"  payload columnar de arriba
+Los consumidores (UI, contable, gerente, artefactos) leen con `rows_of`, `slice_rows` y
+`table_len`, que aceptan ambos formatos. `Table.to_arrow()` / `to_pandas()` son opcionales.
+"""
+from __future__ import annotations
+
+import os
+from array import array
+from typing import Any, Dict, Iterator, List, Optional
+
+TABLE_FORMAT = os.getenv("TABLE_FORMAT", "rows").strip().lower()
+TABLE_KEY = "$table"
+
+
+def _compact_column(values: list):
+    """
+    Columnas homogéneas sin nulos → array tipado ('q' enteros, 'd' floats: 8 bytes por valor
+    en vez de un objeto por fila); textos repetidos (cliente, status…) comparten un solo objeto.
+    """
+    if values and all(type(v) is int for v in values):
+        try:
+            return array("q", values)
+        except OverflowError:
+            return values
+    if values and all(type(v) is float for v in values):
+        return array("d", values)
+    if any(type(v) is str for v in values):
+        pool: Dict[str, str] = {}
+        return [pool.setdefault(v, v) if type(v) is str else v for v in values]
+    return values
+
+
+class Table:
+    __slots__ = ("columns", "data", "n")
+
+    def __init__(self, columns: List[str], data: Dict[str, list], n: Optional[int] = None):
+        self.columns = columns
+        self.data = data
+        self.n = n if n is not None else (len(data[columns[0]]) if columns else 0)
+
+    # ---- Construcción ----
+    @classmethod
+    def from_rows(cls, rows: List[Dict[str, Any]]) -> "Table":
+        columns: List[str] = []
+        for r in rows[:1]:
+            columns = list(r.keys())
+        extra = {k for r in rows for k in r} - set(columns)  # filas heterogéneas: se agregan al final
+        columns += sorted(extra)
+        data = {c: _compact_column([r.get(c) for r in rows]) for c in columns}
+        return cls(columns, data, len(rows))
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "Table":
+        return cls(list(payload["columns"]), payload["data"], int(payload.get("rows", 0)))
+
+    @classmethod
+    def from_any(cls, obj: Any) -> "Table":
+        if isinstance(obj, Table):
+            return obj
+        if is_table(obj):
+            return cls.from_payload(obj)
+        return cls.from_rows(list(obj or []))
+
+    # ---- Acceso ----
+    def __len__(self) -> int:
+        return self.n
+
+    def column(self, name: str) -> list:
+        return self.data[name]
+
+    def slice(self, offset: int = 0, end: Optional[int] = None) -> "Table":
+        return Table(self.columns, {c: v[offset:end] for c, v in self.data.items()})
+
+    def iter_rows(self) -> Iterator[Dict[str, Any]]:
+        cols = [self.data[c] for c in self.columns]
+        for vals in zip(*cols):
+            yield dict(zip(self.columns, vals))
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        return list(self.iter_rows())
+
+    def totals(self) -> Dict[str, float]:
+        """Suma de columnas numéricas (excluye identificadores)."""
+        out: Dict[str, float] = {}
+        for c in self.columns:
+            if c == "id" or c.endswith("_id"):
+                continue
+            vals = [v for v in self.data[c] if v is not None]
+            if vals and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in vals):
+                out[c] = round(float(sum(vals)), 2)
+        return out
+
+    # ---- Salidas ----
+    def to_payload(self) -> Dict[str, Any]:
+        return {TABLE_KEY: "columnar", "columns": self.columns, "rows": self.n, "data": self.data}
+
+    def to_jsonable_payload(self) -> Dict[str, Any]:
+        data = {c: (v.tolist() if isinstance(v, array) else v) for c, v in self.data.items()}
+        return {TABLE_KEY: "columnar", "columns": self.columns, "rows": self.n, "data": data}
+
+    def to_pandas(self):
+        import pandas as pd
+        return pd.DataFrame({c: list(v) if isinstance(v, array) else v for c, v in self.data.items()},
+                            columns=self.columns)
+
+    def to_arrow(self):
+        import pyarrow as pa
+        return pa.table({c: list(self.data[c]) for c in self.columns})
+
+
+def is_table(obj: Any) -> bool:
+    return isinstance(obj, dict) and obj.get(TABLE_KEY) == "columnar"
+
+def emit_table(rows: List[Dict[str, Any]], fmt: Optional[str] = None) -> Any:
+    """Salida de un agente: lista de dicts o payload columnar según TABLE_FORMAT."""
+    if (fmt or TABLE_FORMAT) == "columnar":
+        return Table.from_rows(rows).to_payload()
+    return rows
+
+def rows_of(obj: Any) -> List[Dict[str, Any]]:
+    """Filas como lista de dicts, venga la tabla como lista, payload columnar o Table."""
+    if isinstance(obj, Table):
+        return obj.to_rows()
+    if is_table(obj):
+        return Table.from_payload(obj).to_rows()
+    return list(obj or [])
+
+def slice_rows(obj: Any, offset: int = 0, end: Optional[int] = None) -> List[Dict[str, Any]]:
+    """Solo las filas [offset, end) sin materializar el resto."""
+    if isinstance(obj, Table) or is_table(obj):
+        return Table.from_any(obj).slice(offset, end).to_rows()
+    return list((obj or [])[offset:end])
+
+def table_len(obj: Any) -> int:
+    if isinstance(obj, Table):
+        return obj.n
+    if is_table(obj):
+        return int(obj.get("rows", 0))
+    return len(obj or [])
@@ -2,7 +2,6 @@
 import re
 import unicodedata
 from datetime import datetime
-from dateutil.relativedelta import relativedelta
 
 def _normalize_es(text: str) -> str:
     text = text.lower().strip()
@@ -45,6 +44,7 @@ def extract_period_es(question: str, now: datetime | None = None) -> str:
     if re.search(r"\beste\s+mes\b", q):
         return now.strftime("%Y-%m")
     if re.search(r"\b(mes\s+pasado|mes\s+anterior)\b", q):
+        from dateutil.relativedelta import relativedelta  # import tardío (arranque rápido)
         d = now - relativedelta(months=1)
         return d.strftime("%Y-%m")
 
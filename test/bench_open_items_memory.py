@@ -0,0 +1,77 @@
+# test/bench_open_items_memory.py  (ejecútalo con `python test/bench_open_items_memory.py`)
+# Bytes por factura abierta: instancia ORM + Decimal + dict (antes) vs OpenItem (app.ledger.items).
+# Usa una SQLite en memoria con el esquema real de app.models y N facturas sintéticas (BENCH_N).
+import os, sys, gc, random, tracemalloc
+from datetime import datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "app")]  # app.models importa `database` como módulo raíz
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models as M
+from app.ledger.items import load_open_items
+
+N = int(os.getenv("BENCH_N", "20000"))
+
+def seed(Session) -> None:
+    rnd = random.Random(7)
+    base = datetime(2025, 1, 1)
+    with Session() as db:
+        db.add_all([M.Entidad(id_entidad=i, nombre_legal=f"Cliente {i}") for i in range(1, 301)])
+        for i in range(1, N + 1):
+            monto = Decimal(rnd.randint(10_000, 5_000_000)) / 100
+            emision = base + timedelta(days=rnd.randint(0, 240))
+            db.add(M.FacturaCXC(
+                id_cxc=i, numero_factura=f"F-{i:07d}", fecha_emision=emision,
+                fecha_limite=emision + timedelta(days=30), monto=monto,
+                monto_pagado=(monto / 3).quantize(Decimal("0.01")), id_entidad_cliente=rnd.randint(1, 300),
+            ))
+        db.commit()
+
+def measure(fn):
+    gc.collect()
+    tracemalloc.start()
+    keep = fn()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return keep, current, peak
+
+def before(Session):
+    """Camino anterior: ORM completo (relaciones selectin incluidas) → Decimal → dict por fila."""
+    db = Session()
+    facturas = db.query(M.FacturaCXC).all()
+    rows = []
+    for f in facturas:
+        saldo = Decimal((f.monto or 0) - (f.monto_pagado or 0))
+        rows.append({"invoice_id": f.numero_factura, "due_date": f.fecha_limite.date(),
+                     "customer_id": f.id_entidad_cliente, "outstanding": saldo})
+    return db, facturas, rows
+
+def after(Session):
+    db = Session()
+    return db, load_open_items("cxc", db=db)
+
+def main() -> int:
+    engine = create_engine("sqlite://", execution_options={"schema_translate_map": {M.DB_SCHEMA: None}})
+    M.Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine, future=True)
+    seed(Session)
+
+    keep_b, cur_b, peak_b = measure(lambda: before(Session))
+    keep_b[0].close(); del keep_b
+    keep_a, cur_a, peak_a = measure(lambda: after(Session))
+    n_items = len(keep_a[1])
+    keep_a[0].close()
+
+    print(f"Facturas abiertas: {n_items:,}")
+    print(f"  antes  (ORM+Decimal+dict): {cur_b / N:8.0f} B/factura retenidos, pico {peak_b / N:8.0f} B/factura")
+    print(f"  después (OpenItem)       : {cur_a / N:8.0f} B/factura retenidos, pico {peak_a / N:8.0f} B/factura")
+    print(f"  reducción: {cur_b / max(cur_a, 1):.1f}x retenido, {peak_b / max(peak_a, 1):.1f}x pico")
+    return 0 if cur_a < cur_b else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
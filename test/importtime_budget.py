@@ -0,0 +1,45 @@
+# test/importtime_budget.py  (ejecútalo con `python test/importtime_budget.py`)
+# Verifica el costo de arranque de la CLI (`python -m app.main`) usando `-X importtime`:
+#   - tiempo acumulado de import del módulo de entrada <= IMPORT_BUDGET_MS
+#   - ningún módulo pesado (pandas, langchain, SQLAlchemy, ...) se carga solo por importar
+import os, re, subprocess, sys
+from pathlib import Path
+
+ENTRY = os.getenv("IMPORT_ENTRY", "app.main")
+BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "300"))
+HEAVY = ("pandas", "numpy", "dateutil", "langchain", "langchain_core", "langchain_openai",
+         "openai", "sqlalchemy", "psycopg", "jsonschema", "streamlit", "pyarrow")
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def measure(entry: str = ENTRY):
+    root = Path(__file__).resolve().parent.parent
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {entry}"],
+                          cwd=root, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise SystemExit(f"❌ Falló 'import {entry}':\n{proc.stderr[-2000:]}")
+    cumulative_us, modules = None, []
+    for line in proc.stderr.splitlines():
+        m = _LINE.match(line)
+        if not m:
+            continue
+        modules.append(m.group(4))
+        if m.group(4) == entry:
+            cumulative_us = int(m.group(2))
+    return (cumulative_us or 0) / 1000.0, modules
+
+def main() -> int:
+    ms, modules = measure()
+    heavy = sorted({m for m in modules if m.split(".")[0] in HEAVY})
+    print(f"⏱️  import {ENTRY}: {ms:.1f} ms (presupuesto {BUDGET_MS:.0f} ms), {len(modules)} módulos")
+    ok = True
+    if ms > BUDGET_MS:
+        print("❌ Se excedió el presupuesto de arranque."); ok = False
+    if heavy:
+        print("❌ Módulos pesados cargados al arrancar:", ", ".join(heavy[:20])); ok = False
+    if ok:
+        print("✅ Arranque dentro del presupuesto y sin imports pesados.")
+    return 0 if ok else 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,259 @@
+# test/smoke_ledger.py  (ejecútalo con `python test/smoke_ledger.py`)
+# Estructuras incrementales del libro contra fuerza bruta, sobre una SQLite en memoria con el
+# esquema real de app.models. Se siembra un libro, se construye cada estructura, se agregan
+# facturas y pagos nuevos (el caso que refrescan por diferencia) y se compara contra un
+# recorrido en Python de las mismas facturas y pagos:
+#   - caché de partidas (app.ledger.cache): refresco incremental == carga completa
+#   - línea de saldos (app.ledger.balances): saldo, aging y promedio por día
+#   - calendario de vencimientos (app.ledger.due_calendar): `apply` == reconstrucción
+#   - índice de emisión (app.ledger.issued_index): refresco incremental, total y por entidad
+#   - períodos comparativos (app.dates.period_resolver.comparison_periods)
+# Sale con 1 si algún chequeo falla.
+import os, sys, random
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+os.environ.setdefault("DATA_VERSION_CHECK_S", "0")  # cada lectura ve la marca de agua actual
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path[:0] = [str(ROOT), str(ROOT / "app")]  # app.models importa `database` como módulo raíz
+
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models as M
+from app.dates.period_resolver import comparison_periods, resolve_period, wants_comparison
+from app.ledger import kernel as K
+from app.ledger.balances import load_timeline, timeline
+from app.ledger.cache import OpenItemsCache, read_watermark
+from app.ledger.due_calendar import DueCalendar
+from app.ledger.issued_index import IssuedIndex
+from app.ledger.items import AGING_KEYS, open_items_query
+
+N = int(os.getenv("SMOKE_N", "800"))
+N_NEW = int(os.getenv("SMOKE_N_NEW", "150"))
+BASE = datetime(2025, 1, 1)
+DAYS = [date(2025, 2, 14), date(2025, 5, 31), date(2025, 9, 30), date(2026, 1, 15)]
+
+FAILS: list = []
+
+def check(ok: bool, label: str) -> None:
+    print(("  ok   " if ok else "  FAIL ") + label)
+    if not ok:
+        FAILS.append(label)
+
+# -----------------------------
+# Libro sintético + verdad en Python
+# -----------------------------
+class Truth:
+    """id → [monto¢, emisión, límite, entidad, [(fecha, ¢)] pagos con detalle, pagado¢, fecha_pago]."""
+    def __init__(self):
+        self.inv = {}
+        self.pay_id = 0
+
+    def events(self, i):
+        amount, _, _, _, pays, paid, fp = self.inv[i]
+        residual = paid - sum(c for _, c in pays)
+        return pays + ([(fp or self.inv[i][1], residual)] if residual > 0 else [])
+
+    def balance_at(self, day: date):
+        """[(saldo¢, límite)] de las facturas emitidas hasta `day`."""
+        return [(v[0] - sum(c for f, c in self.events(i) if f <= day), v[2])
+                for i, v in self.inv.items() if v[1] <= day]
+
+    def aging_at(self, day: date):
+        out = {"overdue": {k: 0 for k in AGING_KEYS}, "current": 0, "no_due": 0, "open_count": 0}
+        for bal, due in self.balance_at(day):
+            if bal <= 0:
+                continue
+            out["open_count"] += 1
+            late = (day - due).days
+            if late < 1:
+                out["current"] += bal
+            else:
+                out["overdue"][AGING_KEYS[min(3, (late - 1) // 30)]] += bal
+        return out
+
+    def issued(self, d0: date, d1: date, entity=None):
+        rows = [v for v in self.inv.values() if d0 <= v[1] <= d1 and (entity is None or v[3] == entity)]
+        return sum(v[0] for v in rows), len(rows)
+
+def _pay(db, truth: Truth, rnd: random.Random, i: int, inv) -> None:
+    """Uno o dos pagos nuevos sobre la factura `i` (actualiza monto_pagado como la carga real)."""
+    amount, issued, _, _, pays, paid, _ = truth.inv[i]
+    for _ in range(rnd.randint(1, 2)):
+        left = amount - paid
+        cents = left if rnd.random() < 0.4 else left // 2
+        if cents <= 0:
+            break
+        when = issued + timedelta(days=rnd.randint(0, 90))
+        truth.pay_id += 1
+        db.add(M.PagoCXC(id_pago_cxc=truth.pay_id, id_cxc=i, fecha=datetime.combine(when, datetime.min.time()),
+                         monto=Decimal(cents).scaleb(-2)))
+        pays.append((when, cents))
+        paid += cents
+    truth.inv[i][5] = paid
+    inv.monto_pagado = Decimal(paid).scaleb(-2)
+
+def seed(db, truth: Truth, rnd: random.Random, first: int, n: int) -> None:
+    for i in range(first, first + n):
+        amount = rnd.randint(10_000, 2_000_000)
+        issued = BASE + timedelta(days=rnd.randint(0, 330), hours=rnd.randint(0, 23))
+        due = issued + timedelta(days=rnd.choice((15, 30, 60)))
+        entity = rnd.randint(1, 12)
+        # 10 % con monto_pagado sin detalle de pago (se registra en fecha_pago)
+        unbacked = rnd.randint(0, amount) if rnd.random() < 0.1 else 0
+        fp = (issued + timedelta(days=20)) if unbacked else None
+        inv = M.FacturaCXC(id_cxc=i, numero_factura=f"C-{i:05d}", fecha_emision=issued, fecha_limite=due,
+                           fecha_pago=fp, monto=Decimal(amount).scaleb(-2), monto_pagado=Decimal(unbacked).scaleb(-2),
+                           id_entidad_cliente=entity)
+        db.add(inv)
+        truth.inv[i] = [amount, issued.date(), due.date(), entity, [], unbacked, fp.date() if fp else None]
+        if unbacked == 0 and rnd.random() < 0.6:
+            _pay(db, truth, rnd, i, inv)
+
+def grow(db, truth: Truth, rnd: random.Random) -> None:
+    """Facturas nuevas (ids mayores) + pagos nuevos sobre facturas ya cargadas."""
+    old = [i for i, v in truth.inv.items() if v[0] > v[5]]
+    seed(db, truth, rnd, max(truth.inv) + 1, N_NEW)
+    for i in rnd.sample(old, min(len(old), N_NEW)):
+        _pay(db, truth, rnd, i, db.get(M.FacturaCXC, i))
+
+# -----------------------------
+# Chequeos
+# -----------------------------
+def same_ledger(a: K.LedgerArrays, b: K.LedgerArrays) -> bool:
+    cols = ("ids", "entity_ids", "amount_cents", "paid_cents", "due_ord", "issue_ord")
+    return len(a) == len(b) and all(np.array_equal(getattr(a, c), getattr(b, c)) for c in cols)
+
+def same_calendar(a: DueCalendar, b: DueCalendar) -> bool:
+    return (np.array_equal(a.days, b.days) and np.array_equal(a.cents, b.cents)
+            and np.array_equal(a.counts, b.counts)
+            and (a.no_due_cents, a.no_due_count) == (b.no_due_cents, b.no_due_count))
+
+def check_timeline(tl, truth: Truth, label: str) -> None:
+    check(all(tl.outstanding_at(d) == sum(b for b, _ in truth.balance_at(d)) for d in DAYS), f"{label}: saldo por día")
+    check(all(tl.aging_at(d) == truth.aging_at(d) for d in DAYS), f"{label}: aging por día")
+    d0, d1 = date(2025, 4, 1), date(2025, 4, 30)
+    brute = sum(sum(b for b, _ in truth.balance_at(d0 + timedelta(days=k))) for k in range(30))
+    check(tl.average_outstanding(d0, d1) == Decimal(brute) / 30, f"{label}: saldo promedio de abril")
+
+def check_index(idx: IssuedIndex, truth: Truth, rnd: random.Random, label: str) -> None:
+    windows = [(date(2025, 1, 1), date(2025, 12, 31)), (date(2025, 10, 5), date(2025, 10, 20))]
+    for _ in range(20):
+        d0 = date(2025, 1, 1) + timedelta(days=rnd.randint(0, 340))
+        windows.append((d0, d0 + timedelta(days=rnd.randint(0, 60))))
+    if idx.by is None:
+        ok = all(idx.total(d0, d1) == truth.issued(d0, d1) for d0, d1 in windows)
+    else:
+        ok = all(idx.total(d0, d1, key=e) == truth.issued(d0, d1, e) for d0, d1 in windows for e in range(1, 13))
+    check(ok, label)
+
+def check_ledger(Session) -> None:
+    rnd = random.Random(7)
+    truth = Truth()
+    with Session() as db:
+        seed(db, truth, rnd, 1, N)
+        db.commit()
+
+    cache = OpenItemsCache(check_s=0)
+    idx, idx_ent = IssuedIndex("cxc"), IssuedIndex("cxc", by="entity")
+    with Session() as s:
+        cache.get("cxc", db=s)
+        cals = {e: cache.calendar("cxc", db=s, entity_id=e) for e in (None, 3)}
+        tl0 = timeline("cxc", db=s)
+        check_timeline(tl0, truth, "línea de saldos (carga completa)")
+        wm = read_watermark("cxc", s)[:2]
+        check(idx.refresh(s, wm) == "full" and idx_ent.refresh(s, wm) == "full", "índice de emisión: carga completa")
+        check_index(idx, truth, rnd, "índice de emisión: totales por ventana")
+
+    with Session() as db:
+        grow(db, truth, rnd)
+        db.commit()
+
+    print(f"Facturas: {len(truth.inv):,} ({N_NEW} nuevas, {N_NEW} con pagos nuevos)")
+    with Session() as s:
+        full = K.LedgerArrays.from_rows(s.execute(open_items_query("cxc"))).sorted_by_id()
+        L = cache.get("cxc", db=s)
+        check(cache.stats()["incremental"] == 1, "caché de partidas: refresco incremental")
+        check(same_ledger(L, full), "caché de partidas: incremental == carga completa")
+        today = date.today()
+        check(K.aging_totals(L, today) == truth.aging_at(today), "caché de partidas: aging de hoy == fuerza bruta")
+
+        for e, before in cals.items():
+            after = cache.calendar("cxc", db=s, entity_id=e)
+            check(after is not before and same_calendar(after, DueCalendar.from_ledger(full, e)),
+                  f"calendario (entidad={e}): apply == reconstrucción")
+            check(all(after.aging(d) == K.aging_totals(full if e is None else full.take(np.flatnonzero(full.entity_ids == e)), d)
+                      for d in DAYS), f"calendario (entidad={e}): aging == kernel")
+
+        tl1 = timeline("cxc", db=s)
+        check(tl1 is not tl0, "línea de saldos: se refresca con la marca nueva")
+        check_timeline(tl1, truth, "línea de saldos (incremental)")
+        ref = load_timeline("cxc", db=s)
+        check(all(tl1.aging_at(d) == ref.aging_at(d) for d in DAYS), "línea de saldos: incremental == carga completa")
+
+        wm = read_watermark("cxc", s)[:2]
+        check(idx.refresh(s, wm) == "incremental" and idx_ent.refresh(s, wm) == "incremental",
+              "índice de emisión: refresco incremental")
+        check_index(idx, truth, rnd, "índice de emisión: totales tras el refresco")
+        check_index(idx_ent, truth, rnd, "índice de emisión: totales por entidad tras el refresco")
+
+# -----------------------------
+# Períodos comparativos
+# -----------------------------
+def _span(p):
+    return p["start"].date(), p["end"].date()
+
+def _quarter(y: int, q: int):
+    """(inicio, fin) del trimestre q (0-3) de y, normalizando q fuera de rango."""
+    y, q = y + q // 4, q % 4
+    return date(y, 3 * q + 1, 1), date(y + (q == 3), (3 * q + 4) % 12 or 12, 1) - timedelta(days=1)
+
+def _last_quarter_case(today: date):
+    """'último trimestre' = trimestre calendario cerrado; anterior = el previo; año anterior."""
+    q = (today.month - 1) // 3 - 1
+    cur = _quarter(today.year, q)
+    return cur, _quarter(today.year, q - 1), _quarter(today.year - 1, q)
+
+def check_periods() -> None:
+    cases = [
+        # pregunta → (actual, anterior, año anterior o None)
+        ("compara julio vs agosto 2025",
+         ((date(2025, 8, 1), date(2025, 8, 31)), (date(2025, 7, 1), date(2025, 7, 31)), None)),
+        ("DSO de febrero 2024 y enero 2024",
+         ((date(2024, 2, 1), date(2024, 2, 29)), (date(2024, 1, 1), date(2024, 1, 31)), None)),
+        ("DSO de marzo 2024 vs año pasado",
+         ((date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 2, 1), date(2024, 2, 29)), (date(2023, 3, 1), date(2023, 3, 31)))),
+        ("q1 2025 versus el trimestre anterior",
+         ((date(2025, 1, 1), date(2025, 3, 31)), (date(2024, 10, 1), date(2024, 12, 31)), (date(2024, 1, 1), date(2024, 3, 31)))),
+        ("aging del 5 al 20 de octubre de 2025 frente a la quincena anterior",
+         ((date(2025, 10, 5), date(2025, 10, 20)), (date(2025, 9, 19), date(2025, 10, 4)), (date(2024, 10, 5), date(2024, 10, 20)))),
+        ("DSO de marzo 2024 frente al año pasado",
+         ((date(2024, 3, 1), date(2024, 3, 31)), (date(2024, 2, 1), date(2024, 2, 29)), (date(2023, 3, 1), date(2023, 3, 31)))),
+        ("tendencia del último trimestre", _last_quarter_case(date.today())),
+    ]
+    for q, (cur, prev, last_year) in cases:
+        pr = resolve_period(q)
+        current, others = comparison_periods(q, pr)
+        got = (_span(current), _span(others["previous"]), _span(others["last_year"]) if "last_year" in others else None)
+        check(wants_comparison(q) and got == (cur, prev, last_year), f"comparación: {q!r}")
+    # "tendencia"/"evolución" sin ventana no comparan; con ventana sí (casos de arriba)
+    for q in ("DSO del mes anterior", "tendencia del DSO", "evolución de la cartera", "variación de ventas respecto a julio"):
+        check(not wants_comparison(q), f"sin comparación: {q!r}")
+    pr = resolve_period("DSO del mes anterior")
+    check(pr["source"] == "nlp" and pr["granularity"] == "month", "'mes anterior' se resuelve como período")
+
+
+def main() -> int:
+    engine = create_engine("sqlite://", execution_options={"schema_translate_map": {"agente_virtual": None}})
+    M.Base.metadata.create_all(engine)
+    check_ledger(sessionmaker(bind=engine, future=True))
+    check_periods()
+    print("✅ Todo coincide." if not FAILS else f"❌ {len(FAILS)} chequeo(s) fallaron.")
+    return 1 if FAILS else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())